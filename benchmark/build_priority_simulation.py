@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import heapq
+import imp
+import os
+import random
+
+here = os.path.dirname(os.path.abspath(__file__))
+build_priority = imp.load_source(
+    'build_priority',
+    os.path.sep.join([here, '..', 'src', 'master', 'build_priority.py'])
+)
+
+
+def main(platforms, total_chunks, workers, noise, trials, seed):
+    '''Simulate the execution of the chunks of several platforms' runs on a
+    shared pool of workers, and report the time at which each run completes
+    (and so may be uploaded) under each prioritization policy. "arbitrary"
+    chooses a pending chunk at random and "fifo" chooses the chunk which was
+    requested first (Buildbot's default). The chunks of every run are
+    requested together, platform by platform, and the expected duration of
+    each chunk differs from its actual duration by up to `noise`.'''
+    rng = random.Random(seed)
+    policies = ['arbitrary', 'fifo', 'shortest-remaining', 'oldest-revision']
+    totals = dict((policy, [0.0] * platforms) for policy in policies)
+
+    for _ in range(trials):
+        runs = []
+
+        for platform in range(platforms):
+            # Platforms differ in their overall speed (e.g. remote browsers
+            # are slower) and chunks vary within each platform.
+            speed = rng.uniform(0.5, 2.0)
+            runs.append([
+                speed * rng.paretovariate(3) * 600
+                for _ in range(total_chunks)
+            ])
+
+        requests = []
+
+        for platform, durations in enumerate(runs):
+            for chunk, duration in enumerate(durations, 1):
+                expected = duration * rng.uniform(1 - noise, 1 + noise)
+                requests.append(build_priority.Candidate(
+                    request=(platform, duration),
+                    run=platform,
+                    submitted_at=len(requests),
+                    chunk=chunk,
+                    chunks=1,
+                    total_chunks=total_chunks,
+                    duration=expected / (sum(durations) / total_chunks)
+                ))
+
+        for policy in policies:
+            completed = simulate(list(requests), workers, policy,
+                                 random.Random(rng.random()))
+
+            for platform, time in enumerate(sorted(completed)):
+                totals[policy][platform] += time
+
+    print 'Time until the n-th run completes (minutes, mean of %s trials)' % (
+        trials
+    )
+    print '%-20s' % 'policy' + ''.join(
+        '%8s' % ('n=%s' % (index + 1)) for index in range(platforms)
+    ) + '%8s' % 'mean'
+
+    for policy in policies:
+        times = [total / trials / 60 for total in totals[policy]]
+        print '%-20s' % policy + ''.join(
+            '%8.0f' % time for time in times
+        ) + '%8.0f' % (sum(times) / len(times))
+
+
+def simulate(pending, workers, policy, rng):
+    '''Returns the time at which each run completed.'''
+    now = 0
+    running = []
+    completed = {}
+    remaining = {}
+
+    for candidate in pending:
+        remaining[candidate.run] = remaining.get(candidate.run, 0) + 1
+
+    while pending or running:
+        while pending and len(running) < workers:
+            if policy == 'arbitrary':
+                candidate = rng.choice(pending)
+            elif policy == 'fifo':
+                candidate = min(pending, key=lambda c: c.submitted_at)
+            else:
+                candidate = build_priority.choose(pending, policy)
+
+            pending.remove(candidate)
+            run, duration = candidate.request
+            heapq.heappush(running, (now + duration, run))
+
+        now, run = heapq.heappop(running)
+        remaining[run] -= 1
+
+        if remaining[run] == 0:
+            completed[run] = now
+
+    return completed.values()
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--platforms', type=int, default=6)
+parser.add_argument('--total-chunks', type=int, default=20)
+parser.add_argument('--workers', type=int, default=12)
+parser.add_argument('--noise', type=float, default=0.2,
+                    help='maximum relative error of expected durations')
+parser.add_argument('--trials', type=int, default=20)
+parser.add_argument('--seed', type=int, default=0)
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import hashlib
+import imp
+import os
+import random
+
+here = os.path.dirname(os.path.abspath(__file__))
+duration_history = imp.load_source(
+    'duration_history',
+    os.path.sep.join([here, '..', 'src', 'scripts', 'duration-history.py'])
+)
+
+
+def main(tests, directories, total_chunks, new_tests, noise, seed):
+    '''Compare the makespan (the duration of the longest chunk) of a
+    synthetic test run when tests are divided between chunks by hashing their
+    paths, as the WPT CLI does, with the makespan when the chunks are planned
+    from the durations of a previous run. Test durations vary widely between
+    directories (a few directories contain many slow tests), durations differ
+    randomly between runs by up to `noise`, and a proportion of the tests in
+    the measured run (`new_tests`) have no recorded duration.'''
+    rng = random.Random(seed)
+    # The typical duration of the tests in each directory (in milliseconds)
+    # follows a heavy-tailed distribution.
+    directory_durations = [
+        ('/dir-%s/sub-%s/' % (index, rng.randint(0, 3)),
+         int(rng.paretovariate(1.2) * 300))
+        for index in range(directories)
+    ]
+    previous = {}
+
+    for index in range(tests):
+        directory, typical = rng.choice(directory_durations)
+        previous['%stest-%s.html' % (directory, index)] = rng.randint(
+            typical // 2, typical * 2
+        )
+
+    current = dict(
+        (test, int(duration * rng.uniform(1 - noise, 1 + noise)))
+        for test, duration in previous.items()
+    )
+
+    for index in range(int(tests * new_tests)):
+        directory, typical = rng.choice(directory_durations)
+        current['%snew-test-%s.html' % (directory, index)] = typical
+
+    print '%8s %16s %16s %16s %10s' % (
+        'chunks', 'ideal (s)', 'hashed (s)', 'planned (s)', 'reduction'
+    )
+
+    for chunks in total_chunks:
+        plan = duration_history.plan_chunks(previous, chunks)
+        ideal = sum(current.values()) / float(chunks)
+        hashed = makespan(current, chunks, hash_chunk)
+        planned = makespan(current, chunks,
+                           lambda test, chunks: plan_chunk(plan, test))
+
+        print '%8s %16.0f %16.0f %16.0f %9.1f%%' % (
+            chunks, ideal / 1000, hashed / 1000.0, planned / 1000.0,
+            (1 - planned / float(hashed)) * 100
+        )
+
+
+def hash_chunk(test, chunks):
+    return int(hashlib.md5(test).hexdigest(), 16) % chunks
+
+
+def plan_chunk(plan, test):
+    for index, chunk in enumerate(plan['chunks']):
+        if any(test.startswith(path) for path in chunk['tests']):
+            return index
+
+    return plan['remainder'] - 1
+
+
+def makespan(durations, chunks, assign):
+    totals = [0] * chunks
+
+    for test, duration in durations.items():
+        totals[assign(test, chunks)] += duration
+
+    return max(totals)
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--tests', type=int, default=40000)
+parser.add_argument('--directories', type=int, default=1500)
+parser.add_argument('--total-chunks', type=int, nargs='+',
+                    default=[20, 100])
+parser.add_argument('--new-tests', type=float, default=0.02,
+                    help='proportion of tests without a recorded duration')
+parser.add_argument('--noise', type=float, default=0.2,
+                    help='maximum relative change of each test\'s duration '
+                         'between runs')
+parser.add_argument('--seed', type=int, default=0)
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.sep.join([here, '..', 'src', 'scripts']))
+
+import wpt_data  # noqa: E402
+from log_raw import LogRawReader  # noqa: E402
+
+
+def main(tests, subtests, message_size, preamble_lines, repeat):
+    '''Compare the time required to query a large, synthetic raw log by
+    decoding every line with the time required by `LogRawReader` (with and
+    without an index). `preamble_lines` log messages precede the start of the
+    suite, as in logs which include the output of browser installation.'''
+
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        log_raw = os.path.join(temp_dir, 'log-raw.txt')
+        chunk = next(wpt_data.generate_chunks(1, tests, subtests,
+                                              message_size))
+
+        with open(log_raw, 'w') as handle:
+            for index in range(preamble_lines):
+                handle.write('%s\n' % json.dumps({
+                    'action': 'log',
+                    'level': 'INFO',
+                    'message': 'Preparing test environment (%s)' % index
+                }))
+
+            for event in chunk.log_raw():
+                handle.write('%s\n' % json.dumps(event))
+
+        print 'Log size: %.1f MB' % (os.path.getsize(log_raw) / 1024.0 / 1024)
+        print '%-14s %12s %12s %12s %8s' % (
+            'query', 'linear (s)', 'mmap (s)', 'indexed (s)', 'speedup'
+        )
+
+        for name, actions in (('suite_start', ['suite_start']),
+                              ('test_end', ['test_end']),
+                              ('test_start/end', ['test_start', 'test_end'])):
+            linear, expected = measure(repeat, scan_linear, log_raw, actions)
+            scanned, actual = measure(repeat, scan_mmap, log_raw, actions)
+            assert actual == expected
+
+            with LogRawReader(log_raw) as reader:
+                reader.build_index(actions)
+                indexed, actual = measure(
+                    repeat, lambda *args: list(reader.events(actions))
+                )
+                assert actual == expected
+
+            print '%-14s %12.3f %12.3f %12.3f %7.1fx' % (
+                name, linear, scanned, indexed, linear / scanned
+            )
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def measure(repeat, function, *args):
+    '''Return the shortest wall time of several invocations of a function,
+    along with its return value.'''
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.time()
+        value = function(*args)
+        best = min(best, time.time() - start)
+
+    return best, value
+
+
+def scan_linear(log_raw, actions):
+    events = []
+
+    with open(log_raw) as handle:
+        for line in handle:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+
+            if event.get('action') in actions:
+                events.append(event)
+
+                if actions == ['suite_start']:
+                    break
+
+    return events
+
+
+def scan_mmap(log_raw, actions):
+    with LogRawReader(log_raw) as reader:
+        if actions == ['suite_start']:
+            return [reader.first('suite_start')]
+
+        return list(reader.events(actions))
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--tests', type=int, default=5000)
+parser.add_argument('--subtests', type=int, default=20)
+parser.add_argument('--message-size', type=int, default=100)
+parser.add_argument('--preamble-lines', type=int, default=10000)
+parser.add_argument('--repeat', type=int, default=3)
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import gzip
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.sep.join([here, '..', 'src', 'scripts']))
+
+import consolidation  # noqa: E402
+import wpt_data  # noqa: E402
+
+
+def main(chunks, tests_per_chunk, subtests, message_size, modes, jobs,
+         compression_levels, compression_threads):
+    '''Measure the wall time, peak memory consumption (RSS), throughput and
+    output size of the consolidation strategies and compression settings
+    implemented by `consolidation.py` for a synthetic set of WPT reports.
+    Each configuration is executed in a dedicated process so that memory
+    measurements are independent.'''
+
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        input_dir = os.path.join(temp_dir, 'input')
+        os.mkdir(input_dir)
+        input_bytes = wpt_data.write_chunks(input_dir, chunks,
+                                            tests_per_chunk, subtests,
+                                            message_size)
+        outputs = []
+
+        print '%-8s %6s %8s %10s %10s %14s %14s' % (
+            'mode', 'level', 'threads', 'wall (s)', 'MB/s', 'peak RSS (MB)',
+            'output bytes'
+        )
+
+        for mode in modes:
+            for level in compression_levels:
+                for threads in compression_threads:
+                    output = os.path.join(temp_dir, 'output-%s.json.gz' % (
+                        len(outputs)
+                    ))
+                    stats = json.loads(subprocess.check_output([
+                        sys.executable, __file__, '--child', mode, str(jobs),
+                        str(level), str(threads), input_dir, output
+                    ]))
+                    outputs.append(output)
+
+                    print '%-8s %6s %8s %10.2f %10.2f %14.1f %14s' % (
+                        mode,
+                        level,
+                        threads,
+                        stats['wall_time'],
+                        input_bytes / stats['wall_time'] / 1024 / 1024,
+                        stats['max_rss_kb'] / 1024.0,
+                        os.path.getsize(output)
+                    )
+
+        contents = []
+        for output in outputs:
+            with gzip.open(output) as handle:
+                contents.append(json.load(handle))
+
+        print 'Decoded output equivalent across configurations: %s' % (
+            all(content == contents[0] for content in contents)
+        )
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def child(mode, jobs, compression_level, compression_threads, input_dir,
+          output):
+    raw_results_files = [
+        os.path.join(input_dir, filename)
+        for filename in sorted(os.listdir(input_dir))
+    ]
+
+    start = time.time()
+    consolidation.write_report(output, raw_results_files, False, None,
+                               consolidation.chunk_readers[mode], int(jobs),
+                               int(compression_level),
+                               int(compression_threads))
+    wall_time = time.time() - start
+
+    print json.dumps({
+        'wall_time': wall_time,
+        # When results files are read by a pool of worker processes, the
+        # peak memory consumption of the largest process is reported.
+        'max_rss_kb': max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        )
+    })
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--chunks', type=int, default=4)
+parser.add_argument('--tests-per-chunk', type=int, default=2000)
+parser.add_argument('--subtests', type=int, default=20)
+parser.add_argument('--message-size', type=int, default=100)
+parser.add_argument('--modes',
+                    nargs='+',
+                    default=['load', 'stream', 'splice'])
+parser.add_argument('--jobs', type=int, default=1)
+parser.add_argument('--compression-levels',
+                    nargs='+',
+                    type=int,
+                    default=[9])
+parser.add_argument('--compression-threads',
+                    nargs='+',
+                    type=int,
+                    default=[1])
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(*sys.argv[2:])
+    else:
+        main(**vars(parser.parse_args()))
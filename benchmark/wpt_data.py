@@ -0,0 +1,177 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''Deterministic generator for synthetic WPT output. The generated files
+resemble those produced by the WPT CLI for a chunked test run: a
+"wptreport" JSON file and a "raw" log (one JSON-formatted event per line)
+for each chunk. The same parameters and seed always produce identical
+files.'''
+
+import json
+import os
+import random
+
+DIRECTORIES = (
+    'css/css-grid', 'css/css-flexbox', 'dom/nodes', 'fetch/api/basic',
+    'html/semantics/forms', 'IndexedDB', 'service-workers/service-worker',
+    'webdriver/tests/element_click', 'xhr',
+    '2dcontext/drawing-text-to-the-canvas'
+)
+TEST_STATUSES = ('OK', 'OK', 'OK', 'OK', 'ERROR', 'TIMEOUT')
+SUBTEST_STATUSES = ('PASS', 'PASS', 'PASS', 'FAIL', 'TIMEOUT', 'NOTRUN')
+REFTEST_STATUSES = ('PASS', 'PASS', 'FAIL')
+# The proportion of tests which are reftests (and therefore have no
+# subtests).
+REFTEST_RATIO = 0.2
+RUN_INFO = {
+    'product': 'firefox',
+    'browser_version': '61.0a1',
+    'os': 'linux',
+    'os_version': '16.04',
+    'processor': 'x86_64',
+    'bits': 64,
+    'debug': False,
+    'headless': False
+}
+
+
+class Chunk(object):
+    '''The synthetic output of a single chunk of a test run.'''
+
+    def __init__(self, index, total_chunks, tests, time_start, time_end):
+        self.index = index
+        self.total_chunks = total_chunks
+        self.tests = tests
+        self.time_start = time_start
+        self.time_end = time_end
+
+    @property
+    def name(self):
+        return '%s_of_%s' % (self.index, self.total_chunks)
+
+    def wptreport(self):
+        return {
+            'time_start': self.time_start,
+            'time_end': self.time_end,
+            'run_info': dict(RUN_INFO),
+            'results': [
+                dict((key, value) for key, value in test.items()
+                     if key != 'duration')
+                for test in self.tests
+            ]
+        }
+
+    def log_raw(self):
+        '''Generate the events of the chunk's raw log.'''
+        time = self.time_start
+
+        yield {
+            'action': 'suite_start',
+            'time': time,
+            'run_info': dict(RUN_INFO),
+            'tests': {'default': [test['test'] for test in self.tests]}
+        }
+
+        for test in self.tests:
+            yield {'action': 'test_start', 'time': time,
+                   'test': test['test']}
+
+            for subtest in test['subtests']:
+                yield {
+                    'action': 'test_status',
+                    'time': time,
+                    'test': test['test'],
+                    'subtest': subtest['name'],
+                    'status': subtest['status'],
+                    'message': subtest['message']
+                }
+
+            time += test['duration']
+
+            yield {
+                'action': 'test_end',
+                'time': time,
+                'test': test['test'],
+                'status': test['status'],
+                'message': test['message']
+            }
+
+        yield {'action': 'suite_end', 'time': time}
+
+
+def generate_chunks(total_chunks, tests_per_chunk, subtests, message_size,
+                    seed=0):
+    '''Generate the synthetic output of every chunk of a test run. Tests are
+    distributed among a fixed set of directories. `subtests` is the average
+    number of subtests of each test which is not a reftest, and
+    `message_size` is the maximum length of a subtest's message.'''
+    rng = random.Random(seed)
+    time = 1500000000000
+
+    for index in range(1, total_chunks + 1):
+        tests = []
+        time_start = time
+
+        for number in range(tests_per_chunk):
+            directory = DIRECTORIES[number % len(DIRECTORIES)]
+            name = '/%s/chunk-%s-test-%s' % (directory, index, number)
+            duration = rng.randint(10, 5000)
+
+            if rng.random() < REFTEST_RATIO:
+                tests.append({
+                    'test': name + '-ref.html',
+                    'status': rng.choice(REFTEST_STATUSES),
+                    'message': None,
+                    'subtests': [],
+                    'duration': duration
+                })
+                continue
+
+            tests.append({
+                'test': name + '.html',
+                'status': rng.choice(TEST_STATUSES),
+                'message': None,
+                'subtests': [
+                    {
+                        'name': 'subtest %s' % subtest,
+                        'status': rng.choice(SUBTEST_STATUSES),
+                        'message': 'x' * rng.randint(0, message_size)
+                    }
+                    for subtest in range(
+                        rng.randint(1, max(1, subtests * 2 - 1))
+                    )
+                ],
+                'duration': duration
+            })
+
+        time += sum(test['duration'] for test in tests)
+
+        yield Chunk(index, total_chunks, tests, time_start, time)
+
+
+def write_chunks(directory, total_chunks, tests_per_chunk, subtests,
+                 message_size, seed=0, log_raw_directory=None):
+    '''Write the wptreport file of every chunk of a synthetic test run to the
+    given directory (and, optionally, the raw log of every chunk to
+    `log_raw_directory`). Returns the total size of the wptreport files in
+    bytes.'''
+    total = 0
+
+    for chunk in generate_chunks(total_chunks, tests_per_chunk, subtests,
+                                 message_size, seed):
+        filename = os.path.join(directory, chunk.name + '.json')
+
+        with open(filename, 'w') as handle:
+            json.dump(chunk.wptreport(), handle)
+
+        total += os.path.getsize(filename)
+
+        if log_raw_directory:
+            filename = os.path.join(log_raw_directory, chunk.name + '.log')
+
+            with open(filename, 'w') as handle:
+                for event in chunk.log_raw():
+                    handle.write('%s\n' % json.dumps(event))
+
+    return total
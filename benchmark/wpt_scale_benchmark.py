@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import BaseHTTPServer
+import argparse
+import imp
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+scripts_dir = os.path.sep.join([here, '..', 'src', 'scripts'])
+upload_bin = os.path.join(scripts_dir, 'upload-wpt-results.py')
+run_and_verify_bin = os.path.join(scripts_dir, 'run-and-verify.py')
+wpt_stub_directory = os.path.sep.join([here, '..', 'test', 'bin-stubs'])
+sys.path.insert(0, scripts_dir)
+
+import consolidation  # noqa: E402
+import wpt_data  # noqa: E402
+
+STAGES = ('consolidate', 'upload', 'get_expected_results',
+          'load_wpt_report', 'analyze', 'run-and-verify')
+
+
+def main(chunks, tests_per_chunk, subtests, message_size, seed, modes,
+         orders, stages, port, output):
+    '''Measure the wall time, peak memory consumption (RSS) and output size of
+    each stage of the scripts which process WPT results, using a
+    deterministic, synthetic test run of configurable scale. Every stage runs
+    in a dedicated process and entirely offline: reports are uploaded to a
+    local HTTP server and the WPT CLI is replaced by the stub used by the
+    tests. The measurements are written in JSON format.'''
+
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        reports_dir = os.path.join(temp_dir, 'reports')
+        log_raw_dir = os.path.join(temp_dir, 'log-raw')
+        os.mkdir(reports_dir)
+        os.mkdir(log_raw_dir)
+
+        start = time.time()
+        report_bytes = wpt_data.write_chunks(reports_dir, chunks,
+                                             tests_per_chunk, subtests,
+                                             message_size, seed, log_raw_dir)
+        generate_time = time.time() - start
+        # The scripts which verify results operate on a single chunk.
+        first_chunk = '1_of_%s' % chunks
+        wptreport = os.path.join(reports_dir, first_chunk + '.json')
+        log_raw = os.path.join(log_raw_dir, first_chunk + '.log')
+        measurements = []
+
+        def measure(stage, command, output_bytes=None, cwd=None, env=None,
+                    **details):
+            stats = run(command, cwd, env)
+
+            if output_bytes is not None:
+                stats['output_bytes'] = output_bytes()
+
+            stats.update(details)
+            stats['stage'] = stage
+            measurements.append(stats)
+            sys.stderr.write('%-22s %-8s %-6s %8.2fs %8.1f MB %12s bytes\n' % (
+                stage, details.get('mode', ''), details.get('order', ''),
+                stats['wall_time'],
+                stats['max_rss_kb'] / 1024.0, stats.get('output_bytes', '-')
+            ))
+
+        for mode in modes if 'consolidate' in stages else ():
+            for order in orders:
+                output_file = os.path.join(temp_dir, 'report.json.gz')
+                measure('consolidate',
+                        [sys.executable, __file__, '--child', 'consolidate',
+                         reports_dir, mode, order, output_file],
+                        lambda: os.path.getsize(output_file),
+                        mode=mode,
+                        order=order)
+
+        if 'upload' in stages:
+            server = start_server(port)
+
+            try:
+                for mode in modes:
+                    for order in orders:
+                        measure('upload',
+                                upload_command(reports_dir, chunks, mode,
+                                               order, port),
+                                lambda: server.received_bytes.pop(),
+                                mode=mode,
+                                order=order)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        for stage in ('get_expected_results', 'load_wpt_report', 'analyze'):
+            if stage in stages:
+                measure(stage,
+                        [sys.executable, __file__, '--child', stage,
+                         wptreport, log_raw])
+
+        if 'run-and-verify' in stages:
+            command, env = run_and_verify_command(temp_dir, wptreport,
+                                                  log_raw)
+            measure('run-and-verify',
+                    command,
+                    lambda: os.path.getsize(
+                        os.path.join(temp_dir, 'wpt-log.json')
+                    ),
+                    cwd=wpt_stub_directory,
+                    env=env)
+
+        json.dump({
+            'parameters': {
+                'chunks': chunks,
+                'tests_per_chunk': tests_per_chunk,
+                'subtests': subtests,
+                'message_size': message_size,
+                'seed': seed
+            },
+            'input': {
+                'generate_time': generate_time,
+                'report_bytes': report_bytes,
+                'log_raw_bytes': sum(
+                    os.path.getsize(os.path.join(log_raw_dir, name))
+                    for name in os.listdir(log_raw_dir)
+                )
+            },
+            'stages': measurements
+        }, output, indent=2, sort_keys=True)
+        output.write('\n')
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def run(command, cwd=None, env=None):
+    '''Execute a command and measure its wall time and peak memory
+    consumption. The resource usage reported for the process includes that
+    of any descendant processes which it waits for (e.g. worker pools), and
+    child processes which time themselves may report a more precise wall
+    time by printing a JSON-formatted object to standard output.'''
+    with tempfile.TemporaryFile() as stdout:
+        start = time.time()
+        proc = subprocess.Popen(command, cwd=cwd, env=env, stdout=stdout,
+                                stderr=subprocess.PIPE)
+        stderr = proc.stderr.read()
+        _, status, rusage = os.wait4(proc.pid, 0)
+        wall_time = time.time() - start
+        proc.returncode = status
+
+        if status != 0:
+            raise Exception('Command failed: %s\n%s' % (
+                ' '.join(command), stderr
+            ))
+
+        stdout.seek(0)
+
+        try:
+            stats = json.load(stdout)
+        except ValueError:
+            stats = {}
+
+    return {
+        'wall_time': stats.get('wall_time', wall_time),
+        'max_rss_kb': rusage.ru_maxrss
+    }
+
+
+def upload_command(reports_dir, chunks, mode, order, port):
+    command = [
+        sys.executable, upload_bin,
+        '--raw-results-directory', reports_dir,
+        '--product', 'firefox',
+        '--browser-channel', 'stable',
+        '--browser-version', '61.0a1',
+        '--os', 'linux',
+        '--os-version', '16.04',
+        '--url', 'http://localhost:%s' % port,
+        '--user-name', 'benchmark',
+        '--secret', 'benchmark',
+        '--override-platform', 'false',
+        '--total-chunks', str(chunks),
+        '--git-branch', 'master',
+        '--consolidation-mode', mode,
+        '--max-attempts', '1'
+    ]
+
+    if order == 'test':
+        command.append('--sort-results')
+
+    return command
+
+
+def run_and_verify_command(temp_dir, wptreport, log_raw):
+    '''Prepare an invocation of `run-and-verify.py` which uses the WPT CLI
+    stub to "produce" the given results. The command must be executed in the
+    directory of the stub.'''
+    fixture_file = os.path.join(temp_dir, 'fixture.json')
+    count_file = os.path.join(temp_dir, 'count.txt')
+
+    with open(wptreport) as handle:
+        report = json.load(handle)
+
+    with open(log_raw) as handle:
+        events = [json.loads(line) for line in handle]
+
+    with open(fixture_file, 'w') as handle:
+        json.dump([{'log-wptreport': report, 'log-raw': events}], handle)
+
+    with open(count_file, 'w') as handle:
+        handle.write('0')
+
+    env = dict(os.environ)
+    env['TEST_FIXTURE_FILE'] = fixture_file
+    env['TEST_COUNT_FILE'] = count_file
+    command = [
+        sys.executable, run_and_verify_bin,
+        '--max-attempts', '1',
+        '--log-wptreport', os.path.join(temp_dir, 'wpt-log.json'),
+        '--log-raw', os.path.join(temp_dir, 'wpt-log-raw.txt')
+    ]
+
+    return command, env
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''A results receiver which discards the uploaded data, recording only
+    its size.'''
+
+    def log_message(*argv):
+        pass
+
+    def do_POST(self):
+        remaining = int(self.headers['Content-Length'])
+
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+
+        self.server.received_bytes.append(
+            int(self.headers['Content-Length'])
+        )
+        self.send_response(201)
+        self.end_headers()
+
+
+def start_server(port):
+    server = BaseHTTPServer.HTTPServer(('', port), Handler)
+    server.received_bytes = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+
+def child(stage, *args):
+    '''Execute a single stage in the current process and report its wall
+    time.'''
+    start = time.time()
+
+    if stage == 'consolidate':
+        reports_dir, mode, order, output_file = args
+        raw_results_files = [
+            os.path.join(reports_dir, filename)
+            for filename in sorted(os.listdir(reports_dir),
+                                   key=consolidation.chunk_sort_key)
+        ]
+        read_results = None
+
+        if order == 'test':
+            read_results = consolidation.result_readers[mode]
+
+        consolidation.write_report(output_file, raw_results_files, False,
+                                   None, consolidation.chunk_readers[mode],
+                                   read_results=read_results)
+    else:
+        wptreport, log_raw = args
+        run_and_verify = imp.load_source('run_and_verify',
+                                         run_and_verify_bin)
+
+        if stage == 'get_expected_results':
+            run_and_verify.get_expected_results(log_raw)
+        elif stage == 'load_wpt_report':
+            run_and_verify.load_wpt_report(wptreport)
+        else:
+            _, summary = run_and_verify.load_wpt_report(wptreport)
+            run_and_verify.analyze(summary, log_raw)
+
+    print json.dumps({'wall_time': time.time() - start})
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--chunks', type=int, default=20)
+parser.add_argument('--tests-per-chunk', type=int, default=2000,
+                    help='number of tests in each chunk')
+parser.add_argument('--subtests', type=int, default=20,
+                    help='average number of subtests of each test which is '
+                         'not a reftest')
+parser.add_argument('--message-size', type=int, default=100,
+                    help='maximum length of the message of each subtest')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--modes', nargs='+',
+                    choices=sorted(consolidation.chunk_readers.keys()),
+                    default=['splice'],
+                    help='consolidation modes to measure')
+parser.add_argument('--orders', nargs='+', choices=('chunk', 'test'),
+                    default=['chunk', 'test'],
+                    help='orders of the consolidated results to measure: by '
+                         'chunk or sorted by test ID')
+parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+parser.add_argument('--port', type=int, default=9804,
+                    help='port of the local results receiver')
+parser.add_argument('--output', type=argparse.FileType('w'),
+                    default=sys.stdout,
+                    help='file to which the measurements are written '
+                         '(standard output by default)')
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(*sys.argv[2:])
+    else:
+        main(**vars(parser.parse_args()))
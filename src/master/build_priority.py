@@ -0,0 +1,147 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''Policies for choosing which pending chunk to execute next.
+
+By default, Buildbot starts pending builds in the order in which they were
+requested. The chunks of every platform are requested together, so a shared
+pool of workers executes chunks of every platform concurrently and every
+platform's run finishes (and is uploaded) late. The policies defined here
+instead concentrate workers on one run at a time:
+
+- "shortest-remaining" prefers the run with the least remaining work (the
+  total expected duration of its pending chunks), so that runs which are
+  nearly complete are completed first.
+- "oldest-revision" prefers the run which was requested first, so that the
+  runs of each revision are completed before those of later revisions.
+
+Ties between runs are broken in favor of the run which has made the most
+progress. Within a run, the chunk with the longest expected duration is
+preferred, because it determines when the run can complete.'''
+
+import collections
+import json
+import os
+
+# The expected duration of a chunk for which no plan is available. Planned
+# durations are scaled so that the mean duration of a run's chunks is equal to
+# this value, so runs with and without plans may be compared.
+DEFAULT_DURATION = 1.0
+
+Candidate = collections.namedtuple(
+    'Candidate',
+    ['request', 'run', 'submitted_at', 'chunk', 'chunks', 'total_chunks',
+     'duration']
+)
+
+
+def choose(candidates, policy):
+    '''Choose the candidate which should be executed next according to the
+    named policy.'''
+    runs = collections.defaultdict(list)
+
+    for candidate in candidates:
+        runs[candidate.run].append(candidate)
+
+    def run_key(run):
+        pending = runs[run]
+        remaining = sum(candidate.duration for candidate in pending)
+        submitted_at = min(candidate.submitted_at for candidate in pending)
+        # A build may execute several chunks, so progress is measured in
+        # chunks rather than in builds.
+        progress = 1 - (sum(candidate.chunks for candidate in pending) /
+                        float(pending[0].total_chunks or 1))
+
+        if policy == 'shortest-remaining':
+            return (remaining, -progress, submitted_at)
+        elif policy == 'oldest-revision':
+            return (submitted_at, -progress, remaining)
+
+        raise ValueError('Unrecognized policy: %s' % policy)
+
+    run = min(runs, key=run_key)
+
+    return min(runs[run], key=lambda candidate: (
+        -candidate.duration, candidate.chunk, candidate.submitted_at
+    ))
+
+
+def read_durations(filename):
+    '''Read the expected duration of each chunk from a chunk plan (see
+    `duration-history.py`), relative to `DEFAULT_DURATION`. Returns `None`
+    if no plan is available.'''
+    try:
+        with open(filename) as handle:
+            plan = json.load(handle)
+
+        durations = [chunk['duration'] for chunk in plan['chunks']]
+        mean = sum(durations) / float(len(durations))
+    except (IOError, ValueError, KeyError, TypeError, ZeroDivisionError):
+        return None
+
+    if mean <= 0:
+        return None
+
+    return [duration * DEFAULT_DURATION / mean for duration in durations]
+
+
+def make_next_build(policy):
+    '''Create a function suitable for use as the `nextBuild` argument of a
+    Buildbot `BuilderConfig`, which chooses between the builder's pending
+    build requests according to the named policy. The expected duration of
+    each chunk is read from the chunk plan of its build request (if any).'''
+    if policy is None:
+        return None
+
+    # Plans are read once rather than on every decision.
+    plans = {}
+
+    def next_build(builder, requests):
+        candidates = []
+        used = set()
+
+        for request in requests:
+            properties = request.properties
+            platform_id = properties.getProperty('platform_id')
+            chunk_plan = properties.getProperty('chunk_plan')
+            revision = None
+
+            for source in request.sources.values():
+                revision = source.revision
+
+            chunk = properties.getProperty('this_chunk')
+            # A build may execute several chunks.
+            chunks = properties.getProperty('chunks') or [chunk]
+            duration = DEFAULT_DURATION * len(chunks)
+            run = (revision, platform_id)
+
+            if chunk_plan:
+                if chunk_plan not in plans:
+                    plans[chunk_plan] = read_durations(chunk_plan)
+
+                durations = plans[chunk_plan]
+                used.add(chunk_plan)
+
+                if durations and all(chunks) and max(chunks) <= len(durations):
+                    duration = sum(durations[index - 1] for index in chunks)
+
+            candidates.append(Candidate(
+                request=request,
+                run=run,
+                submitted_at=request.submittedAt,
+                chunk=chunk,
+                chunks=len(chunks),
+                total_chunks=properties.getProperty('total_chunks'),
+                duration=duration
+            ))
+
+        for chunk_plan in set(plans) - used:
+            del plans[chunk_plan]
+
+        if not candidates:
+            return None
+
+        return choose(candidates, policy).request
+
+    return next_build
@@ -0,0 +1,104 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import contextlib
+import fcntl
+import json
+import os
+
+
+class CompletionTracker(object):
+    '''Record the arrival of the chunks of a single test run (i.e. one
+    revision on one platform) on the build master, so that the completion of
+    the run is detected without inspecting the results of every chunk.
+
+    The state of the tracker is a JSON-formatted file which is replaced
+    atomically while an exclusive lock is held, so arrivals recorded by
+    concurrent builds are serialized and the state survives restarts of the
+    build master. The state records which chunks have arrived, whether the
+    run's completion has been reported (i.e. its upload triggered) and whether
+    the run has been uploaded, so exactly one arrival completes the run
+    regardless of the order (or repetition) of arrivals. If the upload fails,
+    the report is withdrawn so that the next arrival (e.g. of a chunk which is
+    executed again) completes the run again.'''
+
+    STATE = 'completion.json'
+    LOCK = 'lock'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @contextlib.contextmanager
+    def locked(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        with open(os.path.join(self.directory, self.LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read(self):
+        try:
+            with open(os.path.join(self.directory, self.STATE)) as handle:
+                return json.load(handle)
+        except IOError:
+            return {'chunks': [], 'triggered': False, 'complete': False}
+
+    def write(self, state):
+        temp_name = os.path.join(self.directory, self.STATE + '.tmp')
+
+        with open(temp_name, 'w') as handle:
+            json.dump(state, handle, sort_keys=True)
+
+        os.rename(temp_name, os.path.join(self.directory, self.STATE))
+
+    def record(self, chunk, total_chunks):
+        '''Record the arrival of a chunk. Returns `True` if this arrival
+        completed the run, i.e. if every chunk has now arrived and the
+        completion has not previously been reported (or its upload has since
+        failed).'''
+        with self.locked():
+            state = self.read()
+
+            if chunk not in state['chunks']:
+                state['chunks'].append(chunk)
+
+            if (state['triggered'] or state['complete'] or
+                    len(state['chunks']) < total_chunks):
+                self.write(state)
+                return False
+
+            state['triggered'] = True
+            self.write(state)
+
+            return True
+
+    def mark_uploaded(self):
+        '''Record the successful upload of the run.'''
+        with self.locked():
+            state = self.read()
+            state['complete'] = True
+            self.write(state)
+
+    def mark_upload_failed(self):
+        '''Withdraw the report of the run's completion following a failed
+        upload.'''
+        with self.locked():
+            state = self.read()
+            state['triggered'] = False
+            self.write(state)
+
+    def status(self):
+        '''Describe the chunks which have arrived.'''
+        state = self.read()
+
+        return {
+            'chunks': len(state['chunks']),
+            'triggered': state['triggered'],
+            'complete': state['complete']
+        }
@@ -0,0 +1,212 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import contextlib
+import fcntl
+import json
+import os
+import time
+
+
+class LeaseQueue(object):
+    '''A queue of the chunks of a single test run, persisted in a directory
+    on the build master. Rather than executing a predetermined chunk, each
+    build repeatedly leases the next chunk from the queue until no chunks
+    remain.
+
+    A lease expires unless it is renewed, so the chunks leased by a build
+    which is lost (e.g. because its worker disconnects) are eventually leased
+    by another build. A chunk may therefore be completed more than once; only
+    the first completion is recorded. A chunk which is leased too many times
+    without being completed is marked as failed and is not leased again.
+
+    The state of the queue is a JSON-formatted file which is replaced
+    atomically. Every modification holds an exclusive lock, so the queue may
+    be shared between processes.'''
+
+    STATE = 'queue.json'
+    LOCK = 'lock'
+
+    def __init__(self, directory, clock=time.time):
+        self.directory = directory
+        self.clock = clock
+
+    @contextlib.contextmanager
+    def locked(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        with open(os.path.join(self.directory, self.LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read(self):
+        try:
+            with open(os.path.join(self.directory, self.STATE)) as handle:
+                return json.load(handle)
+        except IOError:
+            return None
+
+    def create(self, total_chunks):
+        '''Populate the queue with the given number of chunks. A queue which
+        already exists (e.g. because the run has been restarted) is
+        retained. Returns `True` if the queue was created.'''
+        with self.locked():
+            if self.read() is not None:
+                return False
+
+            self.write({
+                'total_chunks': total_chunks,
+                'chunks': dict(
+                    (str(chunk), {'state': 'pending', 'owner': None,
+                                  'expires': None, 'leases': 0})
+                    for chunk in range(1, total_chunks + 1)
+                )
+            })
+
+        return True
+
+    def write(self, state):
+        temp_name = os.path.join(self.directory, self.STATE + '.tmp')
+
+        with open(temp_name, 'w') as handle:
+            json.dump(state, handle, sort_keys=True)
+
+        os.rename(temp_name, os.path.join(self.directory, self.STATE))
+
+    def lease(self, owner, duration, max_leases=None):
+        '''Lease the next chunk for `duration` seconds. Chunks which have not
+        been leased are preferred to chunks whose lease has expired. A chunk
+        which has already been leased `max_leases` times without being
+        completed is marked as "failed" rather than being leased again.
+        Returns the index of the chunk, or `None` if no chunk is available.'''
+        now = self.clock()
+
+        with self.locked():
+            state = self.read()
+
+            if state is None:
+                return None
+
+            chunks = state['chunks']
+            modified = False
+
+            for value in chunks.values():
+                available = value['state'] == 'pending' or (
+                    value['state'] == 'leased' and value['expires'] < now
+                )
+
+                if (available and max_leases is not None and
+                        value['leases'] >= max_leases):
+                    value['state'] = 'failed'
+                    value['owner'] = None
+                    value['expires'] = None
+                    modified = True
+
+            available = sorted(
+                int(chunk) for chunk, value in chunks.items()
+                if value['state'] == 'pending'
+            ) or sorted(
+                int(chunk) for chunk, value in chunks.items()
+                if value['state'] == 'leased' and value['expires'] < now
+            )
+
+            if available:
+                value = chunks[str(available[0])]
+                value['state'] = 'leased'
+                value['owner'] = owner
+                value['expires'] = now + duration
+                value['leases'] += 1
+                modified = True
+
+            if modified:
+                self.write(state)
+
+            return available[0] if available else None
+
+    def renew(self, chunk, owner, duration):
+        '''Extend the lease of a chunk. Returns `False` if the chunk is no
+        longer leased by the given owner (or if the queue has been
+        removed).'''
+        with self.locked():
+            state = self.read()
+
+            if state is None:
+                return False
+
+            value = state['chunks'][str(chunk)]
+
+            if value['state'] != 'leased' or value['owner'] != owner:
+                return False
+
+            value['expires'] = self.clock() + duration
+            self.write(state)
+
+            return True
+
+    def release(self, chunk, owner):
+        '''Return a leased chunk to the queue (e.g. because it could not be
+        completed) so that it may be leased immediately. Returns `True` if the
+        chunk was leased by the given owner.'''
+        with self.locked():
+            state = self.read()
+
+            if state is None:
+                return False
+
+            value = state['chunks'][str(chunk)]
+
+            if value['state'] != 'leased' or value['owner'] != owner:
+                return False
+
+            value['state'] = 'pending'
+            value['owner'] = None
+            value['expires'] = None
+            self.write(state)
+
+            return True
+
+    def complete(self, chunk, owner):
+        '''Record the completion of a chunk. Returns `True` if this
+        completion drained the queue, i.e. if every chunk is now complete and
+        was not previously. Exactly one completion drains a queue.'''
+        with self.locked():
+            state = self.read()
+
+            if state is None:
+                return False
+
+            value = state['chunks'][str(chunk)]
+
+            if value['state'] == 'done':
+                return False
+
+            value['state'] = 'done'
+            value['owner'] = owner
+            value['expires'] = None
+            self.write(state)
+
+            return all(
+                other['state'] == 'done' for other in state['chunks'].values()
+            )
+
+    def status(self):
+        '''Count the chunks in each state. Chunks whose lease has expired are
+        counted as "expired" rather than "leased".'''
+        now = self.clock()
+        state = self.read()
+        counts = {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0,
+                  'failed': 0}
+
+        for value in (state or {}).get('chunks', {}).values():
+            if value['state'] == 'leased' and value['expires'] < now:
+                counts['expired'] += 1
+            else:
+                counts[value['state']] += 1
+
+        return counts
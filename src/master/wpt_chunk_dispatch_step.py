@@ -0,0 +1,170 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+from buildbot.plugins import steps
+from buildbot.process import buildstep, results
+from twisted.internet import defer, task
+
+from lease_queue import LeaseQueue
+
+# The duration (in seconds) of a lease on a chunk. Leases are renewed while
+# the build which holds them is in progress, so a lease expires only if its
+# build is lost.
+LEASE_DURATION = 10 * 60
+RENEWAL_INTERVAL = 2 * 60
+# A chunk which has been leased this many times without being completed is
+# assumed to fail consistently and is marked as failed.
+MAX_LEASES = 3
+
+
+def lease_owner(step):
+    '''Identify the build which executes the given step as the owner of
+    leases.'''
+    return '%s/%s' % (step.getProperty('workername'),
+                      step.getProperty('buildnumber'))
+
+
+class WptChunkDispatchStep(buildstep.BuildStep):
+    '''Schedule the steps which execute a chunk of the test suite (as created
+    by the `chunk_steps` function). By default, the chunk is identified by the
+    `this_chunk` property.
+
+    If the `chunks` property lists several chunks, the steps are repeated for
+    each chunk in turn (with `this_chunk` set accordingly), so the build's
+    preparation of the worker is shared between the chunks. The steps are
+    created with `halt_on_failure=False`, so a chunk which fails does not
+    prevent the execution of the remaining chunks.
+
+    If the `chunk_queue` property names the directory of a `LeaseQueue`,
+    chunks are instead leased from the queue one at a time, and the steps are
+    repeated for each chunk until no chunk can be leased. Chunks leased by
+    other builds are not waited for: if such a lease expires, the chunk is
+    leased by a build which is still dispatching chunks or by the build
+    triggered by `WptRequeueChunksStep`.'''
+
+    def __init__(self, chunk_steps, *args, **kwargs):
+        self.chunk_steps = chunk_steps
+
+        super(WptChunkDispatchStep, self).__init__(*args, **kwargs)
+
+    @defer.inlineCallbacks
+    def run(self):
+        directory = self.getProperty('chunk_queue')
+
+        if not directory:
+            chunks = self.getProperty('chunks')
+
+            if not chunks:
+                self.build.addStepsAfterCurrentStep(self.chunk_steps())
+                defer.returnValue(results.SUCCESS)
+
+            chunk_steps = []
+
+            for chunk in chunks:
+                chunk_steps.append(
+                    steps.SetProperty(name=str('Select chunk %s' % chunk),
+                                      property='this_chunk',
+                                      value=chunk)
+                )
+                chunk_steps.extend(self.chunk_steps(halt_on_failure=False))
+
+            self.build.addStepsAfterCurrentStep(chunk_steps)
+            self.descriptionDone = ['Scheduled chunks %s' % (
+                ', '.join(str(chunk) for chunk in chunks)
+            )]
+            defer.returnValue(results.SUCCESS)
+
+        queue = LeaseQueue(directory)
+        owner = lease_owner(self)
+        chunk = queue.lease(owner, LEASE_DURATION, MAX_LEASES)
+
+        if chunk is None:
+            failed = queue.status()['failed']
+
+            if failed:
+                self.descriptionDone = ['%s chunks failed' % failed]
+                defer.returnValue(results.WARNINGS)
+
+            self.descriptionDone = ['No chunks remain']
+            defer.returnValue(results.SUCCESS)
+
+        self.setProperty('this_chunk', chunk, 'WptChunkDispatchStep')
+        # The lease is released by `WptRequeueChunksStep` if the chunk is not
+        # completed.
+        self.setProperty('leased_chunk', chunk, 'WptChunkDispatchStep')
+        self.descriptionDone = ['Leased chunk %s' % chunk]
+
+        def renew():
+            # A build which has finished without completing its chunk (e.g.
+            # because a step failed) no longer holds its lease.
+            if self.build.finished:
+                queue.release(chunk, owner)
+                renewal.stop()
+            elif not queue.renew(chunk, owner, LEASE_DURATION):
+                renewal.stop()
+
+        renewal = task.LoopingCall(renew)
+        renewal.start(RENEWAL_INTERVAL, now=False)
+
+        self.build.addStepsAfterCurrentStep(self.chunk_steps() + [
+            CompleteChunkStep(name='Complete chunk', queue=queue,
+                              chunk=chunk, owner=owner, renewal=renewal),
+            WptChunkDispatchStep(name='Dispatch chunks',
+                                 chunk_steps=self.chunk_steps)
+        ])
+        defer.returnValue(results.SUCCESS)
+
+
+class CompleteChunkStep(buildstep.BuildStep):
+    '''Record the completion of a chunk leased by `WptChunkDispatchStep`.'''
+
+    def __init__(self, queue, chunk, owner, renewal, *args, **kwargs):
+        self.queue = queue
+        self.chunk = chunk
+        self.owner = owner
+        self.renewal = renewal
+
+        super(CompleteChunkStep, self).__init__(*args, **kwargs)
+
+    def run(self):
+        if self.renewal.running:
+            self.renewal.stop()
+
+        self.setProperty('leased_chunk', None, 'CompleteChunkStep')
+
+        if self.queue.complete(self.chunk, self.owner):
+            self.descriptionDone = ['Completed the final chunk']
+        else:
+            self.descriptionDone = ['Completed chunk %s' % self.chunk]
+
+        return defer.succeed(results.SUCCESS)
+
+
+class WptRequeueChunksStep(steps.Trigger):
+    '''Return the chunk leased by `WptChunkDispatchStep` to its queue if the
+    build failed to complete it, and trigger another build to lease the
+    chunks which remain in the queue (if any). This step should run even if
+    the build has failed.'''
+
+    @defer.inlineCallbacks
+    def run(self):
+        directory = self.getProperty('chunk_queue')
+
+        if not directory:
+            defer.returnValue(results.SKIPPED)
+
+        queue = LeaseQueue(directory)
+        chunk = self.getProperty('leased_chunk')
+
+        if chunk is not None and queue.release(chunk, lease_owner(self)):
+            self.setProperty('leased_chunk', None, 'WptRequeueChunksStep')
+
+        status = queue.status()
+
+        if not status['pending'] and not status['expired']:
+            self.descriptionDone = ['No chunks remain']
+            defer.returnValue(results.SKIPPED)
+
+        result = yield super(WptRequeueChunksStep, self).run()
+        defer.returnValue(result)
@@ -2,19 +2,50 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import os
+
 from buildbot.plugins import steps, util
 
+from lease_queue import LeaseQueue
+
+
+def chunk_plan_path(chunk_plans_dir, revision, platform_id, buildnumber):
+    '''Locate the chunk plan written by the given build of the trigger
+    builder. A plan is written once for every trigger (rather than for every
+    revision), so builds which are pending when a revision is triggered again
+    continue to use the plan with which they were triggered.'''
+    return os.path.join(chunk_plans_dir, revision, platform_id,
+                        '%s.json' % buildnumber)
+
 
 class WPTChunkedStep(steps.Trigger):
     def __init__(self, platform_id, platform, total_chunks, *args, **kwargs):
         self.platform_id = platform_id
         self.platform = platform
         self.total_chunks = total_chunks
+        # Directory in which the chunk plans of each revision are written (see
+        # `duration-history.py` and `chunk_plan_path`).
+        self.chunk_plans_dir = kwargs.pop('chunk_plans_dir', None)
+        # When a number of builds is specified, the chunks are not assigned
+        # to builds. Instead, that many builds lease chunks from a queue
+        # created in the given directory (see `WptChunkDispatchStep`).
+        self.queue_builds = kwargs.pop('queue_builds', None)
+        self.chunk_queues_dir = kwargs.pop('chunk_queues_dir', None)
+        # Otherwise, each build executes this many consecutive chunks so that
+        # the preparation of the worker (checking out WPT, installing the
+        # browser, etc.) is shared between them.
+        self.chunks_per_build = kwargs.pop('chunks_per_build', None) or 1
 
-        kwargs['name'] = str('Trigger %s chunks on %s@%s' % (
-            total_chunks, platform['browser_name'].title(),
-            platform['browser_channel']
-        ))
+        if self.queue_builds:
+            kwargs['name'] = str('Trigger %s builds for %s chunks on %s@%s' % (
+                self.queue_builds, total_chunks,
+                platform['browser_name'].title(), platform['browser_channel']
+            ))
+        else:
+            kwargs['name'] = str('Trigger %s chunks on %s@%s' % (
+                total_chunks, platform['browser_name'].title(),
+                platform['browser_channel']
+            ))
 
         super(WPTChunkedStep, self).__init__(*args, **kwargs)
 
@@ -28,15 +59,49 @@ class WPTChunkedStep(steps.Trigger):
         webdriver_url = self.build.properties.getProperty(
             'webdriver_url_%s' % browser_name
         )
+        chunk_plan = None
+        chunk_queue = None
+
+        if self.chunk_plans_dir:
+            filename = chunk_plan_path(
+                self.chunk_plans_dir,
+                self.build.properties.getProperty('announced_revision'),
+                self.platform_id,
+                self.build.properties.getProperty('buildnumber')
+            )
+
+            if os.path.exists(filename):
+                chunk_plan = filename
+
+        if self.queue_builds:
+            chunk_queue = os.path.join(
+                self.chunk_queues_dir,
+                self.build.properties.getProperty('announced_revision'),
+                self.platform_id
+            )
+            # A queue which remains from a previous trigger of the same
+            # revision is resumed.
+            LeaseQueue(chunk_queue).create(self.total_chunks)
+            groups = [[None]] * self.queue_builds
+        else:
+            chunks = range(1, self.total_chunks + 1)
+            groups = [
+                chunks[index:index + self.chunks_per_build]
+                for index in range(0, self.total_chunks, self.chunks_per_build)
+            ]
 
         for scheduler in self.schedulerNames:
             unimportant = scheduler in self.unimportantSchedulerNames
 
-            for this_chunk in range(1, self.total_chunks + 1):
+            for group in groups:
                 spec.append({
                     'sched_name': scheduler,
                     'props_to_set': {
-                        'this_chunk': this_chunk,
+                        'this_chunk': group[0],
+                        # The chunks executed by the build, if more than one
+                        # (see `WptChunkDispatchStep`).
+                        'chunks': group if len(group) > 1 else None,
+                        'chunk_queue': chunk_queue,
                         'total_chunks': self.total_chunks,
                         'platform_id': self.platform_id,
                         'browser_name': browser_name,
@@ -46,7 +111,8 @@ class WPTChunkedStep(steps.Trigger):
                         'webdriver_url': webdriver_url,
                         'os_name': self.platform['os_name'],
                         'os_version': self.platform['os_version'],
-                        'use_sauce_labs': self.platform.get('remote')
+                        'use_sauce_labs': self.platform.get('remote'),
+                        'chunk_plan': chunk_plan
                     },
                     'unimportant': unimportant
                 })
@@ -2,37 +2,102 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
-import os
-
 from buildbot.plugins import steps
+from buildbot.process import buildstep, results
 from twisted.python import log
-from twisted.internet import defer
+from twisted.internet import defer, threads
+
+from completion_tracker import CompletionTracker
+# Installed alongside the configuration of the build master (see
+# `src/scripts/report_summary.py`).
+import report_summary
+
+
+class WptRecordChunkStep(buildstep.BuildStep):
+    '''Validate the results file of the current chunk (via its summary) and
+    record the chunk's arrival. When the arrival completes the run, the
+    `results_complete` property is set (see `WptDetectCompleteStep`).'''
+
+    def __init__(self, results_file, tracker_dir, *args, **kwargs):
+        self.results_file = results_file
+        self.tracker_dir = tracker_dir
+
+        super(WptRecordChunkStep, self).__init__(*args, **kwargs)
+
+    @defer.inlineCallbacks
+    def run(self):
+        this_chunk = self.getProperty('this_chunk')
+        total_chunks = self.getProperty('total_chunks')
+        results_file = yield self.build.render(self.results_file)
+        tracker_dir = yield self.build.render(self.tracker_dir)
+        # Verifying the results file (which involves hashing it) and
+        # updating the tracker (which waits for a lock) are performed outside
+        # of the reactor thread so that other builds are not delayed.
+        summary = yield threads.deferToThread(report_summary.read,
+                                              results_file)
+
+        if summary is None:
+            self.descriptionDone = ['Results file is incomplete']
+            defer.returnValue(results.FAILURE)
+
+        tracker = CompletionTracker(tracker_dir)
+        is_complete = yield threads.deferToThread(tracker.record, this_chunk,
+                                                  total_chunks)
+        status = yield threads.deferToThread(tracker.status)
+
+        log.msg('WptRecordChunkStep: Chunk %s of %s has %s results' % (
+            this_chunk, total_chunks, summary['total']
+        ))
+
+        if is_complete:
+            self.setProperty('results_complete', True, 'WptRecordChunkStep')
+            self.descriptionDone = ['Recorded the final chunk']
+        else:
+            self.descriptionDone = ['Recorded chunk %s (%s of %s present)' % (
+                this_chunk, status['chunks'], total_chunks
+            )]
+
+        defer.returnValue(results.SUCCESS)
 
 
 class WptDetectCompleteStep(steps.Trigger):
-    def __init__(self, dir_name, *args, **kwargs):
+    '''Trigger the upload of a run's results from the build which recorded
+    the arrival of the run's final chunk (see `WptRecordChunkStep`). Because
+    exactly one arrival completes a run, the upload is triggered once (unless
+    it fails; see `WptRecordUploadStep`).'''
+
+    def __init__(self, *args, **kwargs):
         kwargs['doStepIf'] = self.allResultsPresent
-        self.dir_name = dir_name
 
         super(WptDetectCompleteStep, self).__init__(*args, **kwargs)
 
-    @defer.inlineCallbacks
     def allResultsPresent(self, step):
-        total_chunks = self.build.properties.getProperty('total_chunks')
+        return bool(self.build.properties.getProperty('results_complete'))
 
-        dir_name = yield self.dir_name.getRenderingFor(self.build.properties)
 
-        actual = set(os.listdir(dir_name))
-        expected = set(
-            [
-                '%s_of_%s.json' % (idx, total_chunks)
-                for idx in range(1, total_chunks + 1)
-            ]
-        )
-        missing = expected - actual
+class WptRecordUploadStep(buildstep.BuildStep):
+    '''Record the outcome of the upload of a run's results in the run's
+    `CompletionTracker`. If the upload failed, the run's completion is
+    withdrawn so that the upload is triggered again; the retried upload is
+    sent only to the receivers which did not accept it (see the
+    `--receipts-directory` option of `upload-wpt-results.py`). This step
+    should run even if the build has failed.'''
 
-        log.msg('WptDetectCompleteStep: Missing %s results (expected %s)' % (
-            len(missing), len(expected)
-        ))
+    def __init__(self, tracker_dir, *args, **kwargs):
+        self.tracker_dir = tracker_dir
+
+        super(WptRecordUploadStep, self).__init__(*args, **kwargs)
+
+    @defer.inlineCallbacks
+    def run(self):
+        tracker_dir = yield self.build.render(self.tracker_dir)
+        tracker = CompletionTracker(tracker_dir)
+
+        if self.build.results in (results.SUCCESS, results.WARNINGS):
+            yield threads.deferToThread(tracker.mark_uploaded)
+            self.descriptionDone = ['Recorded upload']
+        else:
+            yield threads.deferToThread(tracker.mark_upload_failed)
+            self.descriptionDone = ['Recorded failed upload']
 
-        defer.returnValue(len(missing) == 0)
+        defer.returnValue(results.SUCCESS)
@@ -39,11 +39,34 @@ class WptRunStep(steps.ShellCommand):
             '--max-attempts', properties.getProperty('max_attempts'),
             '--log-wptreport', properties.getProperty('log_wptreport'),
             '--log-raw', properties.getProperty('log_raw'),
+            '--log-durations', properties.getProperty('log_durations'),
+            # Terminate (and resume) runs in which no test has completed for
+            # ten minutes rather than waiting for the step to time out.
+            '--stall-timeout', '600',
+            # The test suite itself may take considerably longer to start
+            # (e.g. while the manifest is downloaded or generated).
+            '--startup-timeout', '1800',
+            # Browser output can be voluminous; limit the amount stored in the
+            # build log (the most recent output is reported on failure).
+            '--output-rate-limit', '100'
+        ]
+
+        # When a plan is available, it determines the tests of the chunk
+        # (in place of the WPT CLI's own chunking).
+        if properties.getProperty('chunk_plan'):
+            command.extend([
+                '--chunk-plan',
+                '%s/chunk-plan.json' % (
+                    properties.getProperty('temporary_directory')
+                )
+            ])
+
+        command.extend([
             '--',
             '--log-mach', '-',
             '--this-chunk', properties.getProperty('this_chunk'),
             '--total-chunks', properties.getProperty('total_chunks')
-        ]
+        ])
 
         if properties.getProperty('use_sauce_labs'):
             workername = properties.getProperty('workername')
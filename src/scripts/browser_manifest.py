@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''A record of the browser most recently installed on a worker for each
+browser name: the identifier of the artifact from which it was installed (its
+mirrored URL), the installation directory, the location of the binary and
+(once read) the browser's version. Builds which request the artifact that is
+already installed use the record rather than installing it again, and the
+version is read from the record rather than by executing the binary.
+
+Each record includes the size and modification time of the binary, so a
+record is disregarded if the binary has since been modified or removed.'''
+
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import sys
+
+
+@contextlib.contextmanager
+def locked(manifest):
+    with open(manifest + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read(manifest):
+    try:
+        with open(manifest) as handle:
+            return json.load(handle)
+    except (IOError, ValueError):
+        return {}
+
+
+def write(manifest, entries):
+    temp_name = manifest + '.tmp'
+
+    with open(temp_name, 'w') as handle:
+        json.dump(entries, handle, indent=2, sort_keys=True)
+
+    os.rename(temp_name, manifest)
+
+
+def describe(binary):
+    '''Identify the current state of a binary cheaply (i.e. without reading
+    it). Returns `None` if the binary does not exist.'''
+    try:
+        stat = os.stat(binary)
+    except OSError:
+        return None
+
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def is_current(entry):
+    if not os.path.exists(entry.get('install_path') or ''):
+        return False
+
+    state = describe(entry['binary'])
+
+    return state is not None and state == {
+        'size': entry.get('size'), 'mtime': entry.get('mtime')
+    }
+
+
+def lookup(manifest, browser_name, artifact):
+    '''Returns the location of the binary installed from the given artifact,
+    or `None` if the artifact is not installed.'''
+    entry = read(manifest).get(browser_name)
+
+    if entry is None or entry.get('artifact') != artifact:
+        return None
+
+    if not is_current(entry):
+        return None
+
+    return entry['binary']
+
+
+def record(manifest, browser_name, artifact, install_path, binary):
+    '''Record the installation of a browser from the given artifact.'''
+    entry = {
+        'artifact': artifact,
+        'install_path': install_path,
+        'binary': binary,
+        'version': None
+    }
+    entry.update(describe(binary) or {})
+
+    with locked(manifest):
+        entries = read(manifest)
+        entries[browser_name] = entry
+        write(manifest, entries)
+
+
+def cached_version(manifest, browser_name, binary):
+    '''Returns the recorded version of the given binary, or `None` if it has
+    not been recorded.'''
+    entry = read(manifest).get(browser_name)
+
+    if entry is None or entry['binary'] != binary or not is_current(entry):
+        return None
+
+    return entry.get('version')
+
+
+def record_version(manifest, browser_name, binary, version):
+    '''Record the version of the installed binary. Versions of binaries which
+    were not installed from a recorded artifact are not recorded.'''
+    with locked(manifest):
+        entries = read(manifest)
+        entry = entries.get(browser_name)
+
+        if entry is None or entry['binary'] != binary:
+            return
+
+        if not is_current(entry):
+            return
+
+        entry['version'] = version
+        write(manifest, entries)
+
+
+def main(manifest, command, browser_name, artifact, install_path, binary):
+    '''Query or update the install manifest from the shell: `lookup` prints
+    the binary installed from the given artifact (and fails if there is
+    none); `record` records an installation.'''
+    if command == 'lookup':
+        binary = lookup(manifest, browser_name, artifact)
+
+        if binary is None:
+            sys.exit(1)
+
+        print binary
+    else:
+        record(manifest, browser_name, artifact, install_path, binary)
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('command', choices=('lookup', 'record'))
+parser.add_argument('--manifest', required=True)
+parser.add_argument('--browser-name', required=True)
+parser.add_argument('--artifact', required=True)
+parser.add_argument('--install-path')
+parser.add_argument('--binary')
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,1329 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''Utilities for consolidating the WPT reports produced by each "chunk" of a
+test run into a single, gzip-compressed report. These are shared by the
+scripts which operate on results on the build master.'''
+
+import array
+import collections
+import contextlib
+import fcntl
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import re
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# The size of the blocks read from disk by the streaming tokenizer. This value
+# only influences performance: results which exceed this size are read in
+# successively larger blocks.
+STREAM_BLOCK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# The maximum size of the strings generated when copying results from a
+# report without decoding them.
+SPLICE_BLOCK_SIZE = 1024 * 1024
+DECODER = json.JSONDecoder()
+# A decoder which verifies the syntax of its input without retaining any of
+# the objects it describes.
+VALIDATOR = json.JSONDecoder(object_pairs_hook=lambda pairs: None)
+# The amount of uncompressed data in each block of the report when it is
+# compressed by multiple threads.
+COMPRESSION_BLOCK_SIZE = 1024 * 1024
+# Test IDs are indexed as 64-bit hashes (stored in arrays rather than as
+# individual objects) so that duplicate results may be detected across every
+# chunk of a run without retaining the IDs themselves. The width of the "L"
+# typecode depends on the platform (it is 64 bits wide on 64-bit Linux and
+# macOS), so "Q" is used where "L" is narrower. Indexes are written to disk
+# (see `fold_chunk`), so their width must not vary.
+HASH_TYPECODE = 'L' if array.array('L').itemsize == 8 else 'Q'
+assert array.array(HASH_TYPECODE).itemsize == 8
+HASH_MASK = (1 << 64) - 1
+# The treatment of results which share a test ID with an earlier result
+# (according to the order of the chunks): "fail" (the default) rejects the
+# results set, "keep-first" discards all but the earliest result for each test
+# and "keep-last" discards all but the latest.
+DUPLICATE_POLICIES = ('fail', 'keep-first', 'keep-last')
+# The default amount of serialized results which may be held in memory while
+# sorting a results file. Results files which exceed this size are sorted in
+# several runs.
+SORT_BUFFER_SIZE = 64 * 1024 * 1024
+
+
+def write_report(filename, raw_results_files, no_timestamps,
+                 run_info_overrides, read_chunk, jobs=1, compression_level=9,
+                 compression_threads=1, duplicate_policy='fail',
+                 read_results=None, sort_buffer_size=SORT_BUFFER_SIZE,
+                 test_ids=None):
+    '''Write a gzip-compressed report describing the results in all of the
+    given results files. By default, results appear in the order of the
+    files. If `read_results` (one of `result_readers`) is specified, the
+    results are instead sorted by test ID. If the test IDs of every results
+    file are already known (e.g. from the files' summaries), they may be
+    specified as `test_ids` (one sequence for each file).'''
+    discards = find_discards(raw_results_files, duplicate_policy, jobs,
+                             test_ids)
+
+    if read_results:
+        chunks = read_chunks_sorted(raw_results_files, read_results, jobs,
+                                    discards, sort_buffer_size)
+    elif jobs > 1:
+        chunks = read_chunks_parallel(raw_results_files, read_chunk, jobs,
+                                      discards)
+    else:
+        chunks = read_chunks(raw_results_files, read_chunk, discards)
+
+    if compression_threads > 1:
+        output = ParallelGzipFile(filename, compression_level,
+                                  compression_threads)
+    else:
+        output = gzip.open(filename, 'w', compression_level)
+
+    with output as handle:
+        metadata = None
+
+        handle.write('{"results":\n')
+
+        for data in consolidate(chunks, no_timestamps):
+            if isinstance(data, str):
+                handle.write(data)
+            else:
+                metadata = data
+
+        handle.write(',\n%s}\n' % (
+            serialize_metadata(metadata, run_info_overrides,
+                               sort_keys=bool(read_results))
+        ))
+
+
+def serialize_metadata(metadata, run_info_overrides, sort_keys=False):
+    '''Serialize the top-level values of the report. The keys of `run_info`
+    are sorted only if `sort_keys` is specified (i.e. when the results are
+    sorted), so that the default output is unchanged.'''
+    if run_info_overrides:
+        metadata['run_info'].update(run_info_overrides)
+
+    serialized_metadata = '"run_info":{}'.format(
+        json.dumps(metadata['run_info'], sort_keys=sort_keys)
+    )
+    if (metadata['time_start'] != float('inf')
+            and metadata['time_end'] != 0):
+        serialized_metadata += (
+            ', "time_start":{}, "time_end":{}'.format(
+                metadata['time_start'], metadata['time_end']
+            )
+        )
+
+    return serialized_metadata
+
+
+def gzip_header():
+    # Magic number, compression method ("deflate"), flags (none),
+    # modification time, extra flags and operating system ("unknown")
+    return '\037\213\010\000%s\000\377' % (
+        struct.pack('<L', long(time.time()))
+    )
+
+
+def gzip_trailer(crc, size):
+    return struct.pack('<LL', crc & 0xffffffffL, size & 0xffffffffL)
+
+
+class ParallelGzipFile(object):
+    '''A write-only gzip file whose content is compressed in independent
+    blocks by a pool of threads (the `zlib` module releases the global
+    interpreter lock while compressing). Each block is terminated with a
+    "sync flush" so that the compressed blocks may be concatenated to form a
+    single, standard gzip member.'''
+
+    def __init__(self, filename, compresslevel, threads,
+                 block_size=COMPRESSION_BLOCK_SIZE):
+        self.fileobj = open(filename, 'wb')
+        self.compresslevel = compresslevel
+        self.block_size = block_size
+        self.pool = multiprocessing.pool.ThreadPool(threads)
+        # Limit the number of blocks held in memory while awaiting
+        # compression.
+        self.max_pending = threads * 2
+        self.pending = collections.deque()
+        self.buffer = []
+        self.buffered = 0
+        self.crc = zlib.crc32('')
+        self.size = 0
+
+        self.fileobj.write(gzip_header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.terminate()
+            self.fileobj.close()
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+
+        if self.buffered >= self.block_size:
+            self.submit()
+
+    def submit(self):
+        block = ''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        self.crc = zlib.crc32(block, self.crc)
+        self.size += len(block)
+
+        self.pending.append(
+            self.pool.apply_async(compress_block,
+                                  (block, self.compresslevel))
+        )
+
+        while len(self.pending) > self.max_pending:
+            self.fileobj.write(self.pending.popleft().get())
+
+    def close(self):
+        if self.buffered:
+            self.submit()
+
+        while self.pending:
+            self.fileobj.write(self.pending.popleft().get())
+
+        self.pool.close()
+        self.pool.join()
+
+        # An empty final block terminates the "deflate" stream.
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED,
+                                      -zlib.MAX_WBITS)
+        self.fileobj.write(compressor.flush(zlib.Z_FINISH))
+        self.fileobj.write(gzip_trailer(self.crc, self.size))
+        self.fileobj.close()
+
+
+def compress_block(block, compresslevel):
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED,
+                                  -zlib.MAX_WBITS)
+
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def chunk_sort_key(filename):
+    match = re.match(r'^(\d+)_of_\d+\.json$', os.path.basename(filename))
+
+    if match:
+        return (0, int(match.group(1)), filename)
+
+    return (1, 0, filename)
+
+
+def read_chunks(raw_results_files, read_chunk, discards={}):
+    '''Generate a pair for each results file: a dictionary that will describe
+    the file's top-level values and an iterable for the serialized form of its
+    results. The dictionary is populated as the iterable is consumed.
+    `discards` maps the index of a results file to the positions of the
+    results which should be omitted from it.'''
+    for index, filename in enumerate(raw_results_files):
+        data = {}
+
+        yield data, read_chunk_discarding(filename, data, read_chunk,
+                                          discards.get(index))
+
+
+def read_chunk_discarding(filename, data, read_chunk, discard):
+    # Individual results can only be omitted by a reader which decodes them
+    # one at a time.
+    if discard:
+        return read_chunk_stream(filename, data, discard)
+
+    return read_chunk(filename, data)
+
+
+def read_chunks_parallel(raw_results_files, read_chunk, jobs, discards={}):
+    '''Generate the same sequence as `read_chunks`, but read and serialize the
+    results files concurrently in a pool of worker processes. Each worker
+    writes the serialized results to a temporary file so that the results are
+    not retained in memory while preceding chunks are consumed.'''
+    directory = tempfile.mkdtemp()
+    pool = multiprocessing.Pool(jobs)
+
+    try:
+        work = [
+            (filename, read_chunk, discards.get(index), directory)
+            for index, filename in enumerate(raw_results_files)
+        ]
+
+        for data, fragment_file in pool.imap(serialize_chunk, work):
+            yield data, read_fragment(fragment_file)
+
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(directory)
+
+
+def serialize_chunk(work):
+    filename, read_chunk, discard, directory = work
+    data = {}
+    fd, fragment_file = tempfile.mkstemp(dir=directory)
+
+    with os.fdopen(fd, 'w') as handle:
+        for text in read_chunk_discarding(filename, data, read_chunk,
+                                          discard):
+            handle.write(text)
+
+    return data, fragment_file
+
+
+def read_fragment(fragment_file):
+    with open(fragment_file) as handle:
+        for text in iter(lambda: handle.read(SPLICE_BLOCK_SIZE), ''):
+            yield text
+
+    os.remove(fragment_file)
+
+
+def consolidate(chunks, no_timestamps):
+    metadata = {
+        'time_start': float('inf'),
+        'time_end': 0,
+        'run_info': None
+    }
+    emitted_result = False
+
+    yield '['
+
+    for data, fragments in chunks:
+        # The fragments describe the serialized form of the chunk's results
+        # as a comma-separated sequence, possibly split across many strings.
+        separator = ',' if emitted_result else ''
+
+        for text in fragments:
+            yield separator + text
+            separator = ''
+            emitted_result = True
+
+        assert 'run_info' in data
+        metadata['run_info'] = data['run_info']
+
+        if no_timestamps:
+            assert 'time_start' not in data
+            assert 'time_end' not in data
+        else:
+            assert 'time_start' in data
+            assert 'time_end' in data
+            metadata['time_start'] = min(data.get('time_start', float('inf')),
+                                         metadata['time_start'])
+            metadata['time_end'] = max(data.get('time_end', 0),
+                                       metadata['time_end'])
+
+    yield ']'
+
+    assert isinstance(metadata['run_info'], object)
+    yield metadata
+
+
+def read_chunk_load(filename, data):
+    '''Decode an entire WPT report in memory and generate the serialized form
+    of each of its results.'''
+    for index, (_, text) in enumerate(read_results_load(filename, data)):
+        yield (',' if index else '') + text
+
+
+def read_chunk_stream(filename, data, discard=()):
+    '''Generate the serialized form of each result in a WPT report without
+    decoding the document as a whole. Memory consumption is bounded by the
+    size of the largest individual result, and the generated text is
+    identical to that produced by `read_chunk_load`. Results whose positions
+    are included in `discard` are omitted.'''
+    separator = ''
+
+    for position, (_, text) in enumerate(read_results_stream(filename, data)):
+        if position not in discard:
+            yield separator + text
+            separator = ','
+
+
+def read_chunk_splice(filename, data):
+    '''Copy the content of a WPT report's `results` array directly from the
+    input file, decoding only the report's remaining top-level values. The
+    results are validated without being retained (see `scan_report_file`)
+    before any are copied, and the input is read in blocks, so memory
+    consumption does not depend on the size of the file. Reports which
+    cannot be processed in this way are read with `read_chunk_load`
+    instead.'''
+    try:
+        with open(filename) as handle:
+            members, start, end = scan_report_file(handle)
+    except ValueError as error:
+        logger.warn(
+            'Unable to splice results from %s (%s). Decoding in full.',
+            filename, error
+        )
+
+        for fragment in read_chunk_load(filename, data):
+            yield fragment
+
+        return
+
+    data.update(members)
+
+    with open(filename) as handle:
+        handle.seek(start)
+        remaining = end - start
+
+        while remaining:
+            block = handle.read(min(remaining, SPLICE_BLOCK_SIZE))
+
+            if not block:
+                raise IOError('%s changed while splicing results' % filename)
+
+            yield block
+            remaining -= len(block)
+
+
+def scan_report_file(handle):
+    '''Equivalent to `scan_report`, but for a report which is read
+    incrementally from an open file. The returned offsets are positions
+    within the file.'''
+    tokenizer = ReportTokenizer(handle, result_decoder=VALIDATOR)
+    members = {}
+    found_results = False
+
+    for event, value in tokenizer:
+        if event == 'results':
+            found_results = True
+        elif event != 'result':
+            members[event] = value
+
+    if not found_results:
+        raise ValueError('Report does not define results')
+
+    return members, tokenizer.results_start, tokenizer.results_end
+
+
+def scan_report(text):
+    '''Locate the content of the `results` array within the text of a WPT
+    report. Returns a tuple describing the decoded values of the remaining
+    top-level members and the offsets of the first and last characters of the
+    array's content (the offsets are equal if the array is empty).'''
+    members = {}
+    span = None
+    index = skip_whitespace(text, 0)
+
+    if text[index:index + 1] != '{':
+        raise ValueError('Expected object at offset %s' % index)
+
+    index = skip_whitespace(text, index + 1)
+
+    if text[index:index + 1] == '}':
+        index += 1
+    else:
+        while True:
+            name, index = DECODER.raw_decode(text, index)
+
+            if not isinstance(name, basestring):
+                raise ValueError('Expected member name at offset %s' % index)
+
+            index = skip_whitespace(text, index)
+
+            if text[index:index + 1] != ':':
+                raise ValueError('Expected ":" at offset %s' % index)
+
+            index = skip_whitespace(text, index + 1)
+
+            if name == 'results':
+                if text[index:index + 1] != '[':
+                    raise ValueError('Expected array at offset %s' % index)
+
+                results, end = VALIDATOR.raw_decode(text, index)
+
+                if len(results) == 0:
+                    span = (index, index)
+                else:
+                    span = (index + 1, end - 1)
+
+                index = end
+            else:
+                members[name], index = DECODER.raw_decode(text, index)
+
+            index = skip_whitespace(text, index)
+            delimiter = text[index:index + 1]
+            index += 1
+
+            if delimiter == '}':
+                break
+            elif delimiter != ',':
+                raise ValueError('Expected "," or "}" at offset %s' % index)
+
+            index = skip_whitespace(text, index)
+
+    if skip_whitespace(text, index) != len(text):
+        raise ValueError('Extra data at offset %s' % index)
+
+    if span is None:
+        raise ValueError('Report does not define results')
+
+    return members, span[0], span[1]
+
+
+def skip_whitespace(text, index):
+    return WHITESPACE.match(text, index).end()
+
+
+class ReportTokenizer(object):
+    '''Incremental reader for the top-level structure of a WPT report. The
+    input is read in blocks and decoded one value at a time, producing a
+    sequence of `(event, value)` pairs:
+
+    - `('results', None)` when the `results` array is opened
+    - `('result', result)` for each element of the `results` array
+    - `(name, value)` for every other top-level member
+
+    The elements of the `results` array are decoded with `result_decoder`
+    (by default, the same decoder as every other value). Once the array has
+    been read, the offsets of the first and last characters of its content
+    are available as `results_start` and `results_end` (the offsets are
+    equal if the array is empty).'''
+
+    def __init__(self, handle, block_size=STREAM_BLOCK_SIZE, decoder=DECODER,
+                 result_decoder=None):
+        self.handle = handle
+        self.block_size = block_size
+        self.buffer = ''
+        self.index = 0
+        self.eof = False
+        self.decoder = decoder
+        self.result_decoder = result_decoder or decoder
+        self.results_start = None
+        self.results_end = None
+
+    def __iter__(self):
+        self.expect('{')
+
+        if self.peek() == '}':
+            self.index += 1
+        else:
+            while True:
+                name = self.value()
+
+                if not isinstance(name, basestring):
+                    raise ValueError('Expected member name at offset %s' % (
+                        self.offset()
+                    ))
+
+                self.expect(':')
+
+                if name == 'results':
+                    for event in self.results():
+                        yield event
+                else:
+                    yield name, self.value()
+
+                if self.expect(',}') == '}':
+                    break
+
+        if self.peek() != '':
+            raise ValueError('Extra data at offset %s' % self.offset())
+
+    def results(self):
+        self.expect('[')
+        start = self.offset()
+        yield 'results', None
+
+        if self.peek() == ']':
+            self.index += 1
+            self.results_start = self.results_end = start
+            return
+
+        while True:
+            yield 'result', self.value(self.result_decoder)
+
+            if self.expect(',]') == ']':
+                self.results_start = start
+                self.results_end = self.offset() - 1
+                return
+
+    def offset(self):
+        return self.handle.tell() - len(self.buffer) + self.index
+
+    def read(self, size):
+        '''Extend the buffer with (at least) the given number of bytes,
+        discarding any content which has already been consumed. Returns
+        `False` if the end of the input has been reached.'''
+        data = self.handle.read(size)
+
+        if not data:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.index:] + data
+        self.index = 0
+
+        return True
+
+    def peek(self):
+        '''Return the next non-whitespace character without consuming it (or
+        the empty string if the input has been exhausted).'''
+        while True:
+            self.index = WHITESPACE.match(self.buffer, self.index).end()
+
+            if self.index < len(self.buffer):
+                return self.buffer[self.index]
+
+            if not self.read(self.block_size):
+                return ''
+
+    def expect(self, characters):
+        character = self.peek()
+
+        if character == '' or character not in characters:
+            raise ValueError('Expected one of "%s" at offset %s' % (
+                characters, self.offset()
+            ))
+
+        self.index += 1
+
+        return character
+
+    def value(self, decoder=None):
+        decoder = decoder or self.decoder
+        self.peek()
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.index)
+            except ValueError:
+                # The value may be incomplete. Read enough additional data to
+                # double the size of the unconsumed buffer so that large
+                # values are not decoded an excessive number of times.
+                size = max(self.block_size, len(self.buffer) - self.index)
+
+                if not self.read(size):
+                    raise
+
+                continue
+
+            # A number at the very end of the buffer may be truncated.
+            if end == len(self.buffer) and self.read(self.block_size):
+                continue
+
+            self.index = end
+
+            return value
+
+
+chunk_readers = {
+    'load': read_chunk_load,
+    'splice': read_chunk_splice,
+    'stream': read_chunk_stream
+}
+
+
+# Result readers
+#
+# Counterparts to the chunk readers which generate a `(test, text)` pair for
+# each individual result, where `text` is the result's serialized form.
+
+
+def read_results_load(filename, data):
+    with open(filename) as handle:
+        report = json.load(handle)
+
+    assert 'results' in report
+    assert isinstance(report['results'], list)
+
+    results = report.pop('results')
+    data.update(report)
+
+    for result in results:
+        yield result.get('test'), json.dumps(result)
+
+
+def read_results_stream(filename, data):
+    found_results = False
+
+    with open(filename) as handle:
+        for event, value in ReportTokenizer(handle):
+            if event == 'result':
+                yield value.get('test'), json.dumps(value)
+            elif event == 'results':
+                found_results = True
+            else:
+                data[event] = value
+
+    assert found_results
+
+
+def read_results_splice(filename, data):
+    '''Generate the text of each result as it appears in the input file.
+    Only the test IDs of the results are decoded.'''
+    try:
+        with open(filename) as handle:
+            text = handle.read()
+
+        members, start, end = scan_report(text)
+    except ValueError as error:
+        logger.warn(
+            'Unable to splice results from %s (%s). Decoding in full.',
+            filename, error
+        )
+
+        for pair in read_results_load(filename, data):
+            yield pair
+
+        return
+
+    data.update(members)
+    index = skip_whitespace(text, start)
+
+    while index < end:
+        test, result_end = TEST_ID_DECODER.raw_decode(text, index)
+
+        yield test, text[index:result_end]
+
+        # The syntax of the array has already been verified by
+        # `scan_report`, so the next non-whitespace character is either a
+        # comma or the end of the array.
+        index = skip_whitespace(text, result_end)
+
+        if index < end:
+            index = skip_whitespace(text, index + 1)
+
+
+result_readers = {
+    'load': read_results_load,
+    'splice': read_results_splice,
+    'stream': read_results_stream
+}
+
+
+def map_jobs(function, work, jobs):
+    '''Apply a function to every item of work, using a pool of worker
+    processes if more than one job is requested.'''
+    if jobs <= 1:
+        return [function(item) for item in work]
+
+    pool = multiprocessing.Pool(jobs)
+
+    try:
+        results = pool.map(function, work)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return results
+
+
+def find_discards(raw_results_files, policy, jobs=1, test_ids=None):
+    '''Detect results which share a test ID, both within and across the
+    given results files, and apply the duplicate policy. Returns a dictionary
+    mapping the index of each affected results file to the positions of the
+    results which should be discarded from it. The results files are read
+    only if their test IDs are not specified.'''
+    if test_ids is None:
+        indexes = map_jobs(index_chunk, raw_results_files, jobs)
+    else:
+        indexes = [
+            array.array(HASH_TYPECODE, (hash_test_id(test) for test in tests))
+            for tests in test_ids
+        ]
+
+    duplicates = find_duplicate_hashes(indexes)
+
+    if not duplicates:
+        return {}
+
+    occurrences = locate_duplicates(raw_results_files, indexes, duplicates,
+                                    test_ids)
+
+    if not occurrences:
+        return {}
+
+    if policy == 'fail':
+        raise ValueError('Found duplicate results for %s tests: %s' % (
+            len(occurrences), ', '.join(sorted(occurrences))
+        ))
+
+    discards = collections.defaultdict(set)
+
+    for test, locations in sorted(occurrences.items()):
+        if policy == 'keep-first':
+            kept = locations[0]
+        else:
+            kept = locations[-1]
+
+        logger.warn('Found %s results for %s. Keeping the result from %s.',
+                    len(locations), test, raw_results_files[kept[0]])
+
+        for chunk, position in locations:
+            if (chunk, position) != kept:
+                discards[chunk].add(position)
+
+    logger.warn('Discarding %s duplicate results for %s tests.',
+                sum(len(positions) for positions in discards.values()),
+                len(occurrences))
+
+    return dict(discards)
+
+
+def hash_test_id(test):
+    if isinstance(test, unicode):
+        test = test.encode('utf-8')
+
+    return struct.unpack('<Q', hashlib.md5(test).digest()[:8])[0] & HASH_MASK
+
+
+def reduce_to_test_id(pairs):
+    for name, value in pairs:
+        if name == 'test':
+            return value
+
+
+# A decoder which reduces each result to its test ID without retaining the
+# values of any other members.
+TEST_ID_DECODER = json.JSONDecoder(object_pairs_hook=reduce_to_test_id)
+
+
+def read_test_ids(filename):
+    '''Generate the test ID of each result in a WPT report, in order.'''
+    with open(filename) as handle:
+        tokenizer = ReportTokenizer(handle, decoder=TEST_ID_DECODER)
+
+        for event, value in tokenizer:
+            if event == 'result':
+                assert isinstance(value, basestring)
+
+                yield value
+
+
+def index_chunk(filename):
+    '''Create an array describing the hash of each result's test ID in the
+    order the results appear in the given WPT report.'''
+    return array.array(
+        HASH_TYPECODE, (hash_test_id(test) for test in read_test_ids(filename))
+    )
+
+
+def find_duplicate_hashes(indexes):
+    '''Identify the hashes which appear more than once in the given indexes.
+    Each index is sorted independently and the sorted sequences are merged,
+    so duplicates are detected in a single pass using memory proportional to
+    the size of the indexes themselves.'''
+    duplicates = set()
+    previous = None
+    sorted_indexes = [
+        array.array(HASH_TYPECODE, sorted(index)) for index in indexes
+    ]
+
+    for value in heapq.merge(*sorted_indexes):
+        if value == previous:
+            duplicates.add(value)
+
+        previous = value
+
+    return duplicates
+
+
+def locate_duplicates(raw_results_files, indexes, duplicates, test_ids=None):
+    '''Resolve the test IDs of the results whose hashes are duplicated.
+    Returns a dictionary mapping each test ID which is truly duplicated (i.e.
+    disregarding hash collisions) to the `(chunk, position)` locations of its
+    results, in order.'''
+    occurrences = collections.defaultdict(list)
+
+    for chunk, filename in enumerate(raw_results_files):
+        positions = set(
+            position for position, value in enumerate(indexes[chunk])
+            if value in duplicates
+        )
+
+        if not positions:
+            continue
+
+        if test_ids is None:
+            tests = read_test_ids(filename)
+        else:
+            tests = test_ids[chunk]
+
+        for position, test in enumerate(tests):
+            if position in positions:
+                occurrences[test].append((chunk, position))
+
+    return dict(
+        (test, locations) for test, locations in occurrences.items()
+        if len(locations) > 1
+    )
+
+
+# Sorted consolidation
+#
+# Results may be consolidated in order of their test IDs (rather than in order
+# of the results files), producing a report which does not depend on the way
+# the tests were distributed between chunks. Each results file is sorted
+# independently into one or more "runs" on disk. A results file whose
+# serialized results exceed the memory budget is split across several runs.
+# The runs of every results file are then merged, reading one result from
+# each run at a time.
+#
+# Each entry of a run consists of a header line (the JSON-encoded test ID and
+# the length of the result's text, separated by a tab character) followed by
+# the text itself.
+
+
+def read_chunks_sorted(raw_results_files, read_results, jobs=1, discards={},
+                       sort_buffer_size=SORT_BUFFER_SIZE):
+    '''Generate the same sequence as `read_chunks` but with every result
+    sorted by test ID. All of the results are attributed to the final results
+    file.'''
+    directory = tempfile.mkdtemp()
+
+    try:
+        # The runs of files whose results fit in a share of the buffer are
+        # held in memory rather than written to disk (see `sort_chunk`).
+        retain_size = sort_buffer_size // max(len(raw_results_files), 1)
+        work = [
+            (filename, read_results, discards.get(index), directory,
+             sort_buffer_size, retain_size)
+            for index, filename in enumerate(raw_results_files)
+        ]
+        sorted_chunks = map_jobs(sort_chunk, work, jobs)
+        runs = [run for _, chunk_runs in sorted_chunks for run in chunk_runs]
+
+        for index, (data, _) in enumerate(sorted_chunks):
+            if index == len(sorted_chunks) - 1:
+                yield data, merge_runs(runs)
+            else:
+                yield data, []
+    finally:
+        shutil.rmtree(directory)
+
+
+def sort_chunk(work):
+    '''Sort the results of a single results file into runs. Returns the
+    file's top-level values and the runs. Each run is the name of a file
+    (see `write_run`) unless the file's results fit in a single run of at most
+    `retain_size`, which is returned as a sorted list of entries rather than
+    written to disk.'''
+    (filename, read_results, discard, directory, sort_buffer_size,
+     retain_size) = work
+    data = {}
+    runs = []
+    entries = []
+    size = 0
+
+    for position, (test, text) in enumerate(read_results(filename, data)):
+        if discard and position in discard:
+            continue
+
+        entries.append((test, text))
+        size += len(text)
+
+        if size > sort_buffer_size:
+            runs.append(write_run(directory, entries))
+            entries = []
+            size = 0
+
+    if entries:
+        if runs or size > retain_size:
+            runs.append(write_run(directory, entries))
+        else:
+            entries.sort(key=lambda entry: entry[0])
+            runs.append(entries)
+
+    return data, runs
+
+
+def write_run(directory, entries):
+    entries.sort(key=lambda entry: entry[0])
+    fd, run_file = tempfile.mkstemp(dir=directory)
+
+    with os.fdopen(fd, 'w') as handle:
+        for test, text in entries:
+            handle.write('%s\t%s\n' % (json.dumps(test), len(text)))
+            handle.write(text)
+
+    return run_file
+
+
+def read_run(run_file):
+    if isinstance(run_file, list):
+        for entry in run_file:
+            yield entry
+
+        return
+
+    with open(run_file) as handle:
+        for header in iter(handle.readline, ''):
+            test, length = header.rsplit('\t', 1)
+
+            yield json.loads(test), handle.read(int(length))
+
+    os.remove(run_file)
+
+
+def merge_runs(runs):
+    '''Generate the serialized results of every run in order of test ID, as
+    a comma-separated sequence.'''
+    separator = ''
+
+    for _, text in heapq.merge(*[read_run(run) for run in runs]):
+        yield separator + text
+        separator = ','
+
+
+# Incremental consolidation
+#
+# Rather than consolidating every results file once the final chunk of a run
+# has completed, each results file may be "folded" into a partially
+# consolidated report as soon as it is available. The partial report is
+# maintained in a directory containing:
+#
+# - `results.deflate`: the "deflate"-compressed serialized results of every
+#   folded chunk (in order of arrival). Each chunk is compressed as an
+#   independent, byte-aligned segment so that the segments may be emitted in
+#   any order.
+# - `journal.json`: the length of the valid portion of `results.deflate`, the
+#   compression level of its segments and, for every folded chunk, the
+#   location, CRC-32 checksum and uncompressed size of its segment along with
+#   its top-level values and file metadata
+# - `<name>.index`: the hashes of the test IDs of each folded chunk, used to
+#   detect duplicate results without reading the results files
+# - `lock`: a file used to serialize access by concurrent processes
+#
+# The journal is replaced atomically after the compressed data has been
+# written to disk, so a process which is interrupted while folding a chunk
+# leaves the previous (valid) state in place.
+FOLD_BODY = 'results.deflate'
+FOLD_JOURNAL = 'journal.json'
+FOLD_LOCK = 'lock'
+# Incremented whenever the format of the partial report changes. A partial
+# report written in another format is discarded.
+FOLD_VERSION = 2
+REPORT_OPENING = '{"results":\n['
+
+
+@contextlib.contextmanager
+def fold_lock(directory, operation=fcntl.LOCK_EX):
+    with open(os.path.join(directory, FOLD_LOCK), 'a') as handle:
+        fcntl.flock(handle, operation)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def read_journal(directory):
+    try:
+        with open(os.path.join(directory, FOLD_JOURNAL)) as handle:
+            return json.load(handle)
+    except IOError:
+        return None
+
+
+def write_journal(directory, journal):
+    filename = os.path.join(directory, FOLD_JOURNAL)
+    temp_filename = filename + '.tmp'
+
+    with open(temp_filename, 'w') as handle:
+        json.dump(journal, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+    os.rename(temp_filename, filename)
+
+
+def file_signature(filename):
+    stat = os.stat(filename)
+
+    return [stat.st_size, stat.st_mtime]
+
+
+def index_filename(directory, name):
+    return os.path.join(directory, name + '.index')
+
+
+def read_index(directory, name):
+    filename = index_filename(directory, name)
+    index = array.array(HASH_TYPECODE)
+
+    with open(filename, 'rb') as handle:
+        index.fromfile(handle, os.path.getsize(filename) // index.itemsize)
+
+    return index
+
+
+def gf2_matrix_times(matrix, vector):
+    total = 0
+    index = 0
+
+    while vector:
+        if vector & 1:
+            total ^= matrix[index]
+        vector >>= 1
+        index += 1
+
+    return total
+
+
+def gf2_matrix_square(matrix):
+    return [gf2_matrix_times(matrix, row) for row in matrix]
+
+
+def crc32_combine(crc1, crc2, length2):
+    '''Compute the CRC-32 checksum of the concatenation of two strings from
+    the checksum of each string and the length of the second (a port of
+    zlib's `crc32_combine`, which Python 2 does not expose).'''
+    crc1 &= 0xffffffffL
+    crc2 &= 0xffffffffL
+
+    if length2 <= 0:
+        return crc1
+
+    # The operator which appends a single zero bit to the checksum
+    odd = [0xedb88320L] + [1 << index for index in range(31)]
+    # The operators which append two and then four zero bits
+    even = gf2_matrix_square(odd)
+    odd = gf2_matrix_square(even)
+
+    # Apply the operator for each set bit of `length2` (in bytes), squaring
+    # the operator for each successive bit.
+    while True:
+        even = gf2_matrix_square(odd)
+
+        if length2 & 1:
+            crc1 = gf2_matrix_times(even, crc1)
+        length2 >>= 1
+
+        if not length2:
+            break
+
+        odd = gf2_matrix_square(even)
+
+        if length2 & 1:
+            crc1 = gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+
+        if not length2:
+            break
+
+    return crc1 ^ crc2
+
+
+def fold_chunk(directory, filename, read_chunk, compression_level=9):
+    '''Append the results of a single results file to the partially
+    consolidated report in the given directory. Returns `False` if the file
+    has already been folded.'''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    name = os.path.basename(filename)
+    body_filename = os.path.join(directory, FOLD_BODY)
+
+    with fold_lock(directory):
+        journal = read_journal(directory)
+
+        if journal is None or journal.get('version') != FOLD_VERSION:
+            with open(body_filename, 'wb') as handle:
+                handle.flush()
+                os.fsync(handle.fileno())
+
+            journal = {
+                'version': FOLD_VERSION,
+                'length': 0,
+                'compression_level': compression_level,
+                'valid': True,
+                'chunks': {}
+            }
+            write_journal(directory, journal)
+
+        if name in journal['chunks']:
+            # A results file which changes after it has been folded (e.g.
+            # because the chunk was manually re-run) cannot be removed from
+            # the partial report.
+            if journal['chunks'][name]['signature'] != file_signature(
+                    filename):
+                logger.warn('%s has changed since it was folded. The '
+                            'partially consolidated report will not be '
+                            'used.', name)
+                journal['valid'] = False
+                write_journal(directory, journal)
+
+            return False
+
+        if compression_level != journal['compression_level']:
+            logger.warn('The partially consolidated report is compressed at '
+                        'level %s (rather than %s). The partial report will '
+                        'not be used.', journal['compression_level'],
+                        compression_level)
+            journal['valid'] = False
+            write_journal(directory, journal)
+
+            return False
+
+        signature = file_signature(filename)
+        data = {}
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED,
+                                      -zlib.MAX_WBITS)
+        crc = zlib.crc32('')
+        size = 0
+        offset = journal['length']
+
+        with open(body_filename, 'r+b') as handle:
+            # Discard any data written by an interrupted process.
+            handle.truncate(offset)
+            handle.seek(offset)
+
+            for text in read_chunk(filename, data):
+                crc = zlib.crc32(text, crc)
+                size += len(text)
+                handle.write(compressor.compress(text))
+
+            handle.write(compressor.flush(zlib.Z_SYNC_FLUSH))
+            handle.flush()
+            os.fsync(handle.fileno())
+
+            length = handle.tell()
+
+        with open(index_filename(directory, name), 'wb') as handle:
+            index_chunk(filename).tofile(handle)
+
+        journal['length'] = length
+        journal['chunks'][name] = {
+            'data': data,
+            'signature': signature,
+            'offset': offset,
+            'length': length - offset,
+            'crc': crc & 0xffffffffL,
+            'size': size
+        }
+        write_journal(directory, journal)
+
+    return True
+
+
+def write_folded_report(filename, directory, raw_results_files,
+                        no_timestamps, run_info_overrides,
+                        compression_level=9):
+    '''Complete the partially consolidated report in the given directory,
+    writing the result to `filename` in gzip format. The results of each
+    chunk appear in the order of `raw_results_files` (regardless of the order
+    in which they were folded), and only the report's metadata (and the
+    separators between chunks) must be compressed. Returns `False` (without
+    writing) if the partial report does not describe exactly the given
+    results files in their current state, or if it was compressed at a level
+    other than `compression_level`.'''
+    if not os.path.isdir(directory):
+        return False
+
+    with fold_lock(directory, fcntl.LOCK_SH):
+        journal = read_journal(directory)
+
+        if (journal is None or journal.get('version') != FOLD_VERSION or
+                not journal['valid']):
+            return False
+
+        if journal['compression_level'] != compression_level:
+            logger.info('Partially consolidated report is compressed at '
+                        'level %s', journal['compression_level'])
+            return False
+
+        names = [os.path.basename(name) for name in raw_results_files]
+
+        if sorted(names) != sorted(journal['chunks'].keys()):
+            logger.info('Partially consolidated report describes %s of %s '
+                        'results files', len(journal['chunks']), len(names))
+            return False
+
+        for name, raw_results_file in zip(names, raw_results_files):
+            if (journal['chunks'][name]['signature'] !=
+                    file_signature(raw_results_file)):
+                logger.info('%s has changed since it was folded', name)
+                return False
+
+        # Duplicate results cannot be removed from the partial report, so
+        # they are handled by consolidating the results files directly.
+        try:
+            indexes = [read_index(directory, name) for name in names]
+        except IOError as error:
+            logger.info('Unable to read test ID index: %s', error)
+            return False
+
+        if find_duplicate_hashes(indexes):
+            logger.info('Partially consolidated report may include '
+                        'duplicate results')
+            return False
+
+        chunks = [(journal['chunks'][name]['data'], []) for name in names]
+
+        for metadata in consolidate(chunks, no_timestamps):
+            pass
+
+        closing = ']' + ',\n%s}\n' % (
+            serialize_metadata(metadata, run_info_overrides)
+        )
+        separator = compress_block(',', compression_level)
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED,
+                                      -zlib.MAX_WBITS)
+        crc = zlib.crc32(REPORT_OPENING)
+        size = len(REPORT_OPENING)
+        emitted_result = False
+
+        with open(filename, 'wb') as output:
+            output.write(gzip_header())
+            output.write(compress_block(REPORT_OPENING, compression_level))
+
+            with open(os.path.join(directory, FOLD_BODY), 'rb') as body:
+                for name in names:
+                    segment = journal['chunks'][name]
+
+                    # A chunk without results contributes nothing (not even
+                    # a separator).
+                    if not segment['size']:
+                        continue
+
+                    if emitted_result:
+                        output.write(separator)
+                        crc = zlib.crc32(',', crc)
+                        size += 1
+
+                    body.seek(segment['offset'])
+                    remaining = segment['length']
+
+                    while remaining:
+                        block = body.read(min(remaining, SPLICE_BLOCK_SIZE))
+
+                        if not block:
+                            raise IOError('Partially consolidated report is '
+                                          'truncated')
+
+                        output.write(block)
+                        remaining -= len(block)
+
+                    crc = crc32_combine(crc, segment['crc'], segment['size'])
+                    size += segment['size']
+                    emitted_result = True
+
+            output.write(compressor.compress(closing))
+            output.write(compressor.flush(zlib.Z_FINISH))
+            output.write(gzip_trailer(zlib.crc32(closing, crc),
+                                      size + len(closing)))
+
+    return True
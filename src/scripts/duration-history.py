@@ -0,0 +1,634 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import contextlib
+import fcntl
+import heapq
+import json
+import logging
+import os
+import posixpath
+import sys
+import time
+
+logger = logging.getLogger('duration-history')
+
+# The history directory contains an append-only file of records (one line for
+# each chunk of each run, describing the duration and status of its tests) and
+# an index of those records. Each line of the index identifies the platform,
+# revision and chunk of a record along with its location in the records file,
+# so that queries read only the records of the runs they concern.
+#
+# Only the most recently recorded runs of each platform are retained. Older
+# runs (and records which have been superseded) are removed by rewriting both
+# files (see `prune`).
+RECORDS = 'records.jsonl'
+INDEX = 'index.jsonl'
+LOCK = 'lock'
+# When planning chunks, a directory whose tests are expected to take longer
+# than this fraction of the duration of a single chunk is divided into its
+# subdirectories and test files, which may be assigned to different chunks.
+UNIT_FRACTION = 0.25
+
+
+def main(command, history, **kwargs):
+    '''Maintain and query the history of the duration of each test, as
+    recorded for every chunk of every run by `run-and-verify.py`.'''
+    logging.basicConfig(level='INFO',
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    if command == 'append':
+        append(history, **kwargs)
+        return
+
+    if command == 'plan':
+        plan(history, **kwargs)
+        return
+
+    if not os.path.isdir(history):
+        raise ValueError('No history found in %s' % history)
+
+    output_format = kwargs.pop('output_format')
+    rows = QUERIES[command](history, **kwargs)
+
+    if output_format == 'json':
+        json.dump(rows, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        return
+
+    for row in rows:
+        sys.stdout.write('\t'.join(str(value) for value in row) + '\n')
+
+
+@contextlib.contextmanager
+def history_lock(history, operation):
+    with open(os.path.join(history, LOCK), 'a') as handle:
+        # The history is inconsistent until an interrupted prune has been
+        # completed (or abandoned), which requires an exclusive lock.
+        if os.path.exists(os.path.join(history, INDEX + '.tmp')):
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            recover_prune(history)
+
+        fcntl.flock(handle, operation)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def append(history, platform, revision, chunk, durations_file, keep_runs):
+    '''Add the durations recorded for a single chunk of a run to the
+    history, removing all but the `keep_runs` most recently recorded runs of
+    each platform.'''
+    with open(durations_file) as handle:
+        durations = json.load(handle)
+
+    record = json.dumps({
+        'platform': platform,
+        'revision': revision,
+        'chunk': chunk,
+        'tests': durations['tests']
+    }, sort_keys=True, separators=(',', ':'))
+
+    if not os.path.isdir(history):
+        os.makedirs(history)
+
+    with history_lock(history, fcntl.LOCK_EX):
+        with open(os.path.join(history, RECORDS), 'ab') as handle:
+            handle.seek(0, os.SEEK_END)
+            offset = handle.tell()
+            handle.write(record + '\n')
+
+        # The index is written only once the record is complete, so an
+        # interrupted append leaves no reference to a partial record.
+        with open(os.path.join(history, INDEX), 'a') as handle:
+            handle.write(json.dumps({
+                'platform': platform,
+                'revision': revision,
+                'chunk': chunk,
+                'recorded': int(time.time()),
+                'offset': offset,
+                'length': len(record)
+            }, sort_keys=True) + '\n')
+
+        revisions, _ = read_index(history, platform)
+
+        if keep_runs and len(revisions) > keep_runs:
+            prune(history, keep_runs)
+
+
+def prune(history, keep_runs):
+    '''Rewrite the history so that it includes only the latest record of each
+    chunk of the `keep_runs` most recently recorded runs of each platform.
+    The caller must hold an exclusive lock on the history.
+
+    The rewritten records and index are written alongside the originals and
+    then renamed over them (the records first). If the process is
+    interrupted between the two renames, the prune is completed by the next
+    process to lock the history (see `recover_prune`).'''
+    records_file = os.path.join(history, RECORDS)
+    index_file = os.path.join(history, INDEX)
+    revisions = {}
+    latest = {}
+
+    with open(index_file) as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+
+            recorded = revisions.setdefault(entry['platform'], [])
+
+            if entry['revision'] not in recorded:
+                recorded.append(entry['revision'])
+
+            latest[(entry['platform'], entry['revision'],
+                    entry['chunk'])] = entry
+
+    retained = set(
+        (platform, revision)
+        for platform, recorded in revisions.items()
+        for revision in recorded[-keep_runs:]
+    )
+    entries = [
+        entry for (platform, revision, _), entry in latest.items()
+        if (platform, revision) in retained
+    ]
+    entries.sort(key=lambda entry: entry['offset'])
+
+    with open(records_file, 'rb') as source:
+        with open(records_file + '.tmp', 'wb') as records:
+            with open(index_file + '.tmp', 'w') as index:
+                for entry in entries:
+                    source.seek(entry['offset'])
+                    record = source.read(entry['length'])
+                    entry['offset'] = records.tell()
+                    records.write(record + '\n')
+                    index.write(json.dumps(entry, sort_keys=True) + '\n')
+
+                records.flush()
+                os.fsync(records.fileno())
+                index.flush()
+                os.fsync(index.fileno())
+
+    os.rename(records_file + '.tmp', records_file)
+    os.rename(index_file + '.tmp', index_file)
+
+    logger.info('Pruned the history to %s records of %s runs',
+                len(entries), len(retained))
+
+
+def recover_prune(history):
+    '''Complete a prune which was interrupted after the records were
+    replaced, or abandon one which was interrupted before. The caller must
+    hold an exclusive lock on the history.'''
+    records_temp = os.path.join(history, RECORDS + '.tmp')
+    index_temp = os.path.join(history, INDEX + '.tmp')
+
+    if not os.path.exists(index_temp):
+        return
+
+    if os.path.exists(records_temp):
+        os.remove(records_temp)
+        os.remove(index_temp)
+    else:
+        os.rename(index_temp, os.path.join(history, INDEX))
+
+
+def read_index(history, platform):
+    '''Return the revisions recorded for the given platform (in the order
+    they were first recorded) and the index entries of each revision's
+    chunks. A chunk which was recorded more than once is described by its
+    latest record.'''
+    revisions = []
+    entries = {}
+
+    try:
+        handle = open(os.path.join(history, INDEX))
+    except IOError:
+        return revisions, entries
+
+    with handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+
+            if entry['platform'] != platform:
+                continue
+
+            if entry['revision'] not in entries:
+                revisions.append(entry['revision'])
+                entries[entry['revision']] = {}
+
+            entries[entry['revision']][entry['chunk']] = entry
+
+    return revisions, entries
+
+
+def read_runs(history, platform, revisions=None):
+    '''Return the durations of every test of each of the given runs (by
+    default, the most recently recorded run).'''
+    with history_lock(history, fcntl.LOCK_SH):
+        recorded, entries = read_index(history, platform)
+        runs = []
+
+        if revisions is None:
+            revisions = recorded[-1:]
+
+        if not revisions:
+            return runs
+
+        with open(os.path.join(history, RECORDS), 'rb') as handle:
+            for revision in revisions:
+                if revision not in entries:
+                    raise ValueError('No durations recorded for %s at %s' % (
+                        platform, revision
+                    ))
+
+                tests = {}
+
+                for entry in sorted(entries[revision].values(),
+                                    key=lambda entry: entry['offset']):
+                    handle.seek(entry['offset'])
+                    tests.update(
+                        json.loads(handle.read(entry['length']))['tests']
+                    )
+
+                runs.append((revision, tests))
+
+    return runs
+
+
+def read_chunk_totals(history, platform, revision):
+    '''Return the total duration and number of tests of each chunk of a run
+    (by default, the most recently recorded run).'''
+    with history_lock(history, fcntl.LOCK_SH):
+        revisions, entries = read_index(history, platform)
+        revision = revision or (revisions[-1] if revisions else None)
+        totals = []
+
+        if revision not in entries:
+            return totals
+
+        with open(os.path.join(history, RECORDS), 'rb') as handle:
+            for chunk, entry in entries[revision].items():
+                handle.seek(entry['offset'])
+                tests = json.loads(handle.read(entry['length']))['tests']
+                totals.append((
+                    sum(duration for duration, _ in tests.values()),
+                    len(tests),
+                    chunk
+                ))
+
+    return totals
+
+
+def test_path(test):
+    return test.split('?')[0]
+
+
+def directory(test, depth):
+    parts = posixpath.dirname(test_path(test)).split('/')[1:]
+
+    return '/' + '/'.join(parts[:depth]) if depth else '/' + '/'.join(parts)
+
+
+def read_run(history, platform, revision):
+    runs = read_runs(history, platform, [revision] if revision else None)
+
+    return runs[0][1] if runs else {}
+
+
+def query_slowest(history, platform, revision, limit):
+    '''The slowest tests of a run.'''
+    tests = read_run(history, platform, revision)
+    rows = [
+        (duration, status, test)
+        for test, (duration, status) in tests.items()
+    ]
+
+    return sorted(rows, reverse=True)[:limit]
+
+
+def query_directories(history, platform, revision, depth, limit):
+    '''The total duration and number of tests of each directory of a run.'''
+    tests = read_run(history, platform, revision)
+    totals = {}
+
+    for test, (duration, _) in tests.items():
+        total = totals.setdefault(directory(test, depth), [0, 0])
+        total[0] += duration
+        total[1] += 1
+
+    rows = [
+        (duration, count, name)
+        for name, (duration, count) in totals.items()
+    ]
+
+    return sorted(rows, reverse=True)[:limit]
+
+
+def query_runs(history, platform, limit):
+    '''The total duration and number of tests of the most recent runs.'''
+    with history_lock(history, fcntl.LOCK_SH):
+        revisions, _ = read_index(history, platform)
+
+    rows = []
+
+    if not revisions:
+        return rows
+
+    for revision, tests in read_runs(history, platform, revisions[-limit:]):
+        rows.append((sum(duration for duration, _ in tests.values()),
+                     len(tests), revision))
+
+    return rows
+
+
+def query_drift(history, platform, runs, min_duration, limit):
+    '''The tests whose duration in the most recent run differs most from
+    their median duration in the preceding runs.'''
+    with history_lock(history, fcntl.LOCK_SH):
+        revisions, _ = read_index(history, platform)
+
+    if not revisions:
+        return []
+
+    history_runs = read_runs(history, platform, revisions[-runs - 1:])
+    _, latest = history_runs.pop()
+    rows = []
+
+    for test, (duration, _) in latest.items():
+        previous = sorted(
+            tests[test][0] for _, tests in history_runs if test in tests
+        )
+
+        if not previous:
+            continue
+
+        median = previous[len(previous) // 2]
+
+        if max(duration, median) < min_duration:
+            continue
+
+        rows.append((duration - median, duration, median, test))
+
+    return sorted(rows, key=lambda row: abs(row[0]), reverse=True)[:limit]
+
+
+def query_chunks(history, platform, revision, limit):
+    '''The total duration and number of tests of each chunk of a run. The
+    duration of the longest chunk determines the duration ("makespan") of the
+    run as a whole.'''
+    totals = read_chunk_totals(history, platform, revision)
+
+    return sorted(totals, reverse=True)[:limit]
+
+
+def plan(history, platform, total_chunks, runs, output):
+    '''Plan the division of tests between chunks for the next run, using the
+    median duration of each test in the most recent complete runs (i.e. those
+    for which every chunk was recorded). No plan is written if there is no
+    such run for the platform, in which case the WPT CLI's own chunking
+    should be used.'''
+    if os.path.isdir(history):
+        with history_lock(history, fcntl.LOCK_SH):
+            revisions, entries = read_index(history, platform)
+    else:
+        revisions, entries = [], {}
+
+    # The durations of a partial run (e.g. while the history is first being
+    # recorded) describe only some tests, and a plan derived from them would
+    # assign every other test to the remainder.
+    revisions = [
+        revision for revision in revisions
+        if is_complete(entries[revision].keys())
+    ]
+
+    if not revisions:
+        logger.info('No complete run recorded for %s; not planning chunks',
+                    platform)
+        return
+
+    samples = {}
+
+    for _, tests in read_runs(history, platform, revisions[-runs:]):
+        for test, (duration, _) in tests.items():
+            samples.setdefault(test, []).append(duration)
+
+    durations = dict(
+        (test, sorted(values)[len(values) // 2])
+        for test, values in samples.items()
+    )
+    chunk_plan = plan_chunks(durations, total_chunks)
+
+    if chunk_plan is None:
+        logger.info('Too few tests to plan %s chunks for %s; not planning '
+                    'chunks', total_chunks, platform)
+        return
+
+    previous = read_chunk_totals(history, platform, revisions[-1])
+
+    logger.info('Planned %s chunks for %s tests; expected makespan: %s '
+                'seconds', total_chunks, len(durations),
+                max(chunk['duration'] for chunk in chunk_plan['chunks']) //
+                1000)
+
+    if previous:
+        logger.info('Makespan of the most recent run: %s seconds (%s chunks)',
+                    max(previous)[0] // 1000, len(previous))
+
+    if os.path.dirname(output) and not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+
+    with open(output, 'w') as handle:
+        json.dump(chunk_plan, handle, sort_keys=True)
+
+
+def is_complete(chunks):
+    '''Determine whether the given chunk identifiers (e.g. "3_of_20")
+    describe every chunk of a run.'''
+    indexes = set()
+    totals = set()
+
+    for chunk in chunks:
+        try:
+            index, total = [int(part) for part in chunk.split('_of_')]
+        except ValueError:
+            return False
+
+        indexes.add(index)
+        totals.add(total)
+
+    return len(totals) == 1 and indexes == set(range(1, totals.pop() + 1))
+
+
+def plan_chunks(durations, total_chunks):
+    '''Divide tests between chunks such that the expected duration of each
+    chunk is as even as possible. Tests are assigned in units: whole
+    directories where possible, or otherwise the subdirectories and test
+    files of any directory whose tests take too long to share a chunk. Units
+    are assigned longest-first, each to the chunk with the least expected
+    duration.
+
+    Each chunk is described by the paths of its units (for use with the WPT
+    CLI's `--include-file` option). The chunk with the least expected
+    duration is designated the "remainder": rather than including its own
+    units, it excludes the units of every other chunk, so that tests which
+    have no recorded duration (e.g. new tests) are run by the remainder.
+
+    Every chunk other than the remainder is assigned at least one unit (an
+    empty list of tests would not restrict the tests run by the WPT CLI).
+    Returns `None` if there are too few units to do so.'''
+    root = {'duration': 0, 'directories': {}, 'files': {}}
+
+    for test, duration in durations.items():
+        parts = test_path(test).split('/')[1:]
+        node = root
+        node['duration'] += duration
+
+        for part in parts[:-1]:
+            node = node['directories'].setdefault(
+                part, {'duration': 0, 'directories': {}, 'files': {}}
+            )
+            node['duration'] += duration
+
+        node['files'][test_path(test)] = (
+            node['files'].get(test_path(test), 0) + duration
+        )
+
+    limit = root['duration'] / float(total_chunks) * UNIT_FRACTION
+    units = []
+
+    def divide(node, path):
+        if node is not root and node['duration'] <= limit:
+            units.append((node['duration'], path))
+            return
+
+        for name, child in node['directories'].items():
+            divide(child, path + name + '/')
+
+        for file_path, duration in node['files'].items():
+            units.append((duration, file_path))
+
+    divide(root, '/')
+
+    if len(units) < total_chunks - 1:
+        return None
+
+    chunks = [{'duration': 0, 'tests': []} for _ in range(total_chunks)]
+    # Ties (e.g. between chunks whose tests have no recorded duration) are
+    # broken in favor of the chunk with the fewest units, so no chunk is left
+    # empty while another is assigned several units.
+    loads = [(0, 0, index) for index in range(total_chunks)]
+
+    for duration, path in sorted(units, reverse=True):
+        load, count, index = heapq.heappop(loads)
+        chunks[index]['duration'] += duration
+        chunks[index]['tests'].append(path)
+        heapq.heappush(loads, (load + duration, count + 1, index))
+
+    for chunk in chunks:
+        chunk['tests'].sort()
+
+    # At most one chunk is empty, and it is necessarily the chunk with the
+    # least expected duration.
+    return {
+        'total_chunks': total_chunks,
+        'remainder': min(loads)[2] + 1,
+        'chunks': chunks
+    }
+
+
+QUERIES = {
+    'slowest': query_slowest,
+    'directories': query_directories,
+    'runs': query_runs,
+    'drift': query_drift,
+    'chunks': query_chunks
+}
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--history', required=True,
+                    help='directory in which the history is maintained')
+subparsers = parser.add_subparsers(dest='command')
+
+append_parser = subparsers.add_parser(
+    'append', help='add the durations of a chunk to the history'
+)
+append_parser.add_argument('--platform', required=True)
+append_parser.add_argument('--revision', required=True)
+append_parser.add_argument('--chunk', required=True,
+                           help='identifier of the chunk (e.g. "3_of_20")')
+append_parser.add_argument('--keep-runs', type=int, default=10,
+                           help='number of recent runs of each platform '
+                                'retained in the history (0 to retain every '
+                                'run)')
+append_parser.add_argument('durations_file',
+                           help='file written by run-and-verify.py via '
+                                '--log-durations')
+
+
+def add_query_parser(name, help, revision=True):
+    query_parser = subparsers.add_parser(name, help=help)
+    query_parser.add_argument('--platform', required=True)
+    query_parser.add_argument('--limit', type=int, default=20)
+    query_parser.add_argument('--format', dest='output_format',
+                              choices=('text', 'json'), default='text')
+
+    if revision:
+        query_parser.add_argument('--revision',
+                                  help='revision of the run (the most '
+                                       'recently recorded run by default)')
+
+    return query_parser
+
+
+add_query_parser('slowest', 'list the slowest tests of a run '
+                 '(duration in milliseconds, status, test)')
+add_query_parser('directories', 'list the directories whose tests take the '
+                 'longest (total duration in milliseconds, number of tests, '
+                 'directory)').add_argument(
+                     '--depth', type=int, default=0,
+                     help='number of path segments by which to group tests '
+                          '(0 for the full directory)')
+add_query_parser('runs', 'list the total duration of recent runs (total '
+                 'duration in milliseconds, number of tests, revision)',
+                 revision=False)
+add_query_parser('chunks', 'list the total duration of each chunk of a run '
+                 '(total duration in milliseconds, number of tests, chunk)')
+drift_parser = add_query_parser(
+    'drift', 'list the tests whose duration changed the most in the most '
+    'recent run (change, duration and previous median duration in '
+    'milliseconds, test)', revision=False
+)
+drift_parser.add_argument('--runs', type=int, default=5,
+                          help='number of preceding runs to compare with')
+drift_parser.add_argument('--min-duration', type=int, default=1000,
+                          help='ignore tests which take less than this many '
+                               'milliseconds')
+
+plan_parser = subparsers.add_parser(
+    'plan', help='divide tests between chunks according to their recorded '
+                 'durations'
+)
+plan_parser.add_argument('--platform', required=True)
+plan_parser.add_argument('--total-chunks', type=int, required=True)
+plan_parser.add_argument('--runs', type=int, default=3,
+                         help='number of recent runs from which the duration '
+                              'of each test is estimated')
+plan_parser.add_argument('--output', required=True,
+                         help='file to which the plan is written (for use '
+                              'with the --chunk-plan option of '
+                              'run-and-verify.py)')
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import base64
+import contextlib
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import urllib2
+import urlparse
+
+logger = logging.getLogger('fetch-artifact')
+
+# The size (in bytes) of the blocks in which artifacts are downloaded and
+# hashed.
+BLOCK_SIZE = 1024 * 1024
+METADATA_SUFFIX = '.json'
+LOCK_SUFFIX = '.lock'
+
+
+def main(cache_dir, max_size, url):
+    '''Download an artifact (e.g. a browser installer) into a cache on the
+    local machine and print the location of the cached file.
+
+    The artifacts mirrored by `get-binary-url.py` are named for the etag of
+    the source artifact, so a URL identifies the artifact's content and the
+    cached file is reused for as long as the URL is requested. The integrity
+    of each artifact is verified against the hash reported by the server (if
+    any) when it is downloaded, and against the recorded SHA-256 digest each
+    time it is reused.
+
+    Each entry is locked while it is downloaded or verified, so concurrent
+    requests for the same artifact download it once. When the cache exceeds
+    `max_size` megabytes, the least recently used entries are removed.'''
+
+    logging.basicConfig(level='INFO',
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+    key = cache_key(url)
+    filename = os.path.join(cache_dir, key)
+
+    with locked(filename + LOCK_SUFFIX):
+        if verify(filename):
+            logger.info('Using cached artifact %s', key)
+            # The modification time of an entry records its most recent use.
+            os.utime(filename, None)
+        else:
+            logger.info('Downloading %s', url)
+            download(url, filename)
+
+    evict(cache_dir, max_size * 1024 * 1024, keep=key)
+
+    print filename
+
+
+def cache_key(url):
+    '''Derive the name of a cache entry from the path of the artifact's URL,
+    e.g. "chrome-stable-linux-<etag>" for an artifact mirrored at
+    "/<bucket>/chrome-stable-linux/<etag>".'''
+    path = urlparse.urlparse(url).path.strip('/')
+    parts = path.split('/')
+
+    # The first component of the path names the bucket, which does not
+    # identify the artifact.
+    if len(parts) > 2:
+        parts = parts[1:]
+
+    return re.sub(r'[^A-Za-z0-9._-]', '_', '-'.join(parts))
+
+
+@contextlib.contextmanager
+def locked(filename, blocking=True):
+    '''Hold an exclusive lock on the given file. When `blocking` is `False`,
+    `None` is yielded if the lock is held elsewhere.'''
+    with open(filename, 'a') as lock:
+        flags = fcntl.LOCK_EX
+
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+
+        try:
+            fcntl.flock(lock, flags)
+        except IOError as error:
+            if error.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+
+            yield None
+            return
+
+        try:
+            yield lock
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read_metadata(filename):
+    try:
+        with open(filename + METADATA_SUFFIX) as handle:
+            return json.load(handle)
+    except (IOError, ValueError):
+        return None
+
+
+def file_sha256(filename):
+    digest = hashlib.sha256()
+
+    with open(filename, 'rb') as handle:
+        for block in iter(lambda: handle.read(BLOCK_SIZE), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def verify(filename):
+    '''Determine whether a cache entry is present and intact.'''
+    metadata = read_metadata(filename)
+
+    if metadata is None or not os.path.exists(filename):
+        return False
+
+    if os.path.getsize(filename) != metadata.get('size'):
+        logger.warning('Size of cached artifact is incorrect')
+        return False
+
+    if file_sha256(filename) != metadata.get('sha256'):
+        logger.warning('Digest of cached artifact is incorrect')
+        return False
+
+    return True
+
+
+def expected_md5(response):
+    '''Read the MD5 digest of a response's body from the `x-goog-hash` header
+    provided by Google Cloud Storage, if present.'''
+    for value in response.info().getheaders('x-goog-hash'):
+        for part in value.split(','):
+            name, _, digest = part.strip().partition('=')
+
+            if name == 'md5':
+                return base64.b64decode(digest).encode('hex')
+
+
+def download(url, filename):
+    temp_name = '%s.%s.tmp' % (filename, os.getpid())
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    size = 0
+
+    try:
+        response = urllib2.urlopen(url)
+        content_length = response.info().getheader('content-length')
+
+        with open(temp_name, 'wb') as handle:
+            for block in iter(lambda: response.read(BLOCK_SIZE), b''):
+                handle.write(block)
+                sha256.update(block)
+                md5.update(block)
+                size += len(block)
+
+        if content_length is not None and int(content_length) != size:
+            raise Exception('Expected %s bytes but received %s' % (
+                content_length, size
+            ))
+
+        expected = expected_md5(response)
+
+        if expected is not None and expected != md5.hexdigest():
+            raise Exception('Expected MD5 digest %s but received %s' % (
+                expected, md5.hexdigest()
+            ))
+
+        # The metadata is written before the artifact is moved into place, so
+        # an artifact without metadata is never considered valid.
+        with open(filename + METADATA_SUFFIX, 'w') as handle:
+            json.dump({
+                'url': url, 'size': size, 'sha256': sha256.hexdigest()
+            }, handle)
+
+        os.rename(temp_name, filename)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+
+def evict(cache_dir, max_size, keep):
+    '''Remove the least recently used entries until the total size of the
+    cache does not exceed `max_size` bytes. Entries which are locked (i.e.
+    being downloaded or verified) and the entry named `keep` are retained.'''
+    entries = []
+
+    for name in os.listdir(cache_dir):
+        filename = os.path.join(cache_dir, name)
+
+        if name.endswith((METADATA_SUFFIX, LOCK_SUFFIX, '.tmp')):
+            continue
+
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            continue
+
+        entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+
+    for _, size, name in sorted(entries):
+        if total <= max_size:
+            break
+
+        if name == keep:
+            continue
+
+        filename = os.path.join(cache_dir, name)
+
+        with locked(filename + LOCK_SUFFIX, blocking=False) as lock:
+            if lock is None:
+                continue
+
+            logger.info('Evicting %s', name)
+
+            for path in (filename + METADATA_SUFFIX, filename):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+            total -= size
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--cache-dir', default='/var/cache/wpt-artifacts',
+                    help='directory in which artifacts are cached')
+parser.add_argument('--max-size', type=int, default=4096,
+                    help='size (in megabytes) beyond which the least '
+                         'recently used artifacts are removed')
+parser.add_argument('url')
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import logging
+
+import consolidation
+
+
+def main(directory, consolidation_mode, compression_level, raw_results_file):
+    '''Fold a single WPT results file into the partially consolidated report
+    maintained in the given directory. Once every results file of a run has
+    been folded, `upload-wpt-results.py` only needs to write the report's
+    metadata in order to produce the consolidated report.'''
+
+    log_format = '%(asctime)s %(levelname)s %(name)s %(message)s'
+    logging.basicConfig(level='INFO', format=log_format)
+    logger = logging.getLogger('fold-results')
+
+    if consolidation.fold_chunk(
+            directory,
+            raw_results_file,
+            consolidation.chunk_readers[consolidation_mode],
+            compression_level):
+        logger.info('Folded %s into %s', raw_results_file, directory)
+    else:
+        logger.info('%s has already been folded into %s', raw_results_file,
+                    directory)
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--directory', required=True,
+                    help='directory in which to maintain the partially '
+                         'consolidated report')
+parser.add_argument('--consolidation-mode',
+                    choices=sorted(consolidation.chunk_readers.keys()),
+                    default='load',
+                    help='strategy for reading the results file (see '
+                         'upload-wpt-results.py)')
+parser.add_argument('--compression-level', type=int, default=9,
+                    choices=range(1, 10),
+                    help='gzip compression level of the results')
+parser.add_argument('raw_results_file')
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
@@ -6,7 +6,11 @@
 
 browser_name=$1
 url=$2
-temp_file=$(mktemp)
+# Browsers which are not installed system-wide are installed in this directory,
+# which persists between builds, along with a manifest describing the most
+# recent installation of each browser (see `browser_manifest.py`).
+browsers_dir=/var/lib/wpt-browsers
+manifest=$browsers_dir/manifest.json
 
 install_chrome() {
   deb_archive=$1
@@ -52,13 +56,11 @@ install_chrome() {
 
 install_firefox() {
   archive=$1
-  install_dir=$(readlink --canonicalize ./firefox)
+  install_dir=$browsers_dir/firefox
 
   rm --recursive --force $install_dir
 
-  chown $SUDO_USER $archive
-
-  sudo -u $SUDO_USER tar -xvf $archive >&2 || return 1
+  sudo -u $SUDO_USER tar -xvf $archive -C $browsers_dir >&2 || return 1
 
   echo $install_dir/firefox
 }
@@ -99,8 +101,19 @@ install_safari_technology_preview() {
   echo "${application_dir}/Contents/MacOS/Safari Technology Preview"
 }
 
-# Prefer `curl` over `wget` because `wget` is not included in macOS High Sierra
-curl --silent --show-error --output $temp_file $url
+binary=$(sudo -u $SUDO_USER browser_manifest.py lookup \
+  --manifest $manifest --browser-name $browser_name --artifact $url)
+
+if [ $? == '0' ]; then
+  echo Using previously-installed browser: $binary >&2
+  echo "$binary"
+  exit 0
+fi
+
+# The archive is retrieved via a cache which is shared by every build on the
+# worker (and so is owned by the unprivileged user), so each version of the
+# browser is downloaded once.
+archive=$(sudo -u $SUDO_USER fetch-artifact.py $url)
 
 if [ $? != '0' ]; then
   echo Error downloading browser. >&2
@@ -108,18 +121,28 @@ if [ $? != '0' ]; then
 fi
 
 if [ $browser_name == 'chrome' ]; then
-  install_chrome $temp_file
+  binary=$(install_chrome $archive)
+  result=$?
+  install_path=/opt/google
 elif [ $browser_name == 'firefox' ]; then
-  install_firefox $temp_file
+  binary=$(install_firefox $archive)
+  result=$?
+  install_path=$browsers_dir/firefox
 elif [ $browser_name == 'safari' ]; then
-  install_safari_technology_preview $temp_file
+  binary=$(install_safari_technology_preview $archive)
+  result=$?
+  install_path='/Applications/Safari Technology Preview.app'
 else
   echo Unrecognized browser: $browser_name >&2
-  false
+  exit 1
 fi
 
-result=$?
+if [ $result != '0' ]; then
+  exit $result
+fi
 
-rm -f $temp_file
+sudo -u $SUDO_USER browser_manifest.py record \
+  --manifest $manifest --browser-name $browser_name --artifact $url \
+  --install-path "$install_path" --binary "$binary" >&2
 
-exit $result
+echo "$binary"
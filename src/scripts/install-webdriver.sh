@@ -6,7 +6,6 @@
 
 browser_name=$1
 url=$2
-temp_file=$(mktemp)
 
 install_chromedriver() {
   archive=$1
@@ -30,7 +29,9 @@ install_geckodriver() {
   echo $target
 }
 
-wget --quiet --output-document $temp_file $url
+# The archive is retrieved via a cache which is shared by every build on the
+# worker, so each version of the WebDriver binary is downloaded once.
+archive=$(fetch-artifact.py $url)
 
 if [ $? != '0' ]; then
   echo Error downloading browser. >&2
@@ -38,16 +39,10 @@ if [ $? != '0' ]; then
 fi
 
 if [ $browser_name == 'chrome' ]; then
-  install_chromedriver $temp_file
+  install_chromedriver $archive
 elif [ $browser_name == 'firefox' ]; then
-  install_geckodriver $temp_file
+  install_geckodriver $archive
 else
   echo Unrecognized browser: $browser_name >&2
   false
 fi
-
-result=$?
-
-rm --force $temp_file
-
-exit $result
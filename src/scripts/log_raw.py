@@ -0,0 +1,116 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''Utilities for reading the "raw" log produced by the WPT CLI (one
+JSON-formatted event per line). Logs describing a complete chunk may be
+hundreds of megabytes in size, but most analysis concerns a small number of
+event types. Rather than decoding every line, the reader searches the log
+for the names of the relevant actions and decodes only the matching lines.'''
+
+import array
+import heapq
+import json
+import mmap
+
+# The array type used to store the offsets of lines within a log.
+OFFSET_TYPECODE = 'L'
+
+
+class LogRawReader(object):
+    '''Reader for the events of a raw log file. The file is mapped into memory
+    rather than read, so the operating system's page cache is shared between
+    queries and between processes.
+
+    The offsets of the lines which describe a given set of actions may be
+    recorded with `build_index`, after which queries for those actions decode
+    only the matching lines and do not search the log.'''
+
+    def __init__(self, filename):
+        self.handle = open(filename, 'rb')
+        self.index = {}
+
+        try:
+            self.data = mmap.mmap(self.handle.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            self.data = ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+        self.handle.close()
+
+    def build_index(self, actions):
+        '''Record the offsets of the lines which describe the given
+        actions.'''
+        for action in actions:
+            self.index[action] = array.array(
+                OFFSET_TYPECODE,
+                (start for start, _ in self.search(action))
+            )
+
+    def events(self, actions):
+        '''Generate the events which describe any of the given actions, in the
+        order they appear in the log.'''
+        if all(action in self.index for action in actions):
+            offsets = heapq.merge(*[self.index[action] for action in actions])
+
+            for start in offsets:
+                yield self.decode(start, self.line_end(start))
+
+            return
+
+        matches = heapq.merge(*[self.search(action) for action in actions])
+
+        for start, event in matches:
+            yield event
+
+    def first(self, action):
+        '''Return the first event describing the given action (or `None` if
+        there is no such event).'''
+        for event in self.events([action]):
+            return event
+
+    def search(self, action):
+        '''Generate an `(offset, event)` pair for each line which describes
+        the given action. Lines are decoded only if they contain the quoted
+        name of the action.'''
+        needle = '"%s"' % action
+        data = self.data
+        position = 0
+
+        while True:
+            match = data.find(needle, position)
+
+            if match == -1:
+                return
+
+            start = data.rfind('\n', 0, match) + 1
+            end = self.line_end(match)
+            position = end + 1
+            event = self.decode(start, end)
+
+            if event is not None and event.get('action') == action:
+                yield start, event
+
+    def line_end(self, offset):
+        end = self.data.find('\n', offset)
+
+        return len(self.data) if end == -1 else end
+
+    def decode(self, start, end):
+        try:
+            event = json.loads(self.data[start:end])
+        except ValueError:
+            return None
+
+        return event if isinstance(event, dict) else None
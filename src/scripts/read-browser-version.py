@@ -10,6 +10,8 @@ import re
 import subprocess
 import xml.etree.ElementTree
 
+import browser_manifest
+
 
 def firefox(binary):
     '''Determine the version of a provided Mozilla Firefox binary, e.g.:
@@ -111,14 +113,32 @@ parser.add_argument('--browser-name',
                     required=True)
 parser.add_argument('--binary',
                     required=True)
+parser.add_argument('--manifest',
+                    help='''install manifest (see `browser_manifest.py`) in
+                            which the version of an installed binary is
+                            recorded once read''')
 
 if __name__ == '__main__':
     args = parser.parse_args()
+    version = None
+
+    if args.manifest:
+        version = browser_manifest.cached_version(
+            args.manifest, args.browser_name, args.binary
+        )
+
+    if version is None:
+        read = {
+            'firefox': firefox,
+            'chrome': chrome,
+            'safari': safari
+        }.get(args.browser_name)
+
+        version = read(args.binary)
 
-    read = {
-        'firefox': firefox,
-        'chrome': chrome,
-        'safari': safari
-    }.get(args.browser_name)
+        if args.manifest:
+            browser_manifest.record_version(
+                args.manifest, args.browser_name, args.binary, version
+            )
 
-    print read(args.binary)
+    print version
@@ -0,0 +1,89 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''Utilities for the "summary" of a WPT report: a compact JSON file written
+alongside the report by `run-and-verify.py`, which decodes the report once in
+order to validate it. The summary describes the test ID of each result (in
+order), the number of results with each status, the report's time bounds and
+`run_info`, and the size and SHA-256 digest of the report file. Later
+consumers of the report (on the build master) use the summary to validate the
+report (by its size and digest, which is far cheaper than decoding it) and to
+identify its tests without decoding the report again.'''
+
+import collections
+import hashlib
+import json
+import os
+
+# The suffix which distinguishes the summary of a report from the report
+# itself.
+SUFFIX = '.summary'
+# The size (in bytes) of the blocks in which reports are hashed.
+BLOCK_SIZE = 1024 * 1024
+
+
+def summarize(report, text):
+    '''Describe a decoded WPT report. `text` is the report's serialized
+    form, as written to disk.'''
+    results = report['results']
+    summary = {
+        'size': len(text),
+        'sha256': hashlib.sha256(text).hexdigest(),
+        'total': len(results),
+        'statuses': dict(
+            collections.Counter(result.get('status') for result in results)
+        ),
+        'tests': [result['test'] for result in results]
+    }
+
+    for key in ('time_start', 'time_end', 'run_info'):
+        if key in report:
+            summary[key] = report[key]
+
+    return summary
+
+
+def write(filename, summary):
+    '''Write the summary of the given report file.'''
+    with open(filename + SUFFIX, 'w') as handle:
+        json.dump(summary, handle, sort_keys=True)
+
+
+def read(filename):
+    '''Read the summary of the given report file. Returns `None` if the
+    report has no summary or if the summary does not describe the report's
+    current contents (judging by its size and SHA-256 digest).'''
+    try:
+        with open(filename + SUFFIX) as handle:
+            summary = json.load(handle)
+    except (IOError, ValueError):
+        return None
+
+    if not isinstance(summary, dict):
+        return None
+
+    try:
+        if summary.get('size') != os.path.getsize(filename):
+            return None
+
+        if summary.get('sha256') != file_sha256(filename):
+            return None
+    except (IOError, OSError):
+        return None
+
+    return summary
+
+
+def file_sha256(filename):
+    digest = hashlib.sha256()
+
+    with open(filename, 'rb') as handle:
+        for block in iter(lambda: handle.read(BLOCK_SIZE), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def is_summary(filename):
+    return filename.endswith(SUFFIX)
@@ -5,41 +5,120 @@
 # found in the LICENSE file.
 
 import argparse
+import collections
 import json
 import logging
 import os
 import platform
+import posixpath
+import re
+import select
+import shutil
+import signal
 import subprocess
 import sys
 import threading
+import time
+import urlparse
+
+import report_summary
+from log_raw import LogRawReader
+
+# The interval (in seconds) at which the raw log is read while the WPT CLI is
+# running.
+POLL_INTERVAL = 0.2
+# The time (in seconds) allowed for the WPT CLI to exit after being asked to
+# terminate.
+TERMINATION_GRACE_PERIOD = 10
+# The output of the WPT CLI is relayed in batches: whenever this many bytes
+# are pending, and at least once per `OUTPUT_FLUSH_INTERVAL` seconds.
+OUTPUT_BATCH_SIZE = 64 * 1024
+OUTPUT_FLUSH_INTERVAL = 1.0
+# Lines of output which are relayed regardless of sampling and rate limits.
+IMPORTANT_OUTPUT = re.compile(r'CRITICAL|ERROR|Traceback|UNEXPECTED')
+
+# Settings which govern the supervision of each invocation of the WPT CLI.
+RunOptions = collections.namedtuple('RunOptions', [
+    'stall_timeout', 'startup_timeout', 'progress_interval', 'output_sample',
+    'output_rate_limit', 'output_history'
+])
+DEFAULT_RUN_OPTIONS = RunOptions(stall_timeout=0, startup_timeout=0,
+                                 progress_interval=0, output_sample=1,
+                                 output_rate_limit=0, output_history=0)
+
+
+def main(max_attempts, log_wptreport, log_raw, log_durations, chunk_plan,
+         stall_timeout, startup_timeout, progress_interval, output_sample,
+         output_rate_limit, output_history, wpt_args):
+    '''Execute web-platform-tests repeatedly until results have been collected
+    for all of the expected tests. When some expected tests are missing from
+    the results, subsequent attempts execute only those tests and merge their
+    results with the results of the previous attempts. An attempt in which no
+    test completes for an extended period is terminated, and the results of
+    the tests which did complete are recovered from the raw log.
 
+    The report is decoded once per attempt. Once it is complete, a summary of
+    the report is written alongside it (see `report_summary`) so that later
+    steps need not decode it again.
 
-def main(max_attempts, log_wptreport, log_raw, wpt_args):
-    '''Execute web-platform-tests repeatedly until results have been collected
-    for all of the expected tests.'''
+    The duration of each test may also be extracted from the raw log (see
+    `write_durations`). Those durations may in turn be used to plan the tests
+    of each chunk (see `duration-history.py`), in which case the chunk's
+    tests are selected according to the plan rather than by the WPT CLI.'''
 
     log_format = '%(asctime)s %(levelname)s %(name)s %(message)s'
     logging.basicConfig(level='INFO', format=log_format)
     logger = logging.getLogger('validate-wpt-results')
     is_complete = False
     current_attempt = 0
+    missing = None
+    report = None
+    options = RunOptions(stall_timeout, startup_timeout, progress_interval,
+                         output_sample, output_rate_limit, output_history)
 
     if len(wpt_args) > 0 and wpt_args[0] == '--':
         wpt_args.pop(0)
 
+    # Only the first attempt selects tests according to the plan; subsequent
+    # attempts execute specific tests.
+    plan_args = []
+
+    if chunk_plan:
+        plan_args = chunk_plan_args(chunk_plan, wpt_args,
+                                    chunk_plan + '.include')
+
+        if plan_args:
+            wpt_args = strip_chunk_args(wpt_args)
+        else:
+            logger.info('The chunk plan assigns no tests to this chunk; '
+                        'using the WPT CLI\'s own chunking')
+
+    # Ensure that the WPT CLI (which runs in a dedicated process group) is
+    # terminated along with this process.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
     while not is_complete and current_attempt < max_attempts:
         current_attempt += 1
 
         logger.info('Attempt %s of %s' % (current_attempt, max_attempts))
 
-        wpt_run(logger, log_wptreport, log_raw, wpt_args)
+        if missing:
+            logger.info('Executing %s missing tests' % len(missing))
+
+            report, summary = wpt_run_missing(logger, log_wptreport, log_raw,
+                                              wpt_args, missing, report,
+                                              options)
+        else:
+            wpt_run(logger, log_wptreport, log_raw, wpt_args + plan_args,
+                    options)
 
-        normalize_wpt_report(log_wptreport)
+            report, summary = load_wpt_report(log_wptreport)
 
         try:
-            completeness = analyze(log_wptreport, log_raw)
+            completeness = analyze(summary, log_raw)
         except Exception as e:
             logger.info('Error: %s', e)
+            missing = None
             continue
 
         incorrect_count = 0
@@ -58,11 +137,29 @@ def main(max_attempts, log_wptreport, log_raw, wpt_args):
 
         is_complete = incorrect_count == 0
 
+        # Unexpected results suggest that the set of expected tests is not
+        # reliable, so in that case the next attempt executes every test.
+        if completeness['unexpected']:
+            missing = None
+        else:
+            missing = completeness['missing']
+
+        # The decoded report is retained only to merge the results of the
+        # next attempt.
+        if not missing:
+            report = None
+
+    # Durations are recorded even if the results are incomplete, as they
+    # describe how the time of every attempt was spent.
+    if log_durations and os.path.exists(log_raw):
+        write_durations(log_raw, log_durations)
+
     if not is_complete:
-        try:
-            os.remove(log_wptreport)
-        except Exception:
-            pass
+        for filename in (log_wptreport, log_wptreport + report_summary.SUFFIX):
+            try:
+                os.remove(filename)
+            except Exception:
+                pass
 
         raise Exception(
             'Failed to collect complete results after %s attempts' % (
@@ -70,8 +167,16 @@ def main(max_attempts, log_wptreport, log_raw, wpt_args):
             )
         )
 
+    report_summary.write(log_wptreport, summary)
+
 
-def wpt_run(logger, log_wptreport, log_raw, wpt_args):
+def wpt_run(logger, log_wptreport, log_raw, wpt_args,
+            options=DEFAULT_RUN_OPTIONS):
+    '''Invoke the WPT CLI, following its progress via the raw log. If no
+    test completes within `options.stall_timeout` seconds (or if the test
+    suite does not start within `options.startup_timeout` seconds), the CLI
+    is terminated and the report is recreated from the results in the raw
+    log.'''
     command = ['python', './wpt', 'run']
     command.extend(['--log-raw', log_raw, '--log-wptreport', log_wptreport])
     command.extend(wpt_args)
@@ -84,48 +189,547 @@ def wpt_run(logger, log_wptreport, log_raw, wpt_args):
     else:
         logger.info('Not modifying environment')
 
+    # A raw log which remains from a previous attempt would be mistaken for
+    # the progress of this attempt.
+    if os.path.exists(log_raw):
+        os.remove(log_raw)
+
     logger.info('Invoking the WPT CLI with the following command:')
     logger.info('    %s', ' '.join(command))
+    # The CLI is executed in a dedicated process group so that it may be
+    # terminated along with any browser processes that it has started.
     proc = subprocess.Popen(
-        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+        preexec_fn=os.setsid
     )
+    pump = OutputPump('wpt-run', logger, options.output_sample,
+                      options.output_rate_limit, options.output_history)
+    streams = threading.Thread(target=pump.run, args=(proc,))
+    streams.start()
+
+    try:
+        stalled = monitor(proc, LogRawTracker(log_raw), logger,
+                          options.stall_timeout, options.startup_timeout,
+                          options.progress_interval)
+    finally:
+        if proc.poll() is None:
+            terminate(proc)
 
-    log_streams('wpt-run', proc, logger)
+    streams.join()
 
     logger.info('WPT CLI exited with return code %s' % proc.returncode)
 
+    if stalled or proc.returncode != 0:
+        pump.dump_history()
+
+    if stalled:
+        logger.info('Recovering results from raw log')
+
+        if os.path.exists(log_raw):
+            report = report_from_log_raw(log_raw)
+        else:
+            report = {'results': []}
+
+        with open(log_wptreport, 'w') as handle:
+            json.dump(report, handle)
+
+
+def monitor(proc, tracker, logger, stall_timeout, startup_timeout,
+            progress_interval):
+    '''Follow the progress of a WPT CLI process until it exits. Returns
+    `True` if the process was terminated because no test completed within
+    `stall_timeout` seconds (if non-zero). The preparation of the test suite
+    (e.g. downloading the manifest and starting the servers) may take far
+    longer than any test, so `stall_timeout` applies only once the suite has
+    started; until then, `startup_timeout` applies (if non-zero).'''
+    time_created = last_report = time.time()
+
+    while proc.poll() is None:
+        time.sleep(POLL_INTERVAL)
+        tracker.update()
+        now = time.time()
+
+        if progress_interval and now - last_report >= progress_interval:
+            logger.info(tracker.describe())
+            last_report = now
+
+        if tracker.last_activity is None:
+            if startup_timeout and now - time_created > startup_timeout:
+                logger.info(
+                    'The test suite did not start in %s seconds. '
+                    'Terminating the WPT CLI.', startup_timeout
+                )
+                terminate(proc)
+
+                return True
+        elif stall_timeout and now - tracker.last_activity > stall_timeout:
+            logger.info(tracker.describe())
+            logger.info(
+                'No test completed in %s seconds (current test: %s). '
+                'Terminating the WPT CLI.', stall_timeout, tracker.current
+            )
+            terminate(proc)
+
+            return True
+
+    tracker.update()
+    logger.info(tracker.describe())
+
+    return False
+
+
+def terminate(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+    deadline = time.time() + TERMINATION_GRACE_PERIOD
+
+    while proc.poll() is None and time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+
+    if proc.poll() is None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+        proc.wait()
+
+
+class LogRawTracker(object):
+    '''Incremental reader for the raw log of a WPT CLI process which is in
+    progress. Only the events which describe the progress of the run (the
+    start of the suite and the start and end of each test) are decoded.'''
+
+    ACTIONS = ('"suite_start"', '"test_start"', '"test_end"')
+
+    def __init__(self, log_raw):
+        self.log_raw = log_raw
+        self.offset = 0
+        self.partial_line = ''
+        self.expected = None
+        self.completed = 0
+        self.current = None
+        self.time_start = None
+        # The time at which the suite started or a test last completed.
+        self.last_activity = None
+
+    def update(self):
+        try:
+            handle = open(self.log_raw)
+        except IOError:
+            return
+
+        with handle:
+            handle.seek(self.offset)
+            data = handle.read()
+
+        self.offset += len(data)
+        lines = (self.partial_line + data).split('\n')
+        self.partial_line = lines.pop()
+
+        for line in lines:
+            self.handle_line(line)
+
+    def handle_line(self, line):
+        if not any(action in line for action in self.ACTIONS):
+            return
+
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return
+
+        if not isinstance(event, dict):
+            return
+
+        action = event.get('action')
+
+        if action == 'suite_start':
+            self.expected = len(event.get('tests', {}).get('default', []))
+            self.time_start = time.time()
+            self.last_activity = self.time_start
+        elif action == 'test_start':
+            self.current = event.get('test')
+        elif action == 'test_end':
+            self.completed += 1
+            self.current = None
+            self.last_activity = time.time()
+
+    def describe(self):
+        if self.expected is None:
+            return 'Waiting for the test suite to start'
+
+        elapsed = time.time() - self.time_start
+        rate = self.completed / elapsed * 60 if elapsed > 0 else 0
+        remaining = max(self.expected - self.completed, 0)
+
+        if rate > 0:
+            eta = '%d minutes' % round(remaining / rate)
+        else:
+            eta = 'unknown'
+
+        return 'Completed %s of %s tests (%.1f tests per minute; ETA: %s)' % (
+            self.completed, self.expected, rate, eta
+        )
+
+
+def report_from_log_raw(log_raw):
+    '''Create a WPT report describing the tests which completed according to
+    the given raw log.'''
+    report = {'results': []}
+    subtests = collections.defaultdict(list)
+
+    with LogRawReader(log_raw) as reader:
+        events = reader.events(['suite_start', 'test_status', 'test_end'])
+
+        for event in events:
+            action = event.get('action')
+
+            if action == 'suite_start':
+                if 'run_info' in event:
+                    report.setdefault('run_info', event['run_info'])
+                if 'time' in event:
+                    report.setdefault('time_start', event['time'])
+            elif action == 'test_status':
+                subtest = {
+                    'name': event.get('subtest'),
+                    'status': event.get('status'),
+                    'message': event.get('message')
+                }
+
+                if 'expected' in event:
+                    subtest['expected'] = event['expected']
+
+                subtests[event.get('test')].append(subtest)
+            elif action == 'test_end':
+                result = {
+                    'test': event.get('test'),
+                    'status': event.get('status'),
+                    'message': event.get('message'),
+                    'subtests': subtests.pop(event.get('test'), [])
+                }
+
+                if 'expected' in event:
+                    result['expected'] = event['expected']
+
+                report['results'].append(result)
+
+                if 'time' in event:
+                    report['time_end'] = event['time']
+
+    return report
+
+
+def wpt_run_missing(logger, log_wptreport, log_raw, wpt_args, missing, report,
+                    options=DEFAULT_RUN_OPTIONS):
+    '''Execute the given tests and merge the results with those of previous
+    attempts (`report`), rewriting the report. The raw log of the attempt is
+    appended to the existing raw log, so the tests expected by the first
+    attempt continue to define the expected results. Returns the merged
+    report and its summary.
+
+    The tests are listed in a file (rather than passed as arguments, which
+    may exceed the system's limit on the length of a command line).'''
+    attempt_wptreport = log_wptreport + '.retry'
+    attempt_log_raw = log_raw + '.retry'
+    attempt_include = log_wptreport + '.include'
+    retry_args = strip_chunk_args(wpt_args)
+    retry_args.extend(['--include-file', attempt_include])
+
+    try:
+        with open(attempt_include, 'w') as handle:
+            for test_name in sorted(missing):
+                handle.write('%s\n' % test_name)
+
+        wpt_run(logger, attempt_wptreport, attempt_log_raw, retry_args,
+                options)
+
+        attempt, _ = load_wpt_report(attempt_wptreport)
+
+        merge_wpt_reports(report, attempt)
 
-def log_streams(command_name, proc, logger):
-    stdout_lock = threading.Lock()
-    stderr_lock = threading.Lock()
+        if os.path.exists(attempt_log_raw):
+            with open(log_raw, 'a') as destination:
+                with open(attempt_log_raw) as source:
+                    shutil.copyfileobj(source, destination)
 
-    def target(cmd_name, stream_name, stream, logger, lock):
-        prefix = '%s:%s ' % (cmd_name, stream_name)
+        return save_wpt_report(log_wptreport, report)
+    finally:
+        for filename in (attempt_wptreport, attempt_log_raw,
+                         attempt_include):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+def get_arg(wpt_args, name):
+    '''Retrieve the value of a WPT CLI argument (or `None` if it is not
+    specified).'''
+    for index, arg in enumerate(wpt_args):
+        if arg == name and index + 1 < len(wpt_args):
+            return wpt_args[index + 1]
+        elif arg.startswith(name + '='):
+            return arg[len(name) + 1:]
+
+
+def chunk_plan_args(chunk_plan, wpt_args, include_file):
+    '''Create the WPT CLI arguments which select the tests of the chunk
+    identified by `--this-chunk` according to a plan written by
+    `duration-history.py`. The tests of a planned chunk are written to
+    `include_file`. The "remainder" chunk instead excludes the tests of every
+    other chunk, so that it also runs any test which the plan does not
+    describe. These exclusions are written to `include_file` as a WPT
+    "include manifest" (rather than passed as arguments, which may exceed the
+    system's limit on the length of a command line).
+
+    The WPT CLI treats an empty list of tests as no restriction at all, so
+    no arguments are returned for a planned chunk which has no tests, and the
+    CLI's own chunking should be used instead.'''
+    with open(chunk_plan) as handle:
+        plan = json.load(handle)
+
+    this_chunk = int(get_arg(wpt_args, '--this-chunk'))
+    total_chunks = int(get_arg(wpt_args, '--total-chunks'))
+
+    if total_chunks != plan['total_chunks']:
+        raise ValueError('Chunk plan describes %s chunks (expected %s)' % (
+            plan['total_chunks'], total_chunks
+        ))
+
+    if this_chunk == plan['remainder']:
+        excluded = []
+
+        for index, chunk in enumerate(plan['chunks'], 1):
+            if index != this_chunk:
+                excluded.extend(chunk['tests'])
+
+        write_include_manifest(include_file, excluded)
+
+        return ['--include-manifest', include_file]
+
+    tests = plan['chunks'][this_chunk - 1]['tests']
+
+    if not tests:
+        return []
+
+    with open(include_file, 'w') as handle:
+        for test in tests:
+            handle.write('%s\n' % test)
+
+    return ['--include-file', include_file]
+
+
+def write_include_manifest(filename, excluded):
+    '''Write a manifest (in the format read by the `--include-manifest`
+    option of the WPT CLI) which excludes the given tests and directories and
+    includes all others. Each section of the manifest names one component of
+    a test's URL (as separated by "/", followed by the query string or
+    fragment, if any).'''
+    tree = {}
+
+    for test in excluded:
+        parts = urlparse.urlsplit(test)
+        components = [part for part in parts.path.split('/') if part]
+        variant = ''
+
+        if parts.query:
+            variant += '?' + parts.query
+
+        if parts.fragment:
+            variant += '#' + parts.fragment
+
+        if variant:
+            components.append(variant)
+
+        node = tree
+
+        for component in components:
+            node = node.setdefault(component, {})
+
+        node[None] = True
+
+    def write_node(handle, node, depth):
+        if None in node:
+            handle.write('%sskip: true\n' % ('  ' * depth))
+
+        for component in sorted(key for key in node if key is not None):
+            escaped = component.replace('\\', '\\\\').replace(']', '\\]')
+            handle.write('%s[%s]\n' % ('  ' * depth, escaped))
+            write_node(handle, node[component], depth + 1)
+
+    with open(filename, 'w') as handle:
+        handle.write('skip: false\n')
+        write_node(handle, tree, 0)
+
+
+def strip_chunk_args(wpt_args):
+    '''Remove the arguments which select a chunk of the test suite, as these
+    would further restrict an explicit list of tests.'''
+    stripped = []
+    skip_value = False
+
+    for arg in wpt_args:
+        if skip_value:
+            skip_value = False
+        elif arg in ('--this-chunk', '--total-chunks'):
+            skip_value = True
+        elif not arg.startswith(('--this-chunk=', '--total-chunks=')):
+            stripped.append(arg)
+
+    return stripped
+
+
+def merge_wpt_reports(report, attempt):
+    '''Extend a WPT report with the results of another report for tests
+    which it does not already describe.'''
+    known = set(result['test'] for result in report['results'])
+
+    for result in attempt.pop('results'):
+        if result['test'] not in known:
+            report['results'].append(result)
+
+    for key, value in attempt.items():
+        if key == 'time_start' and key in report:
+            report[key] = min(report[key], value)
+        elif key == 'time_end' and key in report:
+            report[key] = max(report[key], value)
+        else:
+            report.setdefault(key, value)
+
+
+class OutputPump(object):
+    '''Relay for the output of a child process. Both output streams are read
+    in blocks as data becomes available, and complete lines are relayed in
+    batches (one log message per batch rather than one per line).
+
+    The volume of noisy output may be reduced by relaying only one in every
+    `sample` lines and no more than `rate_limit` lines per second; a count of
+    the omitted lines is relayed in their place. Lines which match
+    `IMPORTANT_OUTPUT` are always relayed. The most recent `history` lines
+    are retained regardless, so that the output which preceded a failure may
+    be recovered with `dump_history`.'''
+
+    def __init__(self, name, logger, sample=1, rate_limit=0, history=0):
+        self.name = name
+        self.logger = logger
+        self.sample = max(sample, 1)
+        self.rate_limit = rate_limit
+        self.history = collections.deque(maxlen=history)
+        self.batch = []
+        self.batch_size = 0
+        self.last_flush = time.time()
+        self.line_count = 0
+        self.window_start = 0
+        self.window_count = 0
+        self.omitted = 0
+        self.total_omitted = 0
+
+    def run(self, proc):
+        '''Relay the output of the process until both of its output streams
+        have been closed.'''
+        # The prefix and the incomplete final line of each stream, by file
+        # descriptor.
+        streams = {
+            proc.stdout.fileno(): ['%s:stdout ' % self.name, ''],
+            proc.stderr.fileno(): ['%s:stderr ' % self.name, '']
+        }
+
+        while streams:
+            timeout = max(
+                self.last_flush + OUTPUT_FLUSH_INTERVAL - time.time(), 0
+            )
+            readable, _, _ = select.select(list(streams), [], [], timeout)
+            now = time.time()
+
+            if now - self.window_start >= 1:
+                self.window_start = now
+                self.window_count = 0
+
+            for fd in readable:
+                data = os.read(fd, OUTPUT_BATCH_SIZE)
+                prefix, partial_line = streams[fd]
+
+                if not data:
+                    if partial_line:
+                        self.add(prefix + partial_line.rstrip())
+
+                    del streams[fd]
+                    continue
+
+                lines = (partial_line + data).split('\n')
+                partial_line = lines.pop()
+
+                # Output which contains no line breaks (e.g. a progress
+                # indicator) is relayed once a batch of it has accumulated.
+                if len(partial_line) >= OUTPUT_BATCH_SIZE:
+                    lines.append(partial_line)
+                    partial_line = ''
+
+                streams[fd][1] = partial_line
+
+                for line in lines:
+                    self.add(prefix + line.rstrip())
+
+            if (self.batch_size >= OUTPUT_BATCH_SIZE or
+                    now - self.last_flush >= OUTPUT_FLUSH_INTERVAL):
+                self.flush()
+
+        self.flush()
+        proc.stdout.close()
+        proc.stderr.close()
 
-        with stream:
-            for line in iter(stream.readline, b''):
-                logger.info(prefix + line.rstrip())
+    def add(self, line):
+        self.history.append(line)
+        self.line_count += 1
 
-        lock.release()
+        if not IMPORTANT_OUTPUT.search(line):
+            if (self.line_count - 1) % self.sample:
+                self.omitted += 1
+                return
 
-    stdout_lock.acquire()
-    threading.Thread(
-        target=target,
-        args=(command_name, 'stdout', proc.stdout, logger, stdout_lock)
-    ).start()
+            if self.rate_limit and self.window_count >= self.rate_limit:
+                self.omitted += 1
+                return
 
-    stderr_lock.acquire()
-    threading.Thread(
-        target=target,
-        args=(command_name, 'stderr', proc.stderr, logger, stderr_lock)
-    ).start()
+        self.window_count += 1
+        self.batch.append(line)
+        self.batch_size += len(line)
 
-    stdout_lock.acquire()
-    stderr_lock.acquire()
+    def flush(self):
+        if self.omitted:
+            self.batch.append('%s: %s lines omitted' % (
+                self.name, self.omitted
+            ))
+            self.total_omitted += self.omitted
+            self.omitted = 0
 
+        if self.batch:
+            self.logger.info('\n'.join(self.batch))
 
-def normalize_wpt_report(log_wptreport):
-    '''The WPT CLI is known to produce invalid JSON files in some
+        self.batch = []
+        self.batch_size = 0
+        self.last_flush = time.time()
+
+    def dump_history(self):
+        '''Relay the most recent lines of output. This is only necessary if
+        some of those lines were omitted.'''
+        if not self.total_omitted or not self.history:
+            return
+
+        self.logger.info('Last %s lines of %s output:\n%s',
+                         len(self.history), self.name,
+                         '\n'.join(self.history))
+
+
+def load_wpt_report(log_wptreport):
+    '''Decode and validate a WPT report. Returns the report and its summary
+    (see `report_summary`).
+
+    The WPT CLI is known to produce invalid JSON files in some
     circumstances [1]. These cases represent test executions with zero results.
     Tolerate this condition by creating a valid report describing that
     condition.
@@ -133,32 +737,41 @@ def normalize_wpt_report(log_wptreport):
     [1] https://github.com/w3c/web-platform-tests/issues/9481'''
     try:
         with open(log_wptreport) as handle:
-            json.load(handle)
-    except (IOError, ValueError):
-        with open(log_wptreport, 'w') as handle:
-            json.dump({'results': []}, handle)
+            text = handle.read()
+
+        report = json.loads(text)
+
+        if (not isinstance(report, dict) or
+                not isinstance(report.get('results'), list)):
+            raise ValueError('Expected an object with a list of results')
+
+        return report, report_summary.summarize(report, text)
+    except (IOError, ValueError, KeyError, AttributeError):
+        return save_wpt_report(log_wptreport, {'results': []})
+
+
+def save_wpt_report(log_wptreport, report):
+    '''Write a WPT report. Returns the report and its summary.'''
+    text = json.dumps(report)
+
+    with open(log_wptreport, 'w') as handle:
+        handle.write(text)
+
+    return report, report_summary.summarize(report, text)
 
 
 def get_expected_results(log_raw):
     '''Retrieve a list of strings which define all tests available in a given
     Web Platform Test repository. This number is distinct from the number of
     test files due to the presence of "multi-global" tests.'''
-    with open(log_raw) as handle:
-        for line in handle:
-            try:
-                data = json.loads(line)
-            except ValueError:
-                continue
-
-            assert isinstance(data, dict)
-
-            if data.get('action') != 'suite_start':
-                continue
+    with LogRawReader(log_raw) as reader:
+        data = reader.first('suite_start')
 
-            assert isinstance(data.get('tests'), dict)
-            assert isinstance(data['tests'].get('default'), list)
+    if data is not None:
+        assert isinstance(data.get('tests'), dict)
+        assert isinstance(data['tests'].get('default'), list)
 
-            return set(data['tests']['default'])
+        return set(data['tests']['default'])
 
     raise ValueError(
         'Unable to identify expected number of tests from log file: %s' % (
@@ -167,19 +780,56 @@ def get_expected_results(log_raw):
     )
 
 
-def get_actual_results(log_wptreport):
-    with open(log_wptreport) as handle:
-        data = json.load(handle)
+def get_durations(log_raw):
+    '''Determine the duration (in milliseconds) and status of each test which
+    completed according to the given raw log. A test which was executed more
+    than once (i.e. in more than one attempt) is described by its final
+    execution.'''
+    starts = {}
+    durations = {}
+
+    with LogRawReader(log_raw) as reader:
+        for event in reader.events(['test_start', 'test_end']):
+            test = event.get('test')
+            time_ = event.get('time')
+
+            if time_ is None:
+                continue
+
+            if event['action'] == 'test_start':
+                starts[test] = time_
+            elif test in starts:
+                durations[test] = [time_ - starts.pop(test),
+                                   event.get('status')]
+
+    return durations
+
+
+def test_directory(test):
+    return posixpath.dirname(test.split('?')[0])
+
+
+def write_durations(log_raw, log_durations):
+    '''Write a compact description of the duration and status of each test,
+    and of the total duration and number of tests in each directory.'''
+    tests = get_durations(log_raw)
+    directories = {}
 
-        assert isinstance(data, dict)
-        assert isinstance(data.get('results'), list)
+    for test, (duration, _) in tests.items():
+        total = directories.setdefault(test_directory(test), [0, 0])
+        total[0] += duration
+        total[1] += 1
 
-        return set([result['test'] for result in data.get('results')])
+    with open(log_durations, 'w') as handle:
+        json.dump({'tests': tests, 'directories': directories}, handle,
+                  sort_keys=True, separators=(',', ':'))
 
 
-def analyze(log_wptreport, log_raw):
+def analyze(summary, log_raw):
+    '''Compare the tests described by the summary of a WPT report with the
+    tests which were expected to run according to the raw log.'''
     expected_results = get_expected_results(log_raw)
-    actual_results = get_actual_results(log_wptreport)
+    actual_results = set(summary['tests'])
 
     return {
         'total_expected': len(expected_results),
@@ -194,6 +844,37 @@ parser = argparse.ArgumentParser(description=main.__doc__)
 parser.add_argument('--max-attempts', type=int, required=True)
 parser.add_argument('--log-wptreport', required=True)
 parser.add_argument('--log-raw', required=True)
+parser.add_argument('--log-durations',
+                    help='file to which the duration and status of each test '
+                         '(and the total duration of each directory) are '
+                         'written')
+parser.add_argument('--chunk-plan',
+                    help='plan written by duration-history.py which selects '
+                         'the tests of the chunk identified by --this-chunk '
+                         '(in place of the WPT CLI\'s own chunking)')
+parser.add_argument('--stall-timeout', type=float, default=0,
+                    help='number of seconds without the completion of a test '
+                         'after which the WPT CLI is terminated and the '
+                         'remaining tests are re-run (0 to wait '
+                         'indefinitely)')
+parser.add_argument('--startup-timeout', type=float, default=0,
+                    help='number of seconds after which the WPT CLI is '
+                         'terminated (and re-run) if the test suite has not '
+                         'started (0 to wait indefinitely)')
+parser.add_argument('--progress-interval', type=float, default=60,
+                    help='number of seconds between progress reports (0 to '
+                         'disable)')
+parser.add_argument('--output-sample', type=int, default=1,
+                    help='relay only one in every N lines of the output of '
+                         'the WPT CLI (lines which describe errors are '
+                         'always relayed)')
+parser.add_argument('--output-rate-limit', type=int, default=0,
+                    help='maximum number of lines of the output of the WPT '
+                         'CLI relayed per second (0 for no limit)')
+parser.add_argument('--output-history', type=int, default=1000,
+                    help='number of lines of the output of the WPT CLI '
+                         'retained in memory and relayed if the CLI fails '
+                         'after some output was omitted')
 parser.add_argument('wpt_args', nargs=argparse.REMAINDER)
 
 if __name__ == '__main__':
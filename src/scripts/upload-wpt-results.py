@@ -7,19 +7,32 @@
 import argparse
 import contextlib
 import distutils.util
-import gzip
-import json
+import hashlib
 import logging
+import multiprocessing
 import os
 import requests
 import tempfile
+import threading
+import time
+import uuid
+
+import consolidation
+import report_summary
+
+# The upper bound for the delay between consecutive upload attempts.
+RETRY_MAX_DELAY = 5 * 60
 
 
 def main(raw_results_directory, product, browser_channel, browser_version,
          os_name, os_version, url, user_name, secret, override_platform,
-         total_chunks, git_branch, no_timestamps):
+         total_chunks, git_branch, no_timestamps, consolidation_mode, jobs,
+         max_attempts, retry_delay, compression_level, compression_threads,
+         consolidated_directory, duplicate_policy, sort_results,
+         sort_buffer_size, receipts_directory):
     '''Consolidate the WPT results data into a single JSON file and upload to
-    the WPT results receiver.
+    one or more instances of the WPT results receiver. The consolidated report
+    is built once and uploaded to every receiver concurrently.
 
     The input WPT results data is expected to meet the requirements of the
     results receiver:
@@ -29,9 +42,27 @@ def main(raw_results_directory, product, browser_channel, browser_version,
     log_format = '%(asctime)s %(levelname)s %(name)s %(message)s'
     logging.basicConfig(level='INFO', format=log_format)
     logger = logging.getLogger('upload-results')
+    targets = get_targets(url, user_name, secret)
+
+    # Receivers which accepted the results in a previous attempt are not
+    # sent the results again (see `write_receipt`).
+    if receipts_directory:
+        for target in list(targets):
+            if has_receipt(receipts_directory, target[0]):
+                logger.info('%s: Results already uploaded; skipping',
+                            target[0])
+                targets.remove(target)
+
+        if not targets:
+            return
+
+    # Results are consolidated in order of their chunk index so that the
+    # uploaded report does not depend on the order of directory entries.
     raw_results_files = [
         os.path.join(raw_results_directory, filename)
-        for filename in os.listdir(raw_results_directory)
+        for filename in sorted(os.listdir(raw_results_directory),
+                               key=consolidation.chunk_sort_key)
+        if not report_summary.is_summary(filename)
     ]
 
     # This script will be scheduled for execution only when all results are
@@ -46,112 +77,265 @@ def main(raw_results_directory, product, browser_channel, browser_version,
     if len(raw_results_files) != total_chunks:
         raise Exception('Found unexpected number of results files.')
 
+    # The summary of each results file (written by `run-and-verify.py`)
+    # identifies its tests without decoding it. Summaries are used only if
+    # every results file has a summary which describes its current contents.
+    summaries = [
+        report_summary.read(filename) for filename in raw_results_files
+    ]
+    test_ids = None
+
+    if all(summaries):
+        logger.info('Found summaries of all results files (%s results)',
+                    sum(summary['total'] for summary in summaries))
+        test_ids = [summary['tests'] for summary in summaries]
+    else:
+        logger.info('Summaries unavailable for %s results files',
+                    summaries.count(None))
+
+    # When the report is missing critical metadata, extend it with information
+    # provided via the command-line. (Currently, the WPT CLI does not include
+    # this metadata in reports generated via the Sauce Labs service.)
+    run_info_overrides = None
+    if override_platform:
+        run_info_overrides = {
+            'product': product,
+            'browser_version': browser_version,
+            'os': os_name,
+            'os_version': os_version
+        }
+
+    # The consolidated report is retained until every upload has completed so
+    # that failed requests may be retried without repeating consolidation.
     with tmpfile() as filename:
-        with gzip.open(filename, 'w') as handle:
-            metadata = None
-
-            handle.write('{"results":\n')
-
-            for data in consolidate(raw_results_files, no_timestamps):
-                if isinstance(data, str):
-                    handle.write(data)
-                else:
-                    metadata = data
-
-            # When the report is missing critical metadata, extend it with
-            # information provided via the command-line. (Currently, the WPT
-            # CLI does not include this metadata in reports generated via the
-            # Sauce Labs service.)
-            if override_platform:
-                metadata['run_info'].update({
-                            'product': product,
-                            'browser_version': browser_version,
-                            'os': os_name,
-                            'os_version': os_version
-                        })
-
-            serialized_metadata = '"run_info":{}'.format(
-                json.dumps(metadata['run_info'])
+        # When every results file has already been folded into a partially
+        # consolidated report (see `fold-wpt-results.py`), only the report's
+        # metadata remains to be written. The results of a folded report are
+        # not sorted.
+        if (consolidated_directory and not sort_results and
+                consolidation.write_folded_report(filename,
+                                                  consolidated_directory,
+                                                  raw_results_files,
+                                                  no_timestamps,
+                                                  run_info_overrides,
+                                                  compression_level)):
+            logger.info('Using partially consolidated report in %s',
+                        consolidated_directory)
+        else:
+            consolidation.write_report(
+                filename,
+                raw_results_files,
+                no_timestamps,
+                run_info_overrides,
+                consolidation.chunk_readers[consolidation_mode],
+                jobs or multiprocessing.cpu_count(),
+                compression_level,
+                compression_threads or multiprocessing.cpu_count(),
+                duplicate_policy,
+                (consolidation.result_readers[consolidation_mode]
+                 if sort_results else None),
+                sort_buffer_size * 1024 * 1024,
+                test_ids
             )
-            if (metadata['time_start'] != float('inf')
-                    and metadata['time_end'] != 0):
-                serialized_metadata += (
-                    ', "time_start":{}, "time_end":{}'.format(
-                        metadata['time_start'], metadata['time_end']
-                    )
-                )
-
-            handle.write(',\n%s}\n' % serialized_metadata)
-
-        response = requests.post(
-            url,
-            auth=(user_name, secret),
-            # `labels` is a comma-separated string. Runners may add arbitrary
-            # labels.
-            data={'labels': ','.join([git_branch, browser_channel])},
-            files={'result_file': open(filename, 'rb')}
+
+        failures = upload_all(filename,
+                              targets,
+                              # `labels` is a comma-separated string. Runners
+                              # may add arbitrary labels.
+                              ','.join([git_branch, browser_channel]),
+                              max_attempts,
+                              retry_delay,
+                              receipts_directory)
+
+    if failures:
+        raise Exception('Failed to upload results to: %s' % (
+            ', '.join(failures)
+        ))
+
+
+def get_targets(urls, user_names, secrets):
+    '''Associate each receiver URL with its credentials. A single user name
+    or secret applies to every URL.'''
+    if len(user_names) == 1:
+        user_names = user_names * len(urls)
+    if len(secrets) == 1:
+        secrets = secrets * len(urls)
+
+    if len(user_names) != len(urls) or len(secrets) != len(urls):
+        raise ValueError(
+            'Expected one user name and secret, or one for each URL.'
         )
 
-    logger.info('Response status code: %s', response.status_code)
-    logger.info('Response text: %s', response.text)
+    return zip(urls, user_names, secrets)
 
-    assert response.status_code >= 200 and response.status_code < 300, (
-           response.text)
 
+def receipt_path(receipts_directory, url):
+    return os.path.join(receipts_directory,
+                        hashlib.sha1(url).hexdigest() + '.receipt')
 
-@contextlib.contextmanager
-def tmpfile():
-    fd, temp_filename = tempfile.mkstemp('.json')
-    yield temp_filename
 
-    os.close(fd)
-    os.remove(temp_filename)
+def has_receipt(receipts_directory, url):
+    return os.path.exists(receipt_path(receipts_directory, url))
+
+
+def write_receipt(receipts_directory, url):
+    '''Record that the given receiver accepted the results so that a
+    subsequent attempt to upload the same results (following a failure to
+    upload them to another receiver) does not submit them again.'''
+    if not os.path.isdir(receipts_directory):
+        try:
+            os.makedirs(receipts_directory)
+        except OSError:
+            # Another thread may have created the directory concurrently.
+            if not os.path.isdir(receipts_directory):
+                raise
+
+    with open(receipt_path(receipts_directory, url), 'w') as handle:
+        handle.write(url + '\n')
 
 
-def consolidate(raw_results_files, no_timestamps):
-    metadata = {
-        'time_start': float('inf'),
-        'time_end': 0,
-        'run_info': None
-    }
-    emitted_result = False
+def upload_all(filename, targets, labels, max_attempts, retry_delay,
+               receipts_directory=None):
+    '''Upload the report to every target concurrently. Returns the URLs of
+    the targets to which the upload failed. When `receipts_directory` is
+    specified, a receipt is written for every target which accepted the
+    report.'''
+    failures = []
 
-    yield '['
+    def target(url, user_name, secret):
+        if not upload(filename, url, user_name, secret, labels, max_attempts,
+                      retry_delay):
+            failures.append(url)
+        elif receipts_directory:
+            write_receipt(receipts_directory, url)
 
-    for filename in raw_results_files:
-        with open(filename) as handle:
-            data = json.load(handle)
+    threads = [
+        threading.Thread(target=target, args=args) for args in targets
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
 
-        assert 'run_info' in data
-        metadata['run_info'] = data['run_info']
+    return failures
 
-        if no_timestamps:
-            assert 'time_start' not in data
-            assert 'time_end' not in data
+
+def upload(filename, url, user_name, secret, labels, max_attempts,
+           retry_delay):
+    '''Upload the report to a single receiver. Requests which fail due to a
+    connection error or a server error (i.e. a 5xx status code) are retried
+    with exponential backoff. Returns `True` if the upload succeeded.'''
+    logger = logging.getLogger('upload-results')
+    # A session re-uses its connection to the receiver across attempts.
+    session = requests.Session()
+
+    for attempt in range(1, max_attempts + 1):
+        body = MultipartBody({'labels': labels}, 'result_file', filename)
+
+        try:
+            response = session.post(
+                url,
+                auth=(user_name, secret),
+                data=body,
+                headers={'Content-Type': body.content_type}
+            )
+        except requests.exceptions.RequestException as error:
+            logger.error('%s: Request failed: %s', url, error)
         else:
-            assert 'time_start' in data
-            assert 'time_end' in data
-            metadata['time_start'] = min(data.get('time_start', float('inf')),
-                                         metadata['time_start'])
-            metadata['time_end'] = max(data.get('time_end', 0),
-                                       metadata['time_end'])
-
-        assert 'results' in data
-        assert isinstance(data['results'], list)
-
-        for result in data['results']:
-            text = json.dumps(result)
-            if emitted_result:
-                text = ',' + text
+            logger.info('%s: Response status code: %s', url,
+                        response.status_code)
+            logger.info('%s: Response text: %s', url, response.text)
+
+            if response.status_code >= 200 and response.status_code < 300:
+                return True
+            elif response.status_code < 500:
+                return False
+        finally:
+            body.close()
+
+        if attempt < max_attempts:
+            delay = min(RETRY_MAX_DELAY, retry_delay * 2 ** (attempt - 1))
+            logger.info('%s: Attempt %s of %s failed. Retrying in %s seconds.',
+                        url, attempt, max_attempts, delay)
+            time.sleep(delay)
+
+    return False
+
+
+class MultipartBody(object):
+    '''A "multipart/form-data" request body which includes the contents of a
+    file. The file is read from disk as the body is transmitted, so the size
+    of the file does not influence memory consumption.'''
+
+    def __init__(self, fields, file_field, filename):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+        head = ''
+
+        for name, value in sorted(fields.items()):
+            head += (
+                '--%s\r\n'
+                'Content-Disposition: form-data; name="%s"\r\n\r\n'
+                '%s\r\n'
+            ) % (self.boundary, name, value)
+
+        head += (
+            '--%s\r\n'
+            'Content-Disposition: form-data; name="%s"; filename="%s"\r\n'
+            '\r\n'
+        ) % (self.boundary, file_field, os.path.basename(filename))
+
+        self.parts = [
+            head, open(filename, 'rb'), '\r\n--%s--\r\n' % self.boundary
+        ]
+        # The `len` attribute allows the `requests` library to declare the
+        # length of the body in the "Content-Length" header.
+        self.len = len(head) + os.path.getsize(filename) + len(self.parts[2])
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.len
+
+        blocks = []
+
+        while self.parts and size > 0:
+            part = self.parts[0]
+
+            if isinstance(part, str):
+                block = part[:size]
+
+                if len(part) > size:
+                    self.parts[0] = part[size:]
+                else:
+                    self.parts.pop(0)
             else:
-                emitted_result = True
+                block = part.read(size)
+
+                if not block:
+                    part.close()
+                    self.parts.pop(0)
+                    continue
+
+            blocks.append(block)
+            size -= len(block)
 
-            yield text
+        return ''.join(blocks)
 
-    yield ']'
+    def close(self):
+        for part in self.parts:
+            if not isinstance(part, str):
+                part.close()
 
-    assert isinstance(metadata['run_info'], object)
-    yield metadata
+
+@contextlib.contextmanager
+def tmpfile():
+    fd, temp_filename = tempfile.mkstemp('.json')
+    yield temp_filename
+
+    os.close(fd)
+    os.remove(temp_filename)
 
 
 parser = argparse.ArgumentParser(description=main.__doc__)
@@ -163,9 +347,12 @@ parser.add_argument('--browser-channel',
 parser.add_argument('--browser-version', required=True)
 parser.add_argument('--os', dest='os_name', required=True)
 parser.add_argument('--os-version', required=True)
-parser.add_argument('--url', required=True)
-parser.add_argument('--user-name', required=True)
-parser.add_argument('--secret', required=True)
+# The results may be uploaded to multiple receivers by specifying `--url` more
+# than once. A single `--user-name` and `--secret` are used for every receiver
+# unless they are specified once for each `--url` (in the same order).
+parser.add_argument('--url', action='append', required=True)
+parser.add_argument('--user-name', action='append', required=True)
+parser.add_argument('--secret', action='append', required=True)
 parser.add_argument('--override-platform',
                     type=lambda x: bool(distutils.util.strtobool(x)),
                     required=True)
@@ -177,6 +364,50 @@ parser.add_argument('--git-branch', required=True)
 parser.add_argument('--no-timestamps', action='store_true', default=False,
                     help='set when reports do not have timestamps '
                          '(time_start & time_end)')
+parser.add_argument('--consolidation-mode',
+                    choices=sorted(consolidation.chunk_readers.keys()),
+                    default='load',
+                    help='strategy for reading results files: "load" decodes '
+                         'each file in its entirety; "stream" decodes one '
+                         'result at a time in constant memory; "splice" '
+                         'copies results without re-serializing them')
+parser.add_argument('--max-attempts', type=int, default=5,
+                    help='maximum number of attempts to upload the results to '
+                         'each receiver')
+parser.add_argument('--retry-delay', type=float, default=10,
+                    help='delay in seconds before the first retry (doubled '
+                         'for each subsequent retry)')
+parser.add_argument('--compression-level', type=int, default=9,
+                    choices=range(1, 10),
+                    help='gzip compression level of the uploaded report')
+parser.add_argument('--compression-threads', type=int, default=1,
+                    help='number of threads used to compress the uploaded '
+                         'report (0 to use one thread per CPU)')
+parser.add_argument('--duplicate-policy',
+                    choices=consolidation.DUPLICATE_POLICIES,
+                    default='fail',
+                    help='treatment of results which share a test ID: "fail" '
+                         'rejects the results; "keep-first" and "keep-last" '
+                         'retain only the earliest or latest result (in order '
+                         'of chunk index)')
+parser.add_argument('--sort-results', action='store_true', default=False,
+                    help='order the results of the uploaded report by test '
+                         'ID (rather than by chunk)')
+parser.add_argument('--sort-buffer-size', type=int, default=64,
+                    help='amount of results (in megabytes) held in memory '
+                         'while sorting each results file; larger files are '
+                         'sorted in several runs on disk')
+parser.add_argument('--consolidated-directory',
+                    help='directory in which the results files have been '
+                         'incrementally consolidated by fold-wpt-results.py. '
+                         'Used only if it describes every results file.')
+parser.add_argument('--receipts-directory',
+                    help='directory in which the receivers that accepted the '
+                         'results are recorded. Receivers recorded by a '
+                         'previous invocation are not sent the results again.')
+parser.add_argument('--jobs', type=int, default=1,
+                    help='number of processes used to read results files '
+                         '(0 to use one process per CPU)')
 
 if __name__ == '__main__':
     main(**vars(parser.parse_args()))
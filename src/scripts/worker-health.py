@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import errno
+import glob
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import time
+
+logger = logging.getLogger('worker-health')
+
+# Processes started by a build which may outlive it (e.g. when the WPT CLI is
+# terminated).
+PROCESS_NAMES = [
+    'firefox', 'firefox-bin', 'geckodriver', 'chrome', 'google-chrome',
+    'chromedriver', 'Xvfb', 'xvfb-run'
+]
+# Ports bound by the WPT CLI's servers and by WebDriver servers.
+PORTS = [8000, 8001, 8443, 8444, 9000, 4444]
+STATE = 'health.json'
+REBOOTS = 'reboots.jsonl'
+
+
+def main(state_dir, shutdown_stamp, process_names, ports, min_memory,
+         min_disk, max_builds, disk_path):
+    '''Inspect the health of the worker after a build, correcting problems in
+    place where possible, and request a reboot (by touching the Buildbot
+    worker's shutdown stamp file) only if the worker remains unhealthy. The
+    worker is checked for:
+
+    - processes of browsers, WebDriver servers and Xvfb which outlived the
+      build (these are killed)
+    - processes bound to the ports used by WPT (these are killed)
+    - lock files of X displays whose server is no longer running (these are
+      removed)
+    - insufficient available memory or free disk space
+
+    A reboot is also requested once the worker has executed `max_builds`
+    builds since it was last rebooted. The number of builds since the last
+    reboot, the number of reboots and the reason for each reboot are recorded
+    in `state_dir`.'''
+
+    logging.basicConfig(level='INFO',
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    if not os.path.isdir(state_dir):
+        os.makedirs(state_dir)
+
+    state = read_state(state_dir)
+    state['builds'] += 1
+    reasons = []
+
+    if not clean_processes(process_names):
+        reasons.append('processes')
+
+    if not clean_ports(ports):
+        reasons.append('ports')
+
+    if not clean_displays():
+        reasons.append('xvfb')
+
+    memory = available_memory()
+
+    if memory is not None:
+        logger.info('Available memory: %s MB', memory)
+
+        if memory < min_memory:
+            reasons.append('memory')
+
+    disk = free_disk(disk_path)
+    logger.info('Free disk space: %s MB', disk)
+
+    if disk < min_disk:
+        reasons.append('disk')
+
+    if max_builds and state['builds'] >= max_builds:
+        reasons.append('builds')
+
+    if reasons:
+        logger.warning('Requesting reboot (%s)', ', '.join(reasons))
+
+        record_reboot(state_dir, state, reasons)
+
+        with open(shutdown_stamp, 'a'):
+            os.utime(shutdown_stamp, None)
+    else:
+        logger.info('Worker is healthy (%s builds since reboot)',
+                    state['builds'])
+
+    write_state(state_dir, state)
+
+
+def read_state(state_dir):
+    try:
+        with open(os.path.join(state_dir, STATE)) as handle:
+            return json.load(handle)
+    except (IOError, ValueError):
+        return {'builds': 0, 'reboots': 0, 'reasons': {}}
+
+
+def write_state(state_dir, state):
+    filename = os.path.join(state_dir, STATE)
+
+    with open(filename + '.tmp', 'w') as handle:
+        json.dump(state, handle, indent=2, sort_keys=True)
+
+    os.rename(filename + '.tmp', filename)
+
+
+def record_reboot(state_dir, state, reasons):
+    with open(os.path.join(state_dir, REBOOTS), 'a') as handle:
+        handle.write(json.dumps({
+            'time': time.time(),
+            'builds': state['builds'],
+            'reasons': reasons
+        }) + '\n')
+
+    state['builds'] = 0
+    state['reboots'] += 1
+
+    for reason in reasons:
+        state['reasons'][reason] = state['reasons'].get(reason, 0) + 1
+
+
+def kill(pids):
+    '''Kill the given processes and wait briefly for them to exit. Returns
+    the processes which remain.'''
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError as error:
+            if error.errno != errno.ESRCH:
+                logger.warning('Unable to kill process %s: %s', pid, error)
+
+    remaining = list(pids)
+
+    for _ in range(10):
+        remaining = [pid for pid in remaining if is_running(pid)]
+
+        if not remaining:
+            break
+
+        time.sleep(0.5)
+
+    return remaining
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+
+    # Killed processes remain in the process table until they are reaped by
+    # their parent.
+    try:
+        state = subprocess.check_output(
+            ['ps', '-o', 'stat=', '-p', str(pid)]
+        ).strip()
+    except subprocess.CalledProcessError:
+        return False
+
+    return not state.startswith('Z')
+
+
+def clean_processes(process_names):
+    '''Kill the current user's processes with the given names. Returns
+    `False` if any could not be killed.'''
+    output = subprocess.check_output(
+        ['ps', '-u', str(os.getuid()), '-o', 'pid=,comm=']
+    )
+    leaked = []
+
+    for line in output.splitlines():
+        pid, _, command = line.strip().partition(' ')
+        name = os.path.basename(command.strip())
+
+        if name in process_names and int(pid) != os.getpid():
+            leaked.append(int(pid))
+
+    if not leaked:
+        return True
+
+    logger.warning('Killing %s leaked processes: %s', len(leaked),
+                   ' '.join(str(pid) for pid in leaked))
+
+    remaining = kill(leaked)
+
+    if remaining:
+        logger.error('Processes remain: %s',
+                     ' '.join(str(pid) for pid in remaining))
+
+    return not remaining
+
+
+def listening_pids(port):
+    try:
+        output = subprocess.check_output(
+            ['lsof', '-n', '-t', '-i', 'TCP:%s' % port, '-s', 'TCP:LISTEN']
+        )
+    except subprocess.CalledProcessError:
+        # `lsof` fails when no process matches.
+        return []
+
+    return [int(pid) for pid in output.split()]
+
+
+def clean_ports(ports):
+    '''Kill the processes bound to the given ports. Returns `False` if a port
+    remains bound.'''
+    healthy = True
+
+    for port in ports:
+        pids = listening_pids(port)
+
+        if not pids:
+            continue
+
+        logger.warning('Killing processes bound to port %s: %s', port,
+                       ' '.join(str(pid) for pid in pids))
+        kill(pids)
+
+        if listening_pids(port):
+            logger.error('Port %s remains bound', port)
+            healthy = False
+
+    return healthy
+
+
+def clean_displays():
+    '''Remove the lock files of X displays whose server is no longer running
+    (which would otherwise prevent the display number from being reused).
+    Returns `False` if a display remains locked by a running server.'''
+    healthy = True
+
+    for lock_file in glob.glob('/tmp/.X*-lock'):
+        try:
+            with open(lock_file) as handle:
+                pid = int(handle.read().strip())
+        except (IOError, ValueError):
+            continue
+
+        if is_running(pid):
+            logger.error('Display server %s remains running (%s)', pid,
+                         lock_file)
+            healthy = False
+            continue
+
+        logger.warning('Removing stale display lock %s', lock_file)
+        display = re.match(r'/tmp/\.X(\d+)-lock', lock_file).group(1)
+
+        for filename in (lock_file, '/tmp/.X11-unix/X%s' % display):
+            try:
+                os.remove(filename)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    logger.error('Unable to remove %s: %s', filename, error)
+                    healthy = False
+
+    return healthy
+
+
+def available_memory():
+    '''Returns the available memory (in megabytes), or `None` if it cannot be
+    determined (e.g. on macOS).'''
+    try:
+        with open('/proc/meminfo') as handle:
+            for line in handle:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except IOError:
+        pass
+
+    return None
+
+
+def free_disk(path):
+    '''Returns the disk space (in megabytes) available to the current user on
+    the filesystem which contains the given path.'''
+    stat = os.statvfs(path)
+
+    return stat.f_bavail * stat.f_frsize // (1024 * 1024)
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--state-dir', required=True,
+                    help='directory in which the health of the worker is '
+                         'recorded')
+parser.add_argument('--shutdown-stamp', required=True,
+                    help='file which requests that the worker be rebooted '
+                         'when touched')
+parser.add_argument('--process-names', nargs='*', default=PROCESS_NAMES,
+                    help='names of processes which should not outlive a '
+                         'build')
+parser.add_argument('--ports', type=int, nargs='*', default=PORTS,
+                    help='TCP ports which should not be bound after a build')
+parser.add_argument('--min-memory', type=int, default=512,
+                    help='available memory (in megabytes) below which a '
+                         'reboot is requested')
+parser.add_argument('--min-disk', type=int, default=2048,
+                    help='free disk space (in megabytes) below which a '
+                         'reboot is requested')
+parser.add_argument('--max-builds', type=int, default=100,
+                    help='number of builds after which a reboot is requested '
+                         'regardless of health (0 for no limit)')
+parser.add_argument('--disk-path', default=os.path.expanduser('~'),
+                    help='path on the filesystem whose free space is checked')
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
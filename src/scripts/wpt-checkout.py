@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import argparse
+import contextlib
+import fcntl
+import logging
+import os
+import subprocess
+
+logger = logging.getLogger('wpt-checkout')
+
+# Each revision fetched into the mirror is referenced by a ref in this
+# namespace so that it is retained until it is no longer among the most
+# recently checked out revisions (as listed in a file within the mirror).
+REVISION_REFS = 'refs/revisions/'
+RECENT_REVISIONS = 'recent-revisions'
+
+
+def main(mirror, remote, revision, keep_revisions, directory):
+    '''Check out a revision of WPT in the given (empty) directory as a
+    working tree of a local bare mirror of the WPT repository. The revision is
+    fetched into the mirror (along with the tags which identify it, and so
+    the pre-generated test manifest) only if the mirror does not already
+    contain it, so the chunks of a run which execute on the same worker fetch
+    the revision from the remote repository once. The working tree shares the
+    objects and tags of the mirror, so checking it out copies no objects.
+
+    Only the most recently checked out revisions (and their tags) are
+    retained, and the objects of other revisions are removed from the mirror.
+
+    The mirror is modified while an exclusive lock is held, so concurrent
+    checkouts on the same machine are safe.'''
+
+    logging.basicConfig(level='INFO',
+                        format='%(asctime)s %(levelname)s %(message)s')
+    mirror = os.path.abspath(mirror)
+    directory = os.path.abspath(directory)
+
+    with locked(mirror + '.lock'):
+        if not os.path.isdir(mirror):
+            logger.info('Creating mirror in %s', mirror)
+            git(None, 'init', '--bare', mirror)
+
+        if has_commit(mirror, revision):
+            logger.info('Revision %s is present in the mirror', revision)
+            git(mirror, 'update-ref', REVISION_REFS + revision, revision)
+        else:
+            logger.info('Fetching revision %s into the mirror', revision)
+            # The tag for the current revision must be available so that the
+            # WPT CLI can locate the corresponding pre-generated manifest
+            # file. In the absence of the tag, the CLI will fall back to
+            # generating the manifest. Manifest generation is a
+            # memory-intensive task which may exceed the capabilities of the
+            # Buildbot worker. Only the tags of the current revision are
+            # fetched, as every fetched tag retains the commit it identifies.
+            refspecs = ['+%s:%s%s' % (revision, REVISION_REFS, revision)]
+            refspecs.extend(
+                '+%s:%s' % (tag, tag) for tag in remote_tags(remote, revision)
+            )
+            git(mirror, 'fetch', '--depth', '1', '--no-tags', remote,
+                *refspecs)
+
+        # Working trees whose directories have since been removed (e.g. when
+        # the build directory was cleared) are no longer registered.
+        git(mirror, 'worktree', 'prune')
+        git(mirror, 'worktree', 'add', '--detach', directory, revision)
+
+        remove_old_revisions(mirror, revision, keep_revisions)
+
+
+@contextlib.contextmanager
+def locked(filename):
+    with open(filename, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def git(git_dir, *args):
+    command = ['git']
+
+    if git_dir:
+        command.extend(['--git-dir', git_dir])
+
+    command.extend(args)
+    logger.info(' '.join(command))
+
+    return subprocess.check_output(command)
+
+
+def has_commit(mirror, revision):
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.call(
+            ['git', '--git-dir', mirror, 'cat-file', '-e',
+             '%s^{commit}' % revision],
+            stderr=devnull
+        ) == 0
+
+
+def remote_tags(remote, revision):
+    '''List the tags of the remote repository which identify the given
+    revision.'''
+    tags = set()
+
+    for line in git(None, 'ls-remote', '--tags', remote).splitlines():
+        sha, _, ref = line.partition('\t')
+
+        if sha != revision:
+            continue
+
+        # Annotated tags are also listed with the commit they identify.
+        if ref.endswith('^{}'):
+            ref = ref[:-len('^{}')]
+
+        tags.add(ref)
+
+    return sorted(tags)
+
+
+def remove_old_revisions(mirror, revision, keep_revisions):
+    '''Remove the refs (and tags) of all but the most recently checked out
+    revisions, and prune the objects which are no longer referenced.'''
+    filename = os.path.join(mirror, RECENT_REVISIONS)
+
+    try:
+        with open(filename) as handle:
+            recent = handle.read().split()
+    except IOError:
+        recent = []
+
+    recent = [other for other in recent if other != revision] + [revision]
+    keep = set(recent[-keep_revisions:])
+    refs = git(mirror, 'for-each-ref', '--format=%(refname)',
+               REVISION_REFS).split()
+
+    removed = False
+
+    for ref in refs:
+        if ref[len(REVISION_REFS):] not in keep:
+            git(mirror, 'update-ref', '-d', ref)
+            removed = True
+
+    # Each line lists a tag, the object it references and (for annotated
+    # tags) the commit which that object identifies.
+    tags = git(mirror, 'for-each-ref',
+               '--format=%(refname) %(objectname) %(*objectname)',
+               'refs/tags/').splitlines()
+
+    for line in tags:
+        parts = line.split()
+
+        if parts[-1] not in keep:
+            git(mirror, 'update-ref', '-d', parts[0])
+            removed = True
+
+    with open(filename, 'w') as handle:
+        handle.write('\n'.join(other for other in recent if other in keep))
+
+    if removed:
+        git(mirror, 'gc', '--prune=now', '--quiet')
+
+
+parser = argparse.ArgumentParser(description=main.__doc__)
+parser.add_argument('--mirror', required=True,
+                    help='location of the bare mirror of the WPT repository '
+                         '(created if it does not exist)')
+parser.add_argument('--remote',
+                    default='git://github.com/w3c/web-platform-tests',
+                    help='repository from which revisions are fetched')
+parser.add_argument('--revision', required=True,
+                    help='full SHA of the revision to check out')
+parser.add_argument('--keep-revisions', type=int, default=8,
+                    help='number of revisions retained in the mirror')
+parser.add_argument('directory', nargs='?', default='.',
+                    help='empty directory in which to check out the revision')
+
+if __name__ == '__main__':
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,107 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+scripts_dir = os.path.sep.join([here, '..', 'src', 'scripts'])
+manifest_bin = os.path.join(scripts_dir, 'browser_manifest.py')
+version_bin = os.path.join(scripts_dir, 'read-browser-version.py')
+artifact = 'https://storage.googleapis.com/bucket/firefox-stable-linux/abc'
+
+
+class TestBrowserManifest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.temp_dir, 'manifest.json')
+        self.install_path = os.path.join(self.temp_dir, 'firefox')
+        self.binary = os.path.join(self.install_path, 'firefox')
+
+        os.mkdir(self.install_path)
+
+        with open(self.binary, 'w') as handle:
+            handle.write('#!/bin/sh\necho Mozilla Firefox 61.0a1\n')
+
+        os.chmod(self.binary, 0755)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_script(self, *args):
+        proc = subprocess.Popen(
+            list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = proc.communicate()
+
+        return proc.returncode, stdout.strip(), stderr
+
+    def lookup(self, artifact=artifact):
+        return self.run_script(manifest_bin, 'lookup',
+                               '--manifest', self.manifest,
+                               '--browser-name', 'firefox',
+                               '--artifact', artifact)
+
+    def record(self):
+        returncode, _, stderr = self.run_script(
+            manifest_bin, 'record',
+            '--manifest', self.manifest,
+            '--browser-name', 'firefox',
+            '--artifact', artifact,
+            '--install-path', self.install_path,
+            '--binary', self.binary
+        )
+
+        self.assertEqual(returncode, 0, stderr)
+
+    def read_version(self):
+        return self.run_script(version_bin,
+                               '--browser-name', 'firefox',
+                               '--binary', self.binary,
+                               '--manifest', self.manifest)
+
+    def test_lookup(self):
+        self.assertEqual(self.lookup()[0], 1)
+
+        self.record()
+
+        self.assertEqual(self.lookup(), (0, self.binary, ''))
+        self.assertEqual(self.lookup(artifact + 'def')[0], 1)
+
+    def test_lookup_modified_binary(self):
+        self.record()
+        stat = os.stat(self.binary)
+        os.utime(self.binary, (stat.st_atime, stat.st_mtime + 1))
+
+        self.assertEqual(self.lookup()[0], 1)
+
+    def test_lookup_removed(self):
+        self.record()
+        shutil.rmtree(self.install_path)
+
+        self.assertEqual(self.lookup()[0], 1)
+
+    def test_cached_version(self):
+        self.record()
+
+        self.assertEqual(self.read_version()[:2], (0, '61.0a1'))
+
+        # The version is read from the manifest rather than the binary.
+        os.chmod(self.binary, 0644)
+
+        self.assertEqual(self.read_version()[:2], (0, '61.0a1'))
+
+    def test_version_without_installation(self):
+        self.assertEqual(self.read_version()[:2], (0, '61.0a1'))
+
+        os.chmod(self.binary, 0644)
+
+        self.assertNotEqual(self.read_version()[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import collections
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.sep.join([here, '..', 'src', 'master']))
+
+from build_priority import make_next_build  # noqa: E402
+
+SourceStamp = collections.namedtuple('SourceStamp', ['revision'])
+
+
+class Properties(dict):
+    def getProperty(self, name):
+        return self.get(name)
+
+
+class Request(object):
+    def __init__(self, revision, platform_id, this_chunk, submitted_at,
+                 total_chunks=4, chunks=None, chunk_plan=None):
+        self.sources = {'': SourceStamp(revision)}
+        self.properties = Properties(platform_id=platform_id,
+                                     this_chunk=this_chunk,
+                                     chunks=chunks,
+                                     total_chunks=total_chunks,
+                                     chunk_plan=chunk_plan)
+        self.submittedAt = submitted_at
+
+    def __repr__(self):
+        return '<Request %s %s %s>' % (self.sources[''].revision,
+                                       self.properties['platform_id'],
+                                       self.properties['this_chunk'])
+
+
+class TestBuildPriority(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.plans = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_plan(self, revision, platform_id, durations):
+        filename = os.path.join(self.temp_dir, revision, platform_id + '.json')
+        self.plans[(revision, platform_id)] = filename
+
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+
+        with open(filename, 'w') as f:
+            json.dump({
+                'total_chunks': len(durations),
+                'remainder': 1,
+                'chunks': [
+                    {'duration': duration, 'tests': []}
+                    for duration in durations
+                ]
+            }, f)
+
+    def request(self, revision, platform_id, *args, **kwargs):
+        '''Create a build request which refers to the chunk plan written for
+        its run (if any).'''
+        kwargs['chunk_plan'] = self.plans.get((revision, platform_id))
+
+        return Request(revision, platform_id, *args, **kwargs)
+
+    def test_default_policy(self):
+        self.assertEqual(make_next_build(None), None)
+
+    def test_shortest_remaining(self):
+        next_build = make_next_build('shortest-remaining')
+        requests = [
+            Request('abc', 'firefox', 1, 1),
+            Request('abc', 'firefox', 2, 2),
+            Request('abc', 'firefox', 3, 3),
+            Request('abc', 'chrome', 3, 4),
+            Request('abc', 'chrome', 4, 5)
+        ]
+
+        self.assertIs(next_build(None, requests), requests[3])
+
+    def test_oldest_revision(self):
+        next_build = make_next_build('oldest-revision')
+        requests = [
+            Request('def', 'chrome', 4, 1),
+            Request('abc', 'firefox', 1, 0),
+            Request('abc', 'firefox', 2, 2)
+        ]
+
+        self.assertIs(next_build(None, requests), requests[1])
+
+    def test_planned_durations(self):
+        self.write_plan('abc', 'firefox', [100, 100, 700, 100])
+        self.write_plan('abc', 'chrome', [10, 10, 10, 10])
+        next_build = make_next_build('shortest-remaining')
+        requests = [
+            self.request('abc', 'firefox', 1, 1),
+            self.request('abc', 'firefox', 3, 2),
+            self.request('abc', 'chrome', 1, 3),
+            self.request('abc', 'chrome', 2, 4),
+            self.request('abc', 'chrome', 3, 5),
+            self.request('abc', 'chrome', 4, 6)
+        ]
+
+        # The pending chunks of each run are compared relative to the mean
+        # chunk of that run, and the longest chunk of a run is preferred.
+        self.assertIs(next_build(None, requests), requests[1])
+
+    def test_several_chunks_per_build(self):
+        self.write_plan('abc', 'firefox', [100, 100, 100, 500])
+        next_build = make_next_build('shortest-remaining')
+        requests = [
+            self.request('abc', 'firefox', 1, 1, chunks=[1, 2]),
+            self.request('abc', 'firefox', 3, 2, chunks=[3, 4]),
+            self.request('abc', 'chrome', 1, 3, chunks=[1, 2]),
+            self.request('abc', 'chrome', 3, 4, chunks=[3, 4]),
+            self.request('abc', 'safari', 1, 5, chunks=[1, 2]),
+            self.request('abc', 'safari', 3, 6, chunks=[3, 4]),
+            self.request('abc', 'safari', 3, 7)
+        ]
+
+        self.assertIs(next_build(None, requests), requests[1])
+
+    def test_progress_counts_chunks(self):
+        next_build = make_next_build('shortest-remaining')
+        requests = [
+            Request('abc', 'firefox', 3, 1),
+            Request('abc', 'firefox', 4, 2),
+            Request('abc', 'chrome', 1, 3, chunks=[1, 2])
+        ]
+
+        # Both runs have two pending chunks, so neither has made more
+        # progress and the run which was requested first is preferred.
+        self.assertIs(next_build(None, requests), requests[0])
+
+    def test_unrecognized_policy(self):
+        next_build = make_next_build('random')
+
+        with self.assertRaises(ValueError):
+            next_build(None, [Request('abc', 'firefox', 1, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
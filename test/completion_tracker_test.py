@@ -0,0 +1,93 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.sep.join([here, '..', 'src', 'master']))
+
+from completion_tracker import CompletionTracker  # noqa: E402
+
+
+def record(args):
+    directory, chunk, total_chunks = args
+
+    return CompletionTracker(directory).record(chunk, total_chunks)
+
+
+class TestCompletionTracker(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.temp_dir, 'rev', 'platform')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_final_arrival_completes(self):
+        tracker = CompletionTracker(self.directory)
+
+        self.assertFalse(tracker.record(2, 3))
+        self.assertFalse(tracker.record(3, 3))
+        self.assertEqual(tracker.status(),
+                         {'chunks': 2, 'triggered': False, 'complete': False})
+        self.assertTrue(tracker.record(1, 3))
+        self.assertEqual(tracker.status(),
+                         {'chunks': 3, 'triggered': True, 'complete': False})
+
+        tracker.mark_uploaded()
+
+        self.assertEqual(tracker.status(),
+                         {'chunks': 3, 'triggered': True, 'complete': True})
+
+    def test_repeated_arrival(self):
+        tracker = CompletionTracker(self.directory)
+
+        self.assertFalse(tracker.record(1, 2))
+        self.assertFalse(tracker.record(1, 2))
+        self.assertTrue(tracker.record(2, 2))
+        self.assertFalse(tracker.record(2, 2))
+        self.assertFalse(tracker.record(1, 2))
+
+    def test_failed_upload(self):
+        tracker = CompletionTracker(self.directory)
+
+        self.assertTrue(tracker.record(1, 1))
+        self.assertFalse(tracker.record(1, 1))
+
+        tracker.mark_upload_failed()
+
+        self.assertTrue(tracker.record(1, 1))
+
+        tracker.mark_uploaded()
+
+        self.assertFalse(tracker.record(1, 1))
+
+    def test_persisted(self):
+        CompletionTracker(self.directory).record(1, 2)
+
+        self.assertTrue(CompletionTracker(self.directory).record(2, 2))
+
+    def test_concurrent_arrivals(self):
+        total_chunks = 40
+        pool = multiprocessing.Pool(4)
+
+        try:
+            completions = pool.map(record, [
+                (self.directory, chunk, total_chunks)
+                for chunk in range(1, total_chunks + 1) * 2
+            ])
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(completions.count(True), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,273 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+history_bin = os.path.sep.join(
+    [here, '..', 'src', 'scripts', 'duration-history.py']
+)
+
+
+class TestDurationHistory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.history = os.path.join(self.temp_dir, 'history')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_history(self, *args):
+        '''Invoke the script under test, returning its output and its
+        log.'''
+        proc = subprocess.Popen(
+            [history_bin, '--history', self.history] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = proc.communicate()
+
+        self.assertEqual(proc.returncode, 0, stderr)
+
+        return stdout, stderr
+
+    def history_command(self, *args):
+        return self.run_history(*args)[0]
+
+    def append(self, platform, revision, chunk, tests, extra_args=()):
+        durations_file = os.path.join(self.temp_dir, 'durations.json')
+
+        with open(durations_file, 'w') as handle:
+            json.dump({'tests': tests, 'directories': {}}, handle)
+
+        self.history_command('append', '--platform', platform,
+                             '--revision', revision, '--chunk', chunk,
+                             durations_file, *extra_args)
+
+    def query(self, *args):
+        args += ('--format', 'json')
+
+        return json.loads(self.history_command(*args))
+
+    def test_slowest(self):
+        self.append('firefox', 'abc', '1_of_2', {
+            '/dom/a.html': [3000, 'OK'],
+            '/dom/b.html': [1000, 'ERROR']
+        })
+        self.append('firefox', 'abc', '2_of_2', {
+            '/css/c.html?x=1': [2000, 'TIMEOUT']
+        })
+        self.append('chrome', 'abc', '1_of_1', {
+            '/dom/a.html': [9000, 'OK']
+        })
+
+        self.assertEqual(
+            self.query('slowest', '--platform', 'firefox', '--limit', '2'),
+            [[3000, 'OK', '/dom/a.html'], [2000, 'TIMEOUT', '/css/c.html?x=1']]
+        )
+        self.assertEqual(
+            self.query('directories', '--platform', 'firefox'),
+            [[4000, 2, '/dom'], [2000, 1, '/css']]
+        )
+
+    def test_revisions(self):
+        self.append('firefox', 'abc', '1_of_1', {'/dom/a.html': [1000, 'OK']})
+        self.append('firefox', 'def', '1_of_1', {'/dom/a.html': [2000, 'OK']})
+        # A chunk which is recorded again replaces the previous record.
+        self.append('firefox', 'abc', '1_of_1', {
+            '/dom/a.html': [1500, 'OK'],
+            '/dom/b.html': [500, 'OK']
+        })
+
+        self.assertEqual(self.query('runs', '--platform', 'firefox'),
+                         [[2000, 2, 'abc'], [2000, 1, 'def']])
+        self.assertEqual(
+            self.query('slowest', '--platform', 'firefox',
+                       '--revision', 'abc'),
+            [[1500, 'OK', '/dom/a.html'], [500, 'OK', '/dom/b.html']]
+        )
+
+    def test_drift(self):
+        for revision, duration in (('a', 1000), ('b', 1200), ('c', 1100),
+                                   ('d', 5000)):
+            self.append('firefox', revision, '1_of_1', {
+                '/dom/slower.html': [duration, 'OK'],
+                '/dom/stable.html': [2000, 'OK'],
+                '/dom/fast.html': [10, 'OK']
+            })
+
+        self.assertEqual(
+            self.query('drift', '--platform', 'firefox', '--runs', '3'),
+            [[3900, 5000, 1100, '/dom/slower.html'],
+             [0, 2000, 2000, '/dom/stable.html']]
+        )
+
+    def test_keep_runs(self):
+        for index, revision in enumerate(('abc', 'def', 'ghi')):
+            self.append('firefox', revision, '1_of_1', {
+                '/dom/a.html': [1000 * (index + 1), 'OK']
+            }, extra_args=['--keep-runs', '2'])
+            self.append('chrome', revision, '1_of_1', {
+                '/dom/a.html': [500, 'OK']
+            }, extra_args=['--keep-runs', '2'])
+
+        # A chunk which is recorded again supersedes its previous record.
+        self.append('firefox', 'ghi', '1_of_1', {
+            '/dom/a.html': [4000, 'OK']
+        }, extra_args=['--keep-runs', '2'])
+
+        self.assertEqual(
+            self.query('runs', '--platform', 'firefox'),
+            [[2000, 1, 'def'], [4000, 1, 'ghi']]
+        )
+        self.assertEqual(
+            self.query('runs', '--platform', 'chrome'),
+            [[500, 1, 'def'], [500, 1, 'ghi']]
+        )
+
+        with open(os.path.join(self.history, 'records.jsonl')) as handle:
+            self.assertEqual(len(handle.readlines()), 5)
+
+    def test_keep_runs_interrupted(self):
+        for revision in ('abc', 'def'):
+            self.append('firefox', revision, '1_of_1', {
+                '/dom/a.html': [1000, 'OK']
+            })
+
+        records_file = os.path.join(self.history, 'records.jsonl')
+        index_file = os.path.join(self.history, 'index.jsonl')
+
+        # Simulate a prune which was interrupted before replacing the
+        # records...
+        shutil.copy(records_file, records_file + '.tmp')
+        shutil.copy(index_file, index_file + '.tmp')
+
+        self.assertEqual(len(self.query('runs', '--platform', 'firefox')), 2)
+        self.assertFalse(os.path.exists(index_file + '.tmp'))
+
+        # ...and one which was interrupted after replacing the records.
+        with open(index_file + '.tmp', 'w') as handle:
+            with open(index_file) as source:
+                handle.write(source.readlines()[-1])
+
+        self.assertEqual(self.query('runs', '--platform', 'firefox'),
+                         [[1000, 1, 'def']])
+        self.assertFalse(os.path.exists(index_file + '.tmp'))
+
+    def test_empty(self):
+        os.mkdir(self.history)
+
+        self.assertEqual(self.query('slowest', '--platform', 'firefox'), [])
+        self.assertEqual(self.query('drift', '--platform', 'firefox'), [])
+
+    def test_plan(self):
+        for revision in ('abc', 'def'):
+            self.append('firefox', revision, '1_of_2', {
+                '/css/grid/a.html': [6000, 'OK'],
+                '/css/grid/b.html': [5000, 'OK'],
+                '/css/flexbox/a.html': [2000, 'OK'],
+                '/dom/a.html?1': [1000, 'OK'],
+                '/dom/a.html?2': [1000, 'OK']
+            })
+            self.append('firefox', revision, '2_of_2', {
+                '/xhr/a.html': [500, 'OK'],
+                '/xhr/b.html': [500, 'OK']
+            })
+
+        chunk_plan = os.path.join(self.temp_dir, 'plans', 'firefox.json')
+        _, log = self.run_history('plan', '--platform', 'firefox',
+                                  '--total-chunks', '2',
+                                  '--output', chunk_plan)
+
+        self.assertIn('expected makespan: 8 seconds', log)
+        self.assertIn('Makespan of the most recent run: 15 seconds', log)
+        self.assertEqual(
+            self.query('chunks', '--platform', 'firefox'),
+            [[15000, 5, '1_of_2'], [1000, 2, '2_of_2']]
+        )
+
+        with open(chunk_plan) as handle:
+            self.assertEqual(json.load(handle), {
+                'total_chunks': 2,
+                'remainder': 1,
+                'chunks': [
+                    {'duration': 8000,
+                     'tests': ['/css/flexbox/', '/css/grid/a.html']},
+                    {'duration': 8000,
+                     'tests': ['/css/grid/b.html', '/dom/', '/xhr/']}
+                ]
+            })
+
+    def test_plan_every_chunk_has_tests(self):
+        self.append('firefox', 'abc', '1_of_1', {
+            '/dom/a.html': [0, 'OK'],
+            '/dom/b.html': [0, 'OK'],
+            '/xhr/a.html': [0, 'OK']
+        })
+
+        chunk_plan = os.path.join(self.temp_dir, 'plan.json')
+        self.history_command('plan', '--platform', 'firefox',
+                             '--total-chunks', '3', '--output', chunk_plan)
+
+        with open(chunk_plan) as handle:
+            chunk_plan = json.load(handle)
+
+        # Only the remainder, which runs every test not assigned to another
+        # chunk, may be empty.
+        self.assertEqual(chunk_plan['remainder'], 3)
+        self.assertEqual(
+            [len(chunk['tests']) for chunk in chunk_plan['chunks']], [1, 1, 0]
+        )
+
+    def test_plan_too_few_tests(self):
+        self.append('firefox', 'abc', '1_of_1', {'/dom/a.html': [10, 'OK']})
+
+        chunk_plan = os.path.join(self.temp_dir, 'plan.json')
+        _, log = self.run_history('plan', '--platform', 'firefox',
+                                  '--total-chunks', '3',
+                                  '--output', chunk_plan)
+
+        self.assertIn('not planning chunks', log)
+        self.assertFalse(os.path.exists(chunk_plan))
+
+    def test_plan_complete_runs(self):
+        chunk_plan = os.path.join(self.temp_dir, 'plan.json')
+        self.append('firefox', 'abc', '1_of_2', {'/dom/a.html': [10, 'OK']})
+
+        _, log = self.run_history('plan', '--platform', 'firefox',
+                                  '--total-chunks', '2',
+                                  '--output', chunk_plan)
+
+        self.assertIn('No complete run', log)
+        self.assertFalse(os.path.exists(chunk_plan))
+
+        self.append('firefox', 'abc', '2_of_2', {'/xhr/a.html': [10, 'OK']})
+        # The partial run of a later revision is not considered.
+        self.append('firefox', 'def', '1_of_2', {'/css/a.html': [10, 'OK']})
+        self.history_command('plan', '--platform', 'firefox',
+                             '--total-chunks', '2', '--output', chunk_plan)
+
+        with open(chunk_plan) as handle:
+            self.assertEqual(
+                sorted(test for chunk in json.load(handle)['chunks']
+                       for test in chunk['tests']),
+                ['/dom/a.html', '/xhr/a.html']
+            )
+
+    def test_plan_without_history(self):
+        chunk_plan = os.path.join(self.temp_dir, 'plan.json')
+        _, log = self.run_history('plan', '--platform', 'firefox',
+                                  '--total-chunks', '2',
+                                  '--output', chunk_plan)
+
+        self.assertIn('not planning chunks', log)
+        self.assertFalse(os.path.exists(chunk_plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
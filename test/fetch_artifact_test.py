@@ -0,0 +1,152 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import BaseHTTPServer
+import base64
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+fetch_bin = os.path.sep.join(
+    [here, '..', 'src', 'scripts', 'fetch-artifact.py']
+)
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def log_message(*argv):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = self.server.artifacts.get(self.path)
+
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        md5 = self.server.md5.get(self.path, hashlib.md5(body).digest())
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('x-goog-hash', 'crc32c=AAAAAA==,md5=%s' % (
+            base64.b64encode(md5)
+        ))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestFetchArtifact(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.server.artifacts = {}
+        self.server.md5 = {}
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.temp_dir)
+
+    def url(self, path):
+        return 'http://127.0.0.1:%s%s' % (self.server.server_port, path)
+
+    def fetch(self, path, max_size=100):
+        proc = subprocess.Popen(
+            [fetch_bin, '--cache-dir', self.cache_dir,
+             '--max-size', str(max_size), self.url(path)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = proc.communicate()
+
+        return proc.returncode, stdout.strip(), stderr
+
+    def test_download_once(self):
+        path = '/bucket/chrome-stable-linux/abc123'
+        self.server.artifacts[path] = 'chrome installer'
+
+        returncode, first, stderr = self.fetch(path)
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertEqual(os.path.basename(first),
+                         'chrome-stable-linux-abc123')
+
+        with open(first) as handle:
+            self.assertEqual(handle.read(), 'chrome installer')
+
+        returncode, second, stderr = self.fetch(path)
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.requests, [path])
+
+    def test_corrupted_entry(self):
+        path = '/bucket/firefox-stable-linux/def456'
+        self.server.artifacts[path] = 'firefox archive'
+
+        returncode, filename, stderr = self.fetch(path)
+
+        with open(filename, 'w') as handle:
+            handle.write('firefox archivX')
+
+        returncode, filename, stderr = self.fetch(path)
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertIn('Digest of cached artifact is incorrect', stderr)
+        self.assertEqual(len(self.server.requests), 2)
+
+        with open(filename) as handle:
+            self.assertEqual(handle.read(), 'firefox archive')
+
+    def test_digest_mismatch(self):
+        path = '/bucket/chrome-stable-linux/bad'
+        self.server.artifacts[path] = 'chrome installer'
+        self.server.md5[path] = hashlib.md5('something else').digest()
+
+        returncode, stdout, stderr = self.fetch(path)
+
+        self.assertNotEqual(returncode, 0)
+        self.assertIn('Expected MD5 digest', stderr)
+        self.assertEqual(os.listdir(self.cache_dir),
+                         ['chrome-stable-linux-bad.lock'])
+
+    def test_evict_least_recently_used(self):
+        megabyte = 'x' * 1024 * 1024
+        paths = ['/bucket/firefox-stable-linux/%s' % index
+                 for index in range(3)]
+
+        for path in paths:
+            self.server.artifacts[path] = megabyte
+
+        self.fetch(paths[0], max_size=2)
+        self.fetch(paths[1], max_size=2)
+        os.utime(os.path.join(self.cache_dir, 'firefox-stable-linux-0'),
+                 (0, 0))
+        os.utime(os.path.join(self.cache_dir, 'firefox-stable-linux-1'),
+                 (1, 1))
+        # Reusing an entry marks it as the most recently used.
+        self.fetch(paths[0], max_size=2)
+        self.fetch(paths[2], max_size=2)
+
+        entries = sorted(
+            name for name in os.listdir(self.cache_dir)
+            if not name.endswith(('.json', '.lock'))
+        )
+
+        self.assertEqual(entries, ['firefox-stable-linux-0',
+                                   'firefox-stable-linux-2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.sep.join([here, '..', 'src', 'master']))
+
+from lease_queue import LeaseQueue  # noqa: E402
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+class TestLeaseQueue(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.clock = Clock()
+        self.queue = LeaseQueue(os.path.join(self.temp_dir, 'queue'),
+                                clock=self.clock)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_lease_in_order(self):
+        self.assertTrue(self.queue.create(3))
+
+        self.assertEqual(self.queue.lease('a', 60), 1)
+        self.assertEqual(self.queue.lease('b', 60), 2)
+        self.assertEqual(self.queue.lease('a', 60), 3)
+        self.assertEqual(self.queue.lease('c', 60), None)
+        self.assertEqual(self.queue.status(),
+                         {'pending': 0, 'leased': 3, 'expired': 0, 'done': 0,
+                          'failed': 0})
+
+    def test_lease_missing_queue(self):
+        self.assertEqual(self.queue.lease('a', 60), None)
+        self.assertEqual(self.queue.status(),
+                         {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0,
+                          'failed': 0})
+
+    def test_create_existing(self):
+        self.assertTrue(self.queue.create(2))
+        self.queue.lease('a', 60)
+
+        self.assertFalse(self.queue.create(2))
+        self.assertEqual(self.queue.lease('b', 60), 2)
+
+    def test_expired_lease(self):
+        self.queue.create(2)
+        self.queue.lease('a', 60)
+        self.queue.lease('b', 60)
+
+        self.clock.now += 61
+
+        self.assertEqual(self.queue.status()['expired'], 2)
+        self.assertEqual(self.queue.lease('c', 60), 1)
+        self.assertFalse(self.queue.renew(1, 'a', 60))
+        self.assertFalse(self.queue.complete(2, 'b'))
+        self.assertTrue(self.queue.complete(1, 'a'))
+
+    def test_renew(self):
+        self.queue.create(1)
+        self.queue.lease('a', 60)
+
+        self.clock.now += 50
+        self.assertTrue(self.queue.renew(1, 'a', 60))
+        self.clock.now += 50
+
+        self.assertEqual(self.queue.lease('b', 60), None)
+        self.assertEqual(self.queue.status()['leased'], 1)
+
+    def test_release(self):
+        self.queue.create(2)
+        self.queue.lease('a', 60)
+        self.queue.lease('a', 60)
+
+        self.assertFalse(self.queue.release(1, 'b'))
+        self.assertEqual(self.queue.lease('b', 60), None)
+
+        self.assertTrue(self.queue.release(1, 'a'))
+        self.assertEqual(self.queue.lease('b', 60), 1)
+
+    def test_max_leases(self):
+        self.queue.create(1)
+
+        for owner in ('a', 'b'):
+            self.assertEqual(self.queue.lease(owner, 60, max_leases=2), 1)
+            self.clock.now += 61
+
+        self.assertEqual(self.queue.lease('c', 60, max_leases=2), None)
+        self.assertEqual(self.queue.status()['failed'], 1)
+
+    def test_max_leases_pending(self):
+        # A chunk which has reached the limit is not leased even if it was
+        # released rather than expired, and does not prevent the lease of
+        # expired chunks.
+        self.queue.create(2)
+        self.assertEqual(self.queue.lease('a', 60, max_leases=1), 1)
+        self.assertEqual(self.queue.lease('a', 60, max_leases=1), 2)
+        self.assertTrue(self.queue.release(1, 'a'))
+
+        self.assertEqual(self.queue.lease('b', 60, max_leases=1), None)
+        self.assertEqual(self.queue.status(),
+                         {'pending': 0, 'leased': 1, 'expired': 0, 'done': 0,
+                          'failed': 1})
+
+        self.clock.now += 61
+
+        self.assertEqual(self.queue.lease('b', 60, max_leases=2), 2)
+
+    def test_removed_queue(self):
+        self.queue.create(1)
+        self.queue.lease('a', 60)
+        shutil.rmtree(os.path.join(self.temp_dir, 'queue'))
+
+        self.assertFalse(self.queue.renew(1, 'a', 60))
+        self.assertFalse(self.queue.release(1, 'a'))
+        self.assertFalse(self.queue.complete(1, 'a'))
+
+    def test_complete_drains_once(self):
+        self.queue.create(2)
+        self.queue.lease('a', 60)
+        self.queue.lease('b', 60)
+
+        self.assertFalse(self.queue.complete(2, 'b'))
+        self.assertFalse(self.queue.complete(2, 'b'))
+        self.assertTrue(self.queue.complete(1, 'a'))
+        self.assertFalse(self.queue.complete(1, 'a'))
+        self.assertEqual(self.queue.status(),
+                         {'pending': 0, 'leased': 0, 'expired': 0, 'done': 2,
+                          'failed': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.sep.join([here, '..', 'src', 'scripts']))
+
+from log_raw import LogRawReader  # noqa: E402
+
+events = [
+    {'action': 'log', 'message': 'Starting "suite_start" soon'},
+    {'action': 'suite_start', 'tests': {'default': ['/a.html', '/b.html']}},
+    {'action': 'test_start', 'test': '/a.html'},
+    {'action': 'test_status', 'test': '/a.html', 'subtest': 'test_end',
+     'status': 'PASS'},
+    {'action': 'test_end', 'test': '/a.html', 'status': 'OK'},
+    {'action': 'test_start', 'test': '/b.html'},
+    {'action': 'test_end', 'test': '/b.html', 'status': 'TIMEOUT'},
+    {'action': 'suite_end'}
+]
+
+
+class TestLogRawReader(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_raw = os.path.join(self.temp_dir, 'log-raw.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, lines):
+        with open(self.log_raw, 'w') as handle:
+            handle.write('\n'.join(lines))
+
+    def test_events(self):
+        lines = [json.dumps(event) for event in events]
+        lines.insert(3, 'not JSON: "test_end"')
+        self.write(lines)
+
+        with LogRawReader(self.log_raw) as reader:
+            self.assertEqual(reader.first('suite_start'), events[1])
+            self.assertEqual(list(reader.events(['test_end'])),
+                             [events[4], events[6]])
+            self.assertEqual(list(reader.events(['test_start', 'test_end'])),
+                             events[2:3] + events[4:7])
+            self.assertIsNone(reader.first('test_status_missing'))
+
+    def test_index(self):
+        self.write([json.dumps(event) for event in events])
+
+        with LogRawReader(self.log_raw) as reader:
+            expected = list(reader.events(['test_start', 'test_end']))
+            reader.build_index(['test_start', 'test_end'])
+
+            self.assertEqual(list(reader.index['test_end']), [
+                sum(len(json.dumps(event)) + 1 for event in events[:4]),
+                sum(len(json.dumps(event)) + 1 for event in events[:6])
+            ])
+            self.assertEqual(list(reader.events(['test_start', 'test_end'])),
+                             expected)
+
+    def test_empty(self):
+        self.write([])
+
+        with LogRawReader(self.log_raw) as reader:
+            reader.build_index(['suite_start'])
+
+            self.assertIsNone(reader.first('suite_start'))
+            self.assertEqual(list(reader.events(['test_end'])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
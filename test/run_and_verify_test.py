@@ -2,6 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import hashlib
 import json
 import os
 import shutil
@@ -27,21 +28,26 @@ class RunAndVerify(unittest.TestCase):
     def temp_file(self, name):
         return os.path.join(self.temp_dir, name)
 
-    def run_and_verify(self, fixture_name, max_attempts):
+    def run_and_verify(self, fixture_name, max_attempts, wpt_args=()):
         log_wptreport = self.temp_file('wpt-log.json')
         log_raw = self.temp_file('raw-log.json')
         count_file = os.path.join(self.temp_dir, 'count.txt')
+        argv_file = os.path.join(self.temp_dir, 'argv.txt')
+        includes_file = os.path.join(self.temp_dir, 'includes.txt')
         fixture_file = os.path.join(fixture_dir, '%s.json' % fixture_name)
         command = [
             validate, '--max-attempts', str(max_attempts), '--log-wptreport',
             log_wptreport, '--log-raw', log_raw
         ]
+        command.extend(wpt_args)
         with open(count_file, 'w') as handle:
             handle.write('0')
 
         env = dict(os.environ)
         env['TEST_FIXTURE_FILE'] = fixture_file
         env['TEST_COUNT_FILE'] = count_file
+        env['TEST_ARGV_FILE'] = argv_file
+        env['TEST_INCLUDES_FILE'] = includes_file
 
         proc = subprocess.Popen(
             command, cwd=wpt_stub_directory, env=env,
@@ -50,11 +56,23 @@ class RunAndVerify(unittest.TestCase):
 
         stdout, stderr = proc.communicate()
 
+        with open(argv_file) as handle:
+            argv = [json.loads(line) for line in handle]
+
+        includes = []
+
+        if os.path.exists(includes_file):
+            with open(includes_file) as handle:
+                includes = [json.loads(line) for line in handle]
+
         with open(count_file) as handle:
             return {
                 'attempt_count': int(handle.read()),
                 'returncode': proc.returncode,
                 'log_wptreport': log_wptreport,
+                'log_raw': log_raw,
+                'argv': argv,
+                'includes': includes,
                 'stdout': stdout,
                 'stderr': stderr
             }
@@ -69,6 +87,7 @@ class RunAndVerify(unittest.TestCase):
         self.assertNotEquals(result['returncode'], 0, result['stdout'])
 
         self.assertFalse(os.path.isfile(result['log_wptreport']))
+        self.assertFalse(os.path.isfile(result['log_wptreport'] + '.summary'))
 
     def test_perfect(self):
         result = self.run_and_verify('complete', 1)
@@ -141,3 +160,250 @@ class RunAndVerify(unittest.TestCase):
 
         self.assert_success(result)
         self.assertEquals(result['attempt_count'], 2)
+
+    def test_missing_retry_only_missing(self):
+        wpt_args = ['--', '--this-chunk', '2', '--total-chunks=3', 'firefox']
+        result = self.run_and_verify('missing-retry', 2, wpt_args)
+
+        self.assert_success(result)
+        self.assertEquals(result['attempt_count'], 2)
+        self.assertEquals(result['argv'][0][-4:],
+                          ['--this-chunk', '2', '--total-chunks=3', 'firefox'])
+        self.assertEquals(result['argv'][1][-3:],
+                          ['firefox', '--include-file',
+                           result['log_wptreport'] + '.include'])
+        self.assertEquals(result['includes'], [['/another-fake-test.html']])
+        self.assertFalse(
+            os.path.exists(result['log_wptreport'] + '.include')
+        )
+        self.assertNotIn('--this-chunk', result['argv'][1])
+        self.assertNotIn('--total-chunks=3', result['argv'][1])
+
+        with open(result['log_wptreport']) as handle:
+            report = json.load(handle)
+
+        self.assertEquals(report['time_start'], 10)
+        self.assertEquals(report['time_end'], 40)
+        self.assertEquals(
+            sorted((r['test'], r['status']) for r in report['results']),
+            [('/a-fake-test.html', 'OK'),
+             ('/a-third-fake-test.html', 'ERROR'),
+             ('/another-fake-test.html', 'TIMEOUT')]
+        )
+
+        with open(result['log_raw']) as handle:
+            self.assertEquals(len(handle.readlines()), 2)
+
+    def test_missing_retry_fail(self):
+        result = self.run_and_verify('missing-retry', 1)
+
+        self.assert_failure(result)
+        self.assertEquals(result['attempt_count'], 1)
+
+    def test_stall_resume(self):
+        wpt_args = ['--', '--this-chunk', '1', '--total-chunks', '3']
+        result = self.run_and_verify('stall-resume', 2,
+                                     ['--stall-timeout', '1'] + wpt_args)
+
+        self.assert_success(result)
+        self.assertEquals(result['attempt_count'], 2)
+        self.assertIn('Terminating the WPT CLI', result['stderr'])
+        self.assertIn('Completed 1 of 3 tests', result['stderr'])
+        self.assertEquals(result['argv'][1][-2:],
+                          ['--include-file',
+                           result['log_wptreport'] + '.include'])
+        self.assertEquals(result['includes'],
+                          [['/a-third-fake-test.html',
+                            '/another-fake-test.html']])
+
+        with open(result['log_wptreport']) as handle:
+            report = json.load(handle)
+
+        self.assertEquals(report['run_info'], {'product': 'firefox'})
+        self.assertEquals(report['time_start'], 1000)
+        self.assertEquals(report['time_end'], 3000)
+        self.assertEquals(
+            sorted(report['results'], key=lambda result: result['test']),
+            [
+                {
+                    'test': '/a-fake-test.html',
+                    'status': 'OK',
+                    'message': None,
+                    'subtests': [{
+                        'name': 'first',
+                        'status': 'FAIL',
+                        'expected': 'PASS',
+                        'message': 'bad'
+                    }]
+                },
+                {
+                    'test': '/a-third-fake-test.html',
+                    'status': 'ERROR',
+                    'subtests': []
+                },
+                {
+                    'test': '/another-fake-test.html',
+                    'status': 'OK',
+                    'subtests': []
+                }
+            ]
+        )
+
+    def test_stall_fail(self):
+        result = self.run_and_verify('stall-resume', 1,
+                                     ['--stall-timeout', '1'])
+
+        self.assert_failure(result)
+        self.assertEquals(result['attempt_count'], 1)
+
+    def test_chunk_plan_empty_chunk(self):
+        chunk_plan = self.temp_file('chunk-plan.json')
+
+        with open(chunk_plan, 'w') as handle:
+            json.dump({
+                'total_chunks': 2,
+                'remainder': 2,
+                'chunks': [
+                    {'duration': 0, 'tests': []},
+                    {'duration': 2000, 'tests': ['/dom/']}
+                ]
+            }, handle)
+
+        result = self.run_and_verify('complete', 1, [
+            '--chunk-plan', chunk_plan, '--', '--this-chunk', '1',
+            '--total-chunks', '2'
+        ])
+
+        self.assert_success(result)
+        self.assertEquals(result['argv'][-1][-4:],
+                          ['--this-chunk', '1', '--total-chunks', '2'])
+
+    def test_stall_after_start(self):
+        # Time spent preparing the test suite is not considered a stall.
+        result = self.run_and_verify('slow-start', 1,
+                                     ['--stall-timeout', '1'])
+
+        self.assert_success(result)
+        self.assertNotIn('Terminating the WPT CLI', result['stderr'])
+
+    def test_startup_timeout(self):
+        result = self.run_and_verify('slow-start', 1,
+                                     ['--stall-timeout', '1',
+                                      '--startup-timeout', '1'])
+
+        self.assert_failure(result)
+        self.assertIn('The test suite did not start in 1.0 seconds',
+                      result['stderr'])
+
+    def test_output_batched(self):
+        result = self.run_and_verify('noisy-output', 1)
+
+        self.assert_success(result)
+        self.assertIn('wpt-run:stdout Output line 299', result['stderr'])
+        self.assertNotIn('lines omitted', result['stderr'])
+        # Output is relayed in batches rather than one message per line.
+        self.assertLess(result['stderr'].count(' INFO '), 50)
+
+    def test_output_sample(self):
+        result = self.run_and_verify('noisy-output', 1,
+                                     ['--output-sample', '100',
+                                      '--output-history', '5'])
+        lines = result['stderr'].splitlines()
+
+        self.assert_success(result)
+        self.assertIn('wpt-run:stdout Output line 100', lines)
+        self.assertNotIn('wpt-run:stdout Output line 101', lines)
+        self.assertIn('wpt-run: 297 lines omitted', lines)
+        # Lines which describe errors are always relayed, and the final lines
+        # are repeated because the CLI exited with an error.
+        self.assertEquals(lines.count('wpt-run:stdout TEST-UNEXPECTED-FAIL | '
+                                      '/a-third-fake-test.html | ERROR'), 2)
+        self.assertIn('Last 5 lines of wpt-run output', result['stderr'])
+        self.assertEquals(lines.count('wpt-run:stdout Output line 299'), 1)
+
+    def test_output_rate_limit(self):
+        result = self.run_and_verify('noisy-output', 1,
+                                     ['--output-rate-limit', '10'])
+
+        self.assert_success(result)
+        self.assertIn('lines omitted', result['stderr'])
+        self.assertIn('Last 301 lines of wpt-run output', result['stderr'])
+
+    def test_summary(self):
+        result = self.run_and_verify('missing-complete', 2)
+
+        self.assert_success(result)
+
+        with open(result['log_wptreport']) as handle:
+            text = handle.read()
+
+        with open(result['log_wptreport'] + '.summary') as handle:
+            summary = json.load(handle)
+
+        self.assertEquals(summary['size'], len(text))
+        self.assertEquals(summary['sha256'], hashlib.sha256(text).hexdigest())
+        self.assertEquals(summary['tests'],
+                          [result['test']
+                           for result in json.loads(text)['results']])
+        self.assertEquals(summary['total'], 3)
+        self.assertEquals(summary['statuses'], {'OK': 2, 'ERROR': 1})
+
+    def test_durations(self):
+        log_durations = self.temp_file('durations.json')
+        result = self.run_and_verify('stall-resume', 2,
+                                     ['--stall-timeout', '1',
+                                      '--log-durations', log_durations])
+
+        self.assert_success(result)
+
+        with open(log_durations) as handle:
+            durations = json.load(handle)
+
+        self.assertEquals(durations, {
+            'tests': {'/a-fake-test.html': [2, 'OK']},
+            'directories': {'/': [2, 1]}
+        })
+
+    def test_chunk_plan(self):
+        chunk_plan = self.temp_file('chunk-plan.json')
+
+        with open(chunk_plan, 'w') as handle:
+            json.dump({
+                'total_chunks': 2,
+                'remainder': 2,
+                'chunks': [
+                    {'duration': 3000, 'tests': ['/css/', '/dom/a.html']},
+                    {'duration': 2000, 'tests': ['/dom/b.html']}
+                ]
+            }, handle)
+
+        wpt_args = ['--chunk-plan', chunk_plan, '--', '--this-chunk', '1',
+                    '--total-chunks', '2']
+        result = self.run_and_verify('complete', 1, wpt_args)
+
+        self.assert_success(result)
+        self.assertNotIn('--this-chunk', result['argv'][-1])
+        self.assertEquals(result['argv'][-1][-2:],
+                          ['--include-file', chunk_plan + '.include'])
+
+        with open(chunk_plan + '.include') as handle:
+            self.assertEquals(handle.read(), '/css/\n/dom/a.html\n')
+
+        wpt_args[-3] = '2'
+        result = self.run_and_verify('complete', 1, wpt_args)
+
+        self.assert_success(result)
+        self.assertNotIn('--include-file', result['argv'][-1])
+        self.assertEquals(result['argv'][-1][-2:],
+                          ['--include-manifest', chunk_plan + '.include'])
+
+        with open(chunk_plan + '.include') as handle:
+            self.assertEquals(handle.read(), '\n'.join([
+                'skip: false',
+                '[css]',
+                '  skip: true',
+                '[dom]',
+                '  [a.html]',
+                '    skip: true',
+                ''
+            ]))
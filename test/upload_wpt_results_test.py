@@ -8,6 +8,7 @@ import json
 import os
 import shutil
 import subprocess
+import sys
 import tempfile
 import threading
 import unittest
@@ -17,6 +18,13 @@ here = os.path.dirname(os.path.abspath(__file__))
 upload_bin = os.path.sep.join(
     [here, '..', 'src', 'scripts', 'upload-wpt-results.py']
 )
+fold_bin = os.path.sep.join(
+    [here, '..', 'src', 'scripts', 'fold-wpt-results.py']
+)
+sys.path.insert(0, os.path.sep.join([here, '..', 'src', 'scripts']))
+
+import report_summary  # noqa: E402
+
 default_run_info = {
     u'product': u'firefox',
     u'bits': 64,
@@ -56,7 +64,12 @@ class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
             'payload': body
         })
 
-        self.send_response(self.server.status_code)
+        if self.server.status_codes:
+            status_code = self.server.status_codes.pop(0)
+        else:
+            status_code = self.server.status_code
+
+        self.send_response(status_code)
         self.send_header('Content-type', 'text/html')
         self.end_headers()
 
@@ -102,6 +115,7 @@ class TestUploadWptResults(unittest.TestCase):
     def setUp(self):
         self.temp_dir = tempfile.mkdtemp()
         self.server = None
+        self.servers = []
 
     def tearDown(self):
         try:
@@ -109,17 +123,25 @@ class TestUploadWptResults(unittest.TestCase):
         except OSError:
             pass
 
-        if self.server:
-            self.server.shutdown()
-            self.server.server_close()
-            self.server_thread.join()
+        for server, thread in self.servers:
+            server.shutdown()
+            server.server_close()
+            thread.join()
 
     def upload(self, product, browser_channel, browser_version, os_name,
                os_version, results_dir, results, port, override_platform,
-               total_chunks, git_branch, no_timestamps=False):
+               total_chunks, git_branch, no_timestamps=False,
+               extra_args=()):
+        '''Invoke the script under test. `port` may be a list in order to
+        upload to more than one server.'''
+        ports = port if isinstance(port, list) else [port]
+
         for filename in results:
             with open(os.path.join(results_dir, filename), 'w') as handle:
-                json.dump(results[filename], handle)
+                if isinstance(results[filename], str):
+                    handle.write(results[filename])
+                else:
+                    json.dump(results[filename], handle)
 
         cmd = [
             upload_bin, '--raw-results-directory', results_dir,
@@ -128,15 +150,17 @@ class TestUploadWptResults(unittest.TestCase):
             '--browser-version', browser_version,
             '--os', os_name,
             '--os-version', os_version,
-            '--url', 'http://localhost:%s' % port,
             '--user-name', 'fake-name',
             '--secret', 'fake-secret',
             '--override-platform', override_platform,
             '--total-chunks', str(total_chunks),
             '--git-branch', git_branch
         ]
+        for port in ports:
+            cmd.extend(['--url', 'http://localhost:%s' % port])
         if no_timestamps:
             cmd.append('--no-timestamps')
+        cmd.extend(extra_args)
 
         proc = subprocess.Popen(
             cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -144,6 +168,23 @@ class TestUploadWptResults(unittest.TestCase):
 
         return (proc.returncode, stdout, stderr)
 
+    def fold(self, directory, results_dir, results, extra_args=()):
+        '''Write the given results files and fold each of them (in order of
+        iteration) into the partially consolidated report in `directory`.'''
+        for filename, data in results:
+            raw_results_file = os.path.join(results_dir, filename)
+
+            with open(raw_results_file, 'w') as handle:
+                json.dump(data, handle)
+
+            cmd = [fold_bin, '--directory', directory, raw_results_file]
+            cmd.extend(extra_args)
+            proc = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = proc.communicate()
+
+            self.assertEqual(proc.returncode, 0, stderr)
+
     def assertBasicAuth(self, authorization, name, password):
         parts = authorization.split(' ')
         self.assertEqual(len(parts), 2)
@@ -163,18 +204,26 @@ class TestUploadWptResults(unittest.TestCase):
         self.assertItemsEqual(actual_results, expected_results)
 
     def start_server(self, port):
-        self.server = BaseHTTPServer.HTTPServer(('', port), Handler)
-        self.server.status_code = 201
-        self.server.requests = []
+        server = BaseHTTPServer.HTTPServer(('', port), Handler)
+        server.status_code = 201
+        # Status codes to use for the initial requests (before falling back
+        # to `status_code`)
+        server.status_codes = []
+        server.requests = []
 
         def target(server):
             server.serve_forever()
 
-        self.server_thread = threading.Thread(
-            target=target, args=(self.server,)
-        )
+        thread = threading.Thread(target=target, args=(server,))
 
-        self.server_thread.start()
+        thread.start()
+
+        self.servers.append((server, thread))
+
+        if self.server is None:
+            self.server = server
+
+        return server
 
     def test_basic(self):
         self.start_server(9801)
@@ -408,11 +457,68 @@ class TestUploadWptResults(unittest.TestCase):
                                                  port=9804,
                                                  override_platform='false',
                                                  total_chunks=2,
-                                                 git_branch='master')
+                                                 git_branch='master',
+                                                 extra_args=[
+                                                     '--max-attempts', '3',
+                                                     '--retry-delay', '0'
+                                                 ])
+
+        self.assertNotEqual(returncode, 0, stdout)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_failed_request_client_error(self):
+        self.start_server(9804)
+        self.server.status_code = 400
+        returncode, stdout, stderr = self.upload('chrome',
+                                                 'stable',
+                                                 '4.3.2',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 make_results(),
+                                                 port=9804,
+                                                 override_platform='false',
+                                                 total_chunks=2,
+                                                 git_branch='master',
+                                                 extra_args=[
+                                                     '--max-attempts', '3',
+                                                     '--retry-delay', '0'
+                                                 ])
 
         self.assertNotEqual(returncode, 0, stdout)
         self.assertEqual(len(self.server.requests), 1)
 
+    def test_retry_recover(self):
+        self.start_server(9804)
+        self.server.status_codes = [500, 503]
+        returncode, stdout, stderr = self.upload('chrome',
+                                                 'stable',
+                                                 '4.3.2',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 make_results(),
+                                                 port=9804,
+                                                 override_platform='false',
+                                                 total_chunks=2,
+                                                 git_branch='master',
+                                                 extra_args=[
+                                                     '--max-attempts', '3',
+                                                     '--retry-delay', '0'
+                                                 ])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        requests = self.server.requests
+
+        self.assertEqual(len(requests), 3)
+
+        for request in requests:
+            self.assertEqual(request['payload']['result_file'],
+                             requests[0]['payload']['result_file'])
+            self.assertEqual(request['payload']['labels'],
+                             requests[0]['payload']['labels'])
+
     def test_no_server(self):
         returncode, stdout, stderr = self.upload('chrome',
                                                  'stable',
@@ -424,7 +530,11 @@ class TestUploadWptResults(unittest.TestCase):
                                                  port=9802,
                                                  override_platform='false',
                                                  total_chunks=2,
-                                                 git_branch='master')
+                                                 git_branch='master',
+                                                 extra_args=[
+                                                     '--max-attempts', '2',
+                                                     '--retry-delay', '0'
+                                                 ])
 
         self.assertNotEqual(returncode, 0, stdout)
 
@@ -530,6 +640,735 @@ class TestUploadWptResults(unittest.TestCase):
             ]
         })
 
+    def test_consolidation_modes(self):
+        results = make_results()
+        results['1_of_2.json']['results'][0]['message'] = u'\u2603 ' * 50000
+        results['3_of_3.json'] = (
+            '{ "run_info" :%s,"results" : [ ] ,\n'
+            '"time_start": 1, "time_end": 1}' % (
+                json.dumps(default_run_info)
+            )
+        )
+        payloads = {}
+        self.start_server(9801)
+
+        for mode in ('load', 'stream', 'splice'):
+            extra_args = ['--consolidation-mode', mode]
+            returncode, stdout, stderr = self.upload('firefox',
+                                                     'stable',
+                                                     '2.0',
+                                                     'linux',
+                                                     '4.0',
+                                                     self.temp_dir,
+                                                     results,
+                                                     9801,
+                                                     override_platform='true',
+                                                     total_chunks=3,
+                                                     git_branch='master',
+                                                     extra_args=extra_args)
+
+            self.assertEqual(returncode, 0, stderr)
+            payloads[mode] = self.server.requests[-1]['payload']['result_file']
+
+        self.assertEqual(payloads['load'], payloads['stream'])
+        self.assertEqual(json.loads(payloads['load']),
+                         json.loads(payloads['splice']))
+
+    def test_consolidation_mode_invalid(self):
+        self.start_server(9801)
+        results = make_results()
+        results['2_of_2.json'] = json.dumps(results['2_of_2.json'])[:-20]
+
+        for mode in ('load', 'stream', 'splice'):
+            extra_args = ['--consolidation-mode', mode]
+            returncode, stdout, stderr = self.upload('firefox',
+                                                     'stable',
+                                                     '2.0',
+                                                     'linux',
+                                                     '4.0',
+                                                     self.temp_dir,
+                                                     results,
+                                                     9801,
+                                                     override_platform='false',
+                                                     total_chunks=2,
+                                                     git_branch='master',
+                                                     extra_args=extra_args)
+
+            self.assertNotEqual(returncode, 0, stdout)
+            self.assertEqual(len(self.server.requests), 0)
+
+    def test_jobs(self):
+        self.start_server(9801)
+        results = {}
+        expected_tests = []
+
+        for index in range(1, 13):
+            test_name = u'/js/chunk-%s.html' % index
+            expected_tests.append(test_name)
+            results['%s_of_12.json' % index] = {
+                'time_start': index,
+                'time_end': index * 10,
+                'run_info': dict(default_run_info),
+                'results': [
+                    {'test': test_name, 'status': 'OK', 'subtests': []}
+                ]
+            }
+
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 results,
+                                                 9801,
+                                                 override_platform='false',
+                                                 total_chunks=12,
+                                                 git_branch='master',
+                                                 extra_args=['--jobs', '3'])
+
+        self.assertEqual(returncode, 0, stderr)
+
+        report = json.loads(
+            self.server.requests[0]['payload']['result_file']
+        )
+
+        self.assertEqual(
+            [result['test'] for result in report['results']], expected_tests
+        )
+        self.assertEqual(report['time_start'], 1)
+        self.assertEqual(report['time_end'], 120)
+
+    def test_multiple_receivers(self):
+        production = self.start_server(9801)
+        staging = self.start_server(9803)
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 make_results(),
+                                                 [9801, 9803],
+                                                 override_platform='false',
+                                                 total_chunks=2,
+                                                 git_branch='master')
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertEqual(len(production.requests), 1)
+        self.assertEqual(len(staging.requests), 1)
+        self.assertEqual(production.requests[0]['payload'],
+                         staging.requests[0]['payload'])
+
+    def test_multiple_receivers_partial_failure(self):
+        production = self.start_server(9801)
+        staging = self.start_server(9803)
+        staging.status_code = 500
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 make_results(),
+                                                 [9801, 9803],
+                                                 override_platform='false',
+                                                 total_chunks=2,
+                                                 git_branch='master',
+                                                 extra_args=[
+                                                     '--retry-delay', '0'
+                                                 ])
+
+        self.assertNotEqual(returncode, 0, stdout)
+        self.assertEqual(len(production.requests), 1)
+        self.assertEqual(len(staging.requests), 5)
+        self.assertIn('http://localhost:9803', stderr.splitlines()[-1])
+        self.assertNotIn('http://localhost:9801', stderr.splitlines()[-1])
+
+    def test_receipts_directory(self):
+        production = self.start_server(9801)
+        staging = self.start_server(9803)
+        staging.status_codes = [500]
+        results_dir = os.path.join(self.temp_dir, 'results')
+        receipts_dir = os.path.join(self.temp_dir, 'receipts')
+        os.mkdir(results_dir)
+        args = dict(override_platform='false',
+                    total_chunks=2,
+                    git_branch='master',
+                    extra_args=['--max-attempts', '1',
+                                '--receipts-directory', receipts_dir])
+
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 results_dir,
+                                                 make_results(),
+                                                 [9801, 9803],
+                                                 **args)
+
+        self.assertNotEqual(returncode, 0, stdout)
+        self.assertEqual(len(production.requests), 1)
+        self.assertEqual(len(staging.requests), 1)
+
+        # Only the receiver which failed is sent the results again.
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 results_dir,
+                                                 make_results(),
+                                                 [9801, 9803],
+                                                 **args)
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertEqual(len(production.requests), 1)
+        self.assertEqual(len(staging.requests), 2)
+
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 results_dir,
+                                                 make_results(),
+                                                 [9801, 9803],
+                                                 **args)
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertEqual(len(production.requests), 1)
+        self.assertEqual(len(staging.requests), 2)
+
+    def test_compression_threads(self):
+        self.start_server(9801)
+        results = make_results()
+        # Ensure the report is large enough to be compressed in multiple
+        # blocks.
+        for index in range(3):
+            results['1_of_2.json']['results'].append({
+                'test': '/js/large-%s.html' % index,
+                'status': 'OK',
+                'message': ('%s' % index) * (1024 * 1024),
+                'subtests': []
+            })
+        extra_args = ['--compression-threads', '3', '--compression-level', '1']
+
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 results,
+                                                 9801,
+                                                 override_platform='false',
+                                                 total_chunks=2,
+                                                 git_branch='master',
+                                                 extra_args=extra_args)
+
+        self.assertEqual(returncode, 0, stderr)
+
+        expected = dict(results['1_of_2.json'])
+        expected['results'] = (results['1_of_2.json']['results'] +
+                               results['2_of_2.json']['results'])
+        self.assertReport(self.server.requests[0]['payload']['result_file'],
+                          expected)
+
+    def upload_folded(self, consolidated_dir, results_dir, extra_args=()):
+        '''Upload the results files which have already been written to
+        `results_dir`.'''
+        extra_args = (['--consolidated-directory', consolidated_dir] +
+                      list(extra_args))
+
+        return self.upload('firefox',
+                           'stable',
+                           '2.0',
+                           'linux',
+                           '4.0',
+                           results_dir,
+                           {},
+                           9801,
+                           override_platform='true',
+                           total_chunks=2,
+                           git_branch='master',
+                           extra_args=extra_args)
+
+    def expected_folded_report(self, results):
+        run_info = dict(default_run_info)
+        run_info.update({
+            u'product': u'firefox',
+            u'browser_version': u'2.0',
+            u'os': u'linux',
+            u'os_version': u'4.0'
+        })
+
+        return {
+            u'time_start': 1,
+            u'time_end': 1,
+            u'run_info': run_info,
+            u'results': (results['1_of_2.json']['results'] +
+                         results['2_of_2.json']['results'])
+        }
+
+    def test_consolidated_directory(self):
+        self.start_server(9801)
+        results = make_results()
+        results_dir = os.path.join(self.temp_dir, 'results')
+        consolidated_dir = os.path.join(self.temp_dir, 'consolidated')
+        os.mkdir(results_dir)
+
+        # Results files may be folded in any order.
+        for mode in ('splice', 'load'):
+            shutil.rmtree(consolidated_dir, ignore_errors=True)
+            self.fold(consolidated_dir,
+                      results_dir,
+                      [('2_of_2.json', results['2_of_2.json']),
+                       ('1_of_2.json', results['1_of_2.json'])],
+                      extra_args=['--consolidation-mode', mode])
+            returncode, stdout, stderr = self.upload_folded(consolidated_dir,
+                                                            results_dir)
+
+            self.assertEqual(returncode, 0, stderr)
+            self.assertIn('Using partially consolidated report', stderr)
+            self.assertReport(
+                self.server.requests[-1]['payload']['result_file'],
+                self.expected_folded_report(results)
+            )
+
+    def test_consolidated_directory_order(self):
+        self.start_server(9801)
+        results = make_results()
+        results_dir = os.path.join(self.temp_dir, 'results')
+        consolidated_dir = os.path.join(self.temp_dir, 'consolidated')
+        os.mkdir(results_dir)
+        self.fold(consolidated_dir,
+                  results_dir,
+                  [('2_of_2.json', results['2_of_2.json']),
+                   ('1_of_2.json', results['1_of_2.json'])])
+
+        returncode, stdout, stderr = self.upload_folded(consolidated_dir,
+                                                        results_dir)
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertIn('Using partially consolidated report', stderr)
+        # The results appear in order of chunk index, as they would if the
+        # results files had been consolidated directly.
+        report = json.loads(
+            self.server.requests[0]['payload']['result_file']
+        )
+        self.assertEqual(report['results'],
+                         results['1_of_2.json']['results'] +
+                         results['2_of_2.json']['results'])
+
+    def test_consolidated_directory_compression_level(self):
+        self.start_server(9801)
+        results = make_results()
+        results_dir = os.path.join(self.temp_dir, 'results')
+        consolidated_dir = os.path.join(self.temp_dir, 'consolidated')
+        os.mkdir(results_dir)
+        self.fold(consolidated_dir,
+                  results_dir,
+                  [('1_of_2.json', results['1_of_2.json']),
+                   ('2_of_2.json', results['2_of_2.json'])],
+                  extra_args=['--compression-level', '1'])
+
+        returncode, stdout, stderr = self.upload_folded(consolidated_dir,
+                                                        results_dir)
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertNotIn('Using partially consolidated report', stderr)
+
+        returncode, stdout, stderr = self.upload_folded(
+            consolidated_dir, results_dir,
+            extra_args=['--compression-level', '1']
+        )
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertIn('Using partially consolidated report', stderr)
+        self.assertReport(self.server.requests[1]['payload']['result_file'],
+                          self.expected_folded_report(results))
+
+    def test_consolidated_directory_incomplete(self):
+        self.start_server(9801)
+        results = make_results()
+        results_dir = os.path.join(self.temp_dir, 'results')
+        consolidated_dir = os.path.join(self.temp_dir, 'consolidated')
+        os.mkdir(results_dir)
+        self.fold(consolidated_dir,
+                  results_dir,
+                  [('1_of_2.json', results['1_of_2.json'])])
+        with open(os.path.join(results_dir, '2_of_2.json'), 'w') as handle:
+            json.dump(results['2_of_2.json'], handle)
+
+        returncode, stdout, stderr = self.upload_folded(
+            consolidated_dir, results_dir,
+            extra_args=['--duplicate-policy', 'keep-first']
+        )
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertNotIn('Using partially consolidated report', stderr)
+        self.assertReport(self.server.requests[0]['payload']['result_file'],
+                          self.expected_folded_report(results))
+
+    def test_consolidated_directory_changed(self):
+        self.start_server(9801)
+        results = make_results()
+        results_dir = os.path.join(self.temp_dir, 'results')
+        consolidated_dir = os.path.join(self.temp_dir, 'consolidated')
+        os.mkdir(results_dir)
+        self.fold(consolidated_dir,
+                  results_dir,
+                  [('1_of_2.json', results['1_of_2.json']),
+                   ('2_of_2.json', results['2_of_2.json'])])
+        # Simulate a chunk which is re-run after its results have been folded.
+        results['2_of_2.json']['results'][0]['status'] = 'ERROR'
+        self.fold(consolidated_dir,
+                  results_dir,
+                  [('2_of_2.json', results['2_of_2.json'])])
+
+        returncode, stdout, stderr = self.upload_folded(
+            consolidated_dir, results_dir,
+            extra_args=['--duplicate-policy', 'keep-first']
+        )
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertNotIn('Using partially consolidated report', stderr)
+        self.assertReport(self.server.requests[0]['payload']['result_file'],
+                          self.expected_folded_report(results))
+
+    def test_consolidated_directory_interrupted(self):
+        self.start_server(9801)
+        results = make_results()
+        results_dir = os.path.join(self.temp_dir, 'results')
+        consolidated_dir = os.path.join(self.temp_dir, 'consolidated')
+        os.mkdir(results_dir)
+        self.fold(consolidated_dir,
+                  results_dir,
+                  [('1_of_2.json', results['1_of_2.json'])])
+        # Simulate a process which was interrupted after writing compressed
+        # data but before updating the journal.
+        body_file = os.path.join(consolidated_dir, 'results.deflate')
+        with open(body_file, 'a') as handle:
+            handle.write('\x00garbage' * 100)
+        self.fold(consolidated_dir,
+                  results_dir,
+                  [('2_of_2.json', results['2_of_2.json'])])
+
+        returncode, stdout, stderr = self.upload_folded(consolidated_dir,
+                                                        results_dir)
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertIn('Using partially consolidated report', stderr)
+        self.assertReport(self.server.requests[0]['payload']['result_file'],
+                          self.expected_folded_report(results))
+
+    def test_duplicate_policy(self):
+        self.start_server(9801)
+        results = make_results()
+        # A test which is reported by both chunks...
+        results['2_of_2.json']['results'].append({
+            'test': '/js/bitwise-or.html',
+            'status': 'ERROR',
+            'subtests': []
+        })
+        # ...and a test which is reported twice by the same chunk.
+        results['2_of_2.json']['results'].append({
+            'test': '/js/bitwise-or-2.html',
+            'status': 'TIMEOUT',
+            'subtests': []
+        })
+        expected = {
+            'keep-first': [
+                (u'/js/bitwise-or.html', u'OK'),
+                (u'/js/bitwise-and.html', u'OK'),
+                (u'/js/bitwise-or-2.html', u'OK')
+            ],
+            'keep-last': [
+                (u'/js/bitwise-and.html', u'OK'),
+                (u'/js/bitwise-or.html', u'ERROR'),
+                (u'/js/bitwise-or-2.html', u'TIMEOUT')
+            ]
+        }
+
+        for mode in ('load', 'stream', 'splice'):
+            for jobs in ('1', '2'):
+                for policy in ('keep-first', 'keep-last'):
+                    extra_args = ['--consolidation-mode', mode,
+                                  '--jobs', jobs,
+                                  '--duplicate-policy', policy]
+                    returncode, stdout, stderr = self.upload(
+                        'firefox',
+                        'stable',
+                        '2.0',
+                        'linux',
+                        '4.0',
+                        self.temp_dir,
+                        results,
+                        9801,
+                        override_platform='false',
+                        total_chunks=2,
+                        git_branch='master',
+                        extra_args=extra_args
+                    )
+
+                    self.assertEqual(returncode, 0, stderr)
+
+                    report = json.loads(
+                        self.server.requests[-1]['payload']['result_file']
+                    )
+
+                    self.assertEqual(
+                        [(result['test'], result['status'])
+                         for result in report['results']],
+                        expected[policy]
+                    )
+
+    def test_duplicate_policy_fail(self):
+        self.start_server(9801)
+        results = make_results()
+        results['2_of_2.json']['results'].append({
+            'test': '/js/bitwise-and.html',
+            'status': 'OK',
+            'subtests': []
+        })
+
+        # Duplicate results are rejected by default.
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 results,
+                                                 9801,
+                                                 override_platform='false',
+                                                 total_chunks=2,
+                                                 git_branch='master')
+
+        self.assertNotEqual(returncode, 0, stdout)
+        self.assertIn('/js/bitwise-and.html', stderr)
+        self.assertEqual(len(self.server.requests), 0)
+
+    def test_consolidated_directory_duplicates(self):
+        self.start_server(9801)
+        results = make_results()
+        results['2_of_2.json']['results'].append({
+            'test': '/js/bitwise-and.html',
+            'status': 'OK',
+            'subtests': []
+        })
+        results_dir = os.path.join(self.temp_dir, 'results')
+        consolidated_dir = os.path.join(self.temp_dir, 'consolidated')
+        os.mkdir(results_dir)
+        self.fold(consolidated_dir,
+                  results_dir,
+                  [('1_of_2.json', results['1_of_2.json']),
+                   ('2_of_2.json', results['2_of_2.json'])])
+
+        returncode, stdout, stderr = self.upload_folded(
+            consolidated_dir, results_dir,
+            extra_args=['--duplicate-policy', 'keep-first']
+        )
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertNotIn('Using partially consolidated report', stderr)
+
+        report = json.loads(self.server.requests[0]['payload']['result_file'])
+
+        self.assertEqual(
+            sorted(result['test'] for result in report['results']),
+            [u'/js/bitwise-and.html', u'/js/bitwise-or-2.html',
+             u'/js/bitwise-or.html']
+        )
+
+    def test_sort_results(self):
+        self.start_server(9801)
+        results = make_results()
+        results['2_of_2.json']['results'].append({
+            'test': u'/js/\u2603.html',
+            'status': 'OK',
+            'subtests': []
+        })
+        results['2_of_2.json']['results'].append({
+            'test': '/css/a.html',
+            'status': 'OK',
+            'subtests': []
+        })
+        expected_tests = [
+            u'/css/a.html',
+            u'/js/bitwise-and.html',
+            u'/js/bitwise-or-2.html',
+            u'/js/bitwise-or.html',
+            u'/js/\u2603.html'
+        ]
+        payloads = []
+
+        for mode in ('load', 'stream', 'splice'):
+            # A buffer size of zero causes every result to be written to a
+            # separate run.
+            for jobs, buffer_size in (('1', '64'), ('2', '0')):
+                extra_args = ['--consolidation-mode', mode,
+                              '--jobs', jobs,
+                              '--sort-results',
+                              '--sort-buffer-size', buffer_size]
+                returncode, stdout, stderr = self.upload(
+                    'firefox',
+                    'stable',
+                    '2.0',
+                    'linux',
+                    '4.0',
+                    self.temp_dir,
+                    results,
+                    9801,
+                    override_platform='false',
+                    total_chunks=2,
+                    git_branch='master',
+                    extra_args=extra_args
+                )
+
+                self.assertEqual(returncode, 0, stderr)
+
+                payload = self.server.requests[-1]['payload']['result_file']
+                report = json.loads(payload)
+                payloads.append(payload)
+
+                self.assertEqual(
+                    [result['test'] for result in report['results']],
+                    expected_tests
+                )
+                self.assertEqual(report['run_info'], default_run_info)
+
+        # The output of each mode does not depend on the parameters used to
+        # sort the results.
+        for index in range(0, len(payloads), 2):
+            self.assertEqual(payloads[index], payloads[index + 1])
+
+    def test_summaries(self):
+        self.start_server(9801)
+        results = make_results()
+        results['2_of_2.json']['results'].append({
+            'test': '/js/bitwise-or.html',
+            'status': 'ERROR',
+            'subtests': []
+        })
+
+        for filename, data in results.items():
+            raw_results_file = os.path.join(self.temp_dir, filename)
+            text = json.dumps(data)
+
+            with open(raw_results_file, 'w') as handle:
+                handle.write(text)
+
+            report_summary.write(raw_results_file,
+                                 report_summary.summarize(data, text))
+
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 {},
+                                                 9801,
+                                                 override_platform='false',
+                                                 total_chunks=2,
+                                                 git_branch='master',
+                                                 extra_args=[
+                                                     '--duplicate-policy',
+                                                     'keep-last'
+                                                 ])
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertIn('Found summaries of all results files (4 results)',
+                      stderr)
+
+        report = json.loads(self.server.requests[-1]['payload']['result_file'])
+
+        self.assertEqual(
+            [(result['test'], result['status'])
+             for result in report['results']],
+            [(u'/js/bitwise-and.html', u'OK'),
+             (u'/js/bitwise-or-2.html', u'OK'),
+             (u'/js/bitwise-or.html', u'ERROR')]
+        )
+
+    def test_summaries_stale(self):
+        self.start_server(9801)
+        results = make_results()
+
+        for filename, data in results.items():
+            raw_results_file = os.path.join(self.temp_dir, filename)
+            text = json.dumps(data)
+
+            with open(raw_results_file, 'w') as handle:
+                handle.write(text)
+
+            report_summary.write(raw_results_file,
+                                 report_summary.summarize(data, text))
+
+        # A results file which has changed since it was summarized.
+        results['2_of_2.json']['results'].append({
+            'test': '/js/bitwise-or.html',
+            'status': 'ERROR',
+            'subtests': []
+        })
+
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 results,
+                                                 9801,
+                                                 override_platform='false',
+                                                 total_chunks=2,
+                                                 git_branch='master',
+                                                 extra_args=[
+                                                     '--duplicate-policy',
+                                                     'fail'
+                                                 ])
+
+        self.assertNotEqual(returncode, 0, stdout)
+        self.assertIn('Summaries unavailable for 1 results files', stderr)
+        self.assertIn('/js/bitwise-or.html', stderr)
+
+    def test_summaries_modified(self):
+        self.start_server(9801)
+        results = make_results()
+
+        for filename, data in results.items():
+            raw_results_file = os.path.join(self.temp_dir, filename)
+            text = json.dumps(data)
+
+            report_summary.write(raw_results_file,
+                                 report_summary.summarize(data, text))
+
+            # A results file which has changed since it was summarized, but
+            # whose size has not.
+            if filename == '2_of_2.json':
+                text = text.replace('"OK"', '"NO"')
+
+            with open(raw_results_file, 'w') as handle:
+                handle.write(text)
+
+        returncode, stdout, stderr = self.upload('firefox',
+                                                 'stable',
+                                                 '2.0',
+                                                 'linux',
+                                                 '4.0',
+                                                 self.temp_dir,
+                                                 {},
+                                                 9801,
+                                                 override_platform='false',
+                                                 total_chunks=2,
+                                                 git_branch='master')
+
+        self.assertEqual(returncode, 0, stderr)
+        self.assertIn('Summaries unavailable for 1 results files', stderr)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,125 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+health_bin = os.path.sep.join(
+    [here, '..', 'src', 'scripts', 'worker-health.py']
+)
+
+
+class TestWorkerHealth(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.state_dir = os.path.join(self.temp_dir, 'health')
+        self.stamp = os.path.join(self.temp_dir, 'shutdown.stamp')
+        self.processes = []
+
+    def tearDown(self):
+        for proc in self.processes:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+        shutil.rmtree(self.temp_dir)
+
+    def check(self, *args):
+        proc = subprocess.Popen(
+            [health_bin, '--state-dir', self.state_dir,
+             '--shutdown-stamp', self.stamp, '--disk-path', self.temp_dir,
+             '--min-memory', '0', '--min-disk', '0'] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = proc.communicate()
+
+        self.assertEqual(proc.returncode, 0, stderr)
+
+        return stderr
+
+    def read_state(self):
+        with open(os.path.join(self.state_dir, 'health.json')) as handle:
+            return json.load(handle)
+
+    def read_reboots(self):
+        with open(os.path.join(self.state_dir, 'reboots.jsonl')) as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_healthy(self):
+        self.check('--process-names', '--ports')
+        self.check('--process-names', '--ports')
+
+        self.assertFalse(os.path.exists(self.stamp))
+        self.assertEqual(self.read_state(),
+                         {'builds': 2, 'reboots': 0, 'reasons': {}})
+
+    def test_max_builds(self):
+        for _ in range(3):
+            self.check('--process-names', '--ports', '--max-builds', '2')
+
+        self.assertTrue(os.path.exists(self.stamp))
+        self.assertEqual(self.read_state(),
+                         {'builds': 1, 'reboots': 1, 'reasons': {'builds': 1}})
+
+        reboots = self.read_reboots()
+
+        self.assertEqual(len(reboots), 1)
+        self.assertEqual(reboots[0]['reasons'], ['builds'])
+        self.assertEqual(reboots[0]['builds'], 2)
+
+    def test_low_disk(self):
+        self.check('--process-names', '--ports', '--min-disk', '1000000000')
+
+        self.assertTrue(os.path.exists(self.stamp))
+        self.assertEqual(self.read_state()['reasons'], {'disk': 1})
+
+    def test_leaked_process(self):
+        # A copy of `sleep` with a distinctive name stands in for a leaked
+        # browser process.
+        binary = os.path.join(self.temp_dir, 'leaked-browser')
+        shutil.copy(subprocess.check_output(['which', 'sleep']).strip(),
+                    binary)
+        proc = subprocess.Popen([binary, '600'])
+        self.processes.append(proc)
+
+        stderr = self.check('--process-names', 'leaked-browser', '--ports')
+
+        self.assertIn('Killing 1 leaked processes', stderr)
+        self.assertIsNotNone(proc.poll())
+        self.assertFalse(os.path.exists(self.stamp))
+
+    def test_bound_port(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        proc = subprocess.Popen([
+            sys.executable, '-c',
+            'import socket, time\n'
+            's = socket.socket()\n'
+            's.bind(("127.0.0.1", %s))\n'
+            's.listen(1)\n'
+            'print "ready"\n'
+            'import sys; sys.stdout.flush()\n'
+            'time.sleep(600)\n' % port
+        ], stdout=subprocess.PIPE)
+        self.processes.append(proc)
+        proc.stdout.readline()
+
+        stderr = self.check('--process-names', '--ports', str(port))
+
+        self.assertIn('Killing processes bound to port %s' % port, stderr)
+        self.assertIsNotNone(proc.poll())
+        self.assertFalse(os.path.exists(self.stamp))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# Copyright 2018 The WPT Dashboard Project. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+checkout_bin = os.path.sep.join(
+    [here, '..', 'src', 'scripts', 'wpt-checkout.py']
+)
+
+
+def git(cwd, *args):
+    return subprocess.check_output(
+        ['git', '-c', 'user.name=wpt', '-c', 'user.email=wpt@example.com'] +
+        list(args),
+        cwd=cwd
+    ).strip()
+
+
+class TestWptCheckout(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.upstream = os.path.join(self.temp_dir, 'upstream')
+        self.mirror = os.path.join(self.temp_dir, 'mirror.git')
+        self.revisions = []
+
+        os.mkdir(self.upstream)
+        git(self.upstream, 'init')
+
+        for index in range(3):
+            with open(os.path.join(self.upstream, 'file.txt'), 'w') as f:
+                f.write(str(index))
+
+            git(self.upstream, 'add', 'file.txt')
+            git(self.upstream, 'commit', '--message', str(index))
+            git(self.upstream, 'tag', 'merge_pr_%s' % index)
+            self.revisions.append(git(self.upstream, 'rev-parse', 'HEAD'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def checkout(self, revision, directory, *args):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        proc = subprocess.Popen(
+            [checkout_bin, '--mirror', self.mirror,
+             '--remote', 'file://' + self.upstream,
+             '--revision', revision] + list(args) + [directory],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = proc.communicate()
+
+        self.assertEqual(proc.returncode, 0, stderr)
+
+        return stderr
+
+    def test_checkout(self):
+        directory = os.path.join(self.temp_dir, 'build')
+        stderr = self.checkout(self.revisions[1], directory)
+
+        self.assertIn('Fetching revision', stderr)
+        self.assertEqual(git(directory, 'rev-parse', 'HEAD'),
+                         self.revisions[1])
+        self.assertEqual(git(directory, 'tag', '--points-at', 'HEAD'),
+                         'merge_pr_1')
+
+        with open(os.path.join(directory, 'file.txt')) as f:
+            self.assertEqual(f.read(), '1')
+
+    def test_fetch_once(self):
+        first = os.path.join(self.temp_dir, 'a', 'build')
+        second = os.path.join(self.temp_dir, 'b', 'build')
+
+        self.checkout(self.revisions[2], first)
+        stderr = self.checkout(self.revisions[2], second)
+
+        self.assertNotIn('Fetching revision', stderr)
+        self.assertIn('present in the mirror', stderr)
+        self.assertEqual(git(second, 'rev-parse', 'HEAD'), self.revisions[2])
+
+    def test_reuse_cleared_directory(self):
+        directory = os.path.join(self.temp_dir, 'build')
+
+        self.checkout(self.revisions[0], directory)
+        shutil.rmtree(directory)
+        self.checkout(self.revisions[2], directory)
+
+        self.assertEqual(git(directory, 'rev-parse', 'HEAD'),
+                         self.revisions[2])
+
+    def test_keep_revisions(self):
+        # Checking out a revision again makes it the most recent.
+        revisions = [self.revisions[1], self.revisions[0], self.revisions[2],
+                     self.revisions[1]]
+
+        directory = os.path.join(self.temp_dir, 'build')
+
+        for revision in revisions:
+            # The build directory is cleared after every build.
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+
+            self.checkout(revision, directory, '--keep-revisions', '2')
+
+        refs = git(self.upstream, '--git-dir', self.mirror, 'for-each-ref',
+                   '--format=%(objectname)', 'refs/revisions/').split()
+        tags = git(self.upstream, '--git-dir', self.mirror, 'tag').split()
+
+        self.assertEqual(sorted(refs), sorted(self.revisions[1:]))
+        self.assertEqual(tags, ['merge_pr_1', 'merge_pr_2'])
+        # The objects of the removed revision are pruned.
+        self.assertNotEqual(subprocess.call(
+            ['git', '--git-dir', self.mirror, 'cat-file', '-e',
+             '%s^{commit}' % self.revisions[0]]
+        ), 0)
+
+    def test_fetch_own_tags(self):
+        directory = os.path.join(self.temp_dir, 'build')
+        self.checkout(self.revisions[0], directory)
+
+        tags = git(self.upstream, '--git-dir', self.mirror, 'tag').split()
+
+        self.assertEqual(tags, ['merge_pr_0'])
+
+
+if __name__ == '__main__':
+    unittest.main()